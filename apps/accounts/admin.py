@@ -2,12 +2,15 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
-from .models import User, Role, UserRole, LoginAttempt
+from .models import User, Role, UserRole, LoginAttempt, LoginAttemptDailyRollup
+from .permissions import invalidate_users
+from .retention import retention_days
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
     list_display = ('email', 'get_full_name', 'tenant', 'is_active', 
                    'is_tenant_admin', 'last_login', 'date_joined')
+    list_select_related = ('tenant',)
     list_filter = ('is_active', 'is_tenant_admin', 'tenant', 'date_joined', 
                   'two_factor_enabled')
     search_fields = ('email', 'first_name', 'last_name', 'tenant__name')
@@ -65,6 +68,7 @@ class UserAdmin(BaseUserAdmin):
 @admin.register(Role)
 class RoleAdmin(admin.ModelAdmin):
     list_display = ('name', 'tenant', 'description', 'created_at')
+    list_select_related = ('tenant',)
     list_filter = ('tenant', 'created_at')
     search_fields = ('name', 'description', 'tenant__name')
     
@@ -93,6 +97,7 @@ class RoleAdmin(admin.ModelAdmin):
 class UserRoleAdmin(admin.ModelAdmin):
     list_display = ('user', 'role', 'assigned_by', 'assigned_at', 'expires_at', 
                    'is_active')
+    list_select_related = ('user', 'role__tenant', 'assigned_by')
     list_filter = ('is_active', 'assigned_at', 'expires_at')
     search_fields = ('user__email', 'role__name', 'assigned_by__email')
     raw_id_fields = ('user', 'role', 'assigned_by')
@@ -100,11 +105,17 @@ class UserRoleAdmin(admin.ModelAdmin):
     actions = ['activate_roles', 'deactivate_roles']
 
     def activate_roles(self, request, queryset):
+        # Read first: a changelist filtered on is_active matches none after
+        user_ids = list(queryset.values_list('user_id', flat=True))
         queryset.update(is_active=True)
+        invalidate_users(user_ids)
     activate_roles.short_description = _("Activate selected role assignments")
 
     def deactivate_roles(self, request, queryset):
+        # Read first: a changelist filtered on is_active matches none after
+        user_ids = list(queryset.values_list('user_id', flat=True))
         queryset.update(is_active=False)
+        invalidate_users(user_ids)
     deactivate_roles.short_description = _("Deactivate selected role assignments")
 
 @admin.register(LoginAttempt)
@@ -123,7 +134,20 @@ class LoginAttemptAdmin(admin.ModelAdmin):
         return False
 
     def has_delete_permission(self, request, obj=None):
-        # Only allow deleting records older than 90 days
+        # Only allow deleting records past the retention period
         if obj:
-            return (timezone.now() - obj.created_at).days > 90
+            return (timezone.now() - obj.created_at).days > retention_days()
         return True
+
+@admin.register(LoginAttemptDailyRollup)
+class LoginAttemptDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ('date', 'tenant_id', 'ip_address', 'successful_count', 'failed_count')
+    list_filter = ('date',)
+    search_fields = ('ip_address', 'tenant_id')
+    date_hierarchy = 'date'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,295 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_ipv46_address
+from django.db import DataError, IntegrityError, connections, transaction
+from django.db.models import Case, DateTimeField, GenericIPAddressField, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django_redis import get_redis_connection
+from .models import User, LoginAttempt
+import atexit
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = 'accounts:login_audit:queue'
+# Events the database rejected, as {"event": ..., "error": ...}
+DEAD_LETTER_KEY = 'accounts:login_audit:dead'
+# Stored for attempts whose address is missing or not an IP, e.g. a
+# spoofed X-Forwarded-For; ip_address is not nullable
+UNKNOWN_IP = '0.0.0.0'
+# Errors that mean the event itself is bad; anything else (the database
+# being down) is worth retrying
+REJECTED_ERRORS = (DataError, IntegrityError, ValidationError, ValueError, TypeError)
+
+def flush_size():
+    return getattr(settings, 'LOGIN_AUDIT_FLUSH_SIZE', 200)
+
+def flush_interval():
+    return getattr(settings, 'LOGIN_AUDIT_FLUSH_INTERVAL', 5)
+
+def dead_letter_size():
+    return getattr(settings, 'LOGIN_AUDIT_DEAD_LETTER_SIZE', 1000)
+
+def clean_ip(value):
+    """
+    ``value`` if it is an IPv4 or IPv6 address, else UNKNOWN_IP.
+    """
+    value = (value or '').strip()
+    try:
+        validate_ipv46_address(value)
+    except ValidationError:
+        return UNKNOWN_IP
+    return value
+
+def login_event(email, ip_address, user_agent, successful, user=None, failure_reason='',
+                tenant_id=None):
+    """
+    A JSON-serialisable record of one login attempt.
+    """
+    if user is not None and user.tenant_id:
+        tenant_id = user.tenant_id
+    return {
+        'user_id': str(user.pk) if user is not None else None,
+        'tenant_id': str(tenant_id) if tenant_id else None,
+        'email': (email or '')[:LoginAttempt._meta.get_field('email').max_length],
+        'ip_address': clean_ip(ip_address),
+        'user_agent': user_agent or '',
+        'successful': successful,
+        'failure_reason': (failure_reason or '')[:LoginAttempt._meta.get_field('failure_reason').max_length],
+        'occurred_at': timezone.now().isoformat(),
+    }
+
+def write_events(events):
+    """
+    Insert the LoginAttempt rows for a list of events with one bulk INSERT
+    and refresh last_login, last_login_ip and last_active of the users that
+    logged in with one UPDATE, using each user's most recent successful login.
+    """
+    if not events:
+        return
+    LoginAttempt.objects.bulk_create(
+        [
+            LoginAttempt(
+                user_id=event['user_id'],
+                tenant_id=event.get('tenant_id'),
+                email=event['email'],
+                ip_address=event['ip_address'],
+                user_agent=event['user_agent'],
+                successful=event['successful'],
+                failure_reason=event['failure_reason'],
+                # The attempt time, however long the event sat in a buffer
+                created_at=parse_datetime(event['occurred_at']),
+            )
+            for event in events
+        ],
+        batch_size=flush_size(),
+    )
+
+    latest = {}
+    for event in events:
+        if event['successful'] and event['user_id']:
+            occurred_at = parse_datetime(event['occurred_at'])
+            if event['user_id'] not in latest or latest[event['user_id']][1] < occurred_at:
+                latest[event['user_id']] = (event['ip_address'], occurred_at)
+    if not latest:
+        return
+    logged_in_at = Case(
+        *[When(pk=pk, then=Value(at)) for pk, (_ip, at) in latest.items()],
+        output_field=DateTimeField(),
+    )
+    User.objects.filter(pk__in=list(latest)).update(
+        last_login=logged_in_at,
+        last_active=logged_in_at,
+        last_login_ip=Case(
+            *[When(pk=pk, then=Value(ip)) for pk, (ip, _at) in latest.items()],
+            output_field=GenericIPAddressField(),
+        ),
+    )
+
+def write_batch(events, dead_letter):
+    """
+    write_events(events), falling back to one event at a time when the
+    database rejects the batch, so one bad event cannot hold up the rest;
+    each rejected event goes to ``dead_letter(event, error)``.
+
+    Events are removed from ``events`` as they are written or dead-lettered,
+    so when any other error is raised ``events`` holds what is left to retry.
+    Returns the number written.
+    """
+    try:
+        with transaction.atomic():
+            write_events(events)
+    except REJECTED_ERRORS:
+        logger.warning('Login audit batch of %d rejected, writing events one by one', len(events))
+    else:
+        written = len(events)
+        events.clear()
+        return written
+    written = 0
+    while events:
+        try:
+            with transaction.atomic():
+                write_events(events[:1])
+        except REJECTED_ERRORS as e:
+            dead_letter(events[0], f'{type(e).__name__}: {e}'[:500])
+        else:
+            written += 1
+        del events[0]
+    return written
+
+class SyncAuditBuffer:
+    """
+    Writes every event as soon as it is recorded. Used in tests and when
+    neither buffering backend is wanted.
+    """
+
+    def add(self, event):
+        write_batch([event], _log_dead_letter)
+
+    def flush(self):
+        return 0
+
+def _log_dead_letter(event, error):
+    logger.error('Dropped login audit event %s: %s', event, error)
+
+class MemoryAuditBuffer:
+    """
+    Collects events in the current process and writes them once
+    LOGIN_AUDIT_FLUSH_SIZE events are waiting or LOGIN_AUDIT_FLUSH_INTERVAL
+    seconds after the first one, whichever comes first. Events still
+    buffered when the process exits are written by an atexit hook. Events
+    the database rejects are kept in ``dead_letters`` (the last
+    LOGIN_AUDIT_DEAD_LETTER_SIZE of them).
+    """
+
+    def __init__(self):
+        self._events = []
+        self._lock = threading.Lock()
+        self._timer = None
+        self.dead_letters = []
+        atexit.register(self.flush)
+
+    def _schedule(self):
+        # Called with the lock held
+        if self._timer is None:
+            self._timer = threading.Timer(flush_interval(), self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def add(self, event):
+        with self._lock:
+            self._events.append(event)
+            full = len(self._events) >= flush_size()
+            if not full:
+                self._schedule()
+        if full:
+            self.flush()
+
+    def _dead_letter(self, event, error):
+        _log_dead_letter(event, error)
+        with self._lock:
+            self.dead_letters.append({'event': event, 'error': error})
+            del self.dead_letters[:-dead_letter_size()]
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            # The timer thread opened its own connection; don't leak it
+            connections.close_all()
+
+    def flush(self):
+        with self._lock:
+            events, self._events = self._events, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        total = len(events)
+        try:
+            return write_batch(events, self._dead_letter)
+        except Exception:
+            # Keep what is left for the next flush
+            logger.exception('Could not write %d of %d login audit events', len(events), total)
+            with self._lock:
+                self._events[:0] = events
+                self._schedule()
+            return total - len(events)
+
+class RedisAuditBuffer:
+    """
+    Collects events in a Redis list shared by all processes. A Celery task
+    writes them once LOGIN_AUDIT_FLUSH_SIZE events are queued or
+    LOGIN_AUDIT_FLUSH_INTERVAL seconds after the first one. Events the
+    database rejects move to the DEAD_LETTER_KEY list.
+    """
+
+    def add(self, event):
+        from .tasks import flush_login_audit
+
+        length = get_redis_connection('default').rpush(QUEUE_KEY, json.dumps(event))
+        if length % flush_size() == 0:
+            flush_login_audit.delay()
+        elif length == 1:
+            flush_login_audit.apply_async(countdown=flush_interval())
+
+    def flush(self):
+        conn = get_redis_connection('default')
+        written = 0
+        while True:
+            with conn.pipeline() as pipe:
+                pipe.lrange(QUEUE_KEY, 0, flush_size() - 1)
+                pipe.ltrim(QUEUE_KEY, flush_size(), -1)
+                raw_events, _trimmed = pipe.execute()
+            if not raw_events:
+                return written
+            events = [json.loads(raw) for raw in raw_events]
+            try:
+                written += write_batch(events, lambda event, error: self._dead_letter(conn, event, error))
+            except Exception:
+                # Put back what was not written so the next flush retries it
+                if events:
+                    conn.lpush(QUEUE_KEY, *[json.dumps(event) for event in reversed(events)])
+                raise
+
+    def _dead_letter(self, conn, event, error):
+        _log_dead_letter(event, error)
+        with conn.pipeline() as pipe:
+            pipe.rpush(DEAD_LETTER_KEY, json.dumps({'event': event, 'error': error}))
+            pipe.ltrim(DEAD_LETTER_KEY, -dead_letter_size(), -1)
+            pipe.execute()
+
+AUDIT_BACKENDS = {
+    'sync': SyncAuditBuffer,
+    'memory': MemoryAuditBuffer,
+    'redis': RedisAuditBuffer,
+}
+
+_buffers = {}
+_buffers_lock = threading.Lock()
+
+def get_audit_buffer():
+    """
+    The buffer for the LOGIN_AUDIT_BACKEND setting: sync, memory or redis.
+    """
+    backend = getattr(settings, 'LOGIN_AUDIT_BACKEND', 'sync')
+    with _buffers_lock:
+        if backend not in _buffers:
+            _buffers[backend] = AUDIT_BACKENDS[backend]()
+        return _buffers[backend]
+
+def record_login_attempt(email, ip_address, user_agent, successful, user=None, failure_reason='',
+                         tenant_id=None):
+    """
+    Queue a login attempt for writing by the configured audit buffer.
+    """
+    event = login_event(email, ip_address, user_agent, successful, user, failure_reason, tenant_id)
+    get_audit_buffer().add(event)
+
+def flush():
+    """
+    Write everything the configured buffer holds. Returns the event count.
+    """
+    return get_audit_buffer().flush()
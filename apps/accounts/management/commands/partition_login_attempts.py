@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+from apps.accounts import partitioning
+from apps.accounts.models import LoginAttempt
+
+class Command(BaseCommand):
+    help = ('Convert the login attempt table into one partitioned by month '
+            '(PostgreSQL only). Prints the SQL unless --execute is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--execute', action='store_true',
+            help='Run the conversion instead of printing it.',
+        )
+        parser.add_argument(
+            '--months-ahead', type=int, default=2,
+            help='Future monthly partitions to create up front.',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Partitioning is only supported on PostgreSQL.')
+        if partitioning.is_partitioned():
+            self.stdout.write('The login attempt table is already partitioned.')
+            return
+
+        first = LoginAttempt.objects.aggregate(first=Min('created_at'))['first']
+        month = partitioning.month_start(first or timezone.now())
+        last = partitioning.month_start(timezone.now())
+        for _ in range(options['months_ahead']):
+            last = partitioning.next_month(last)
+        months = []
+        while month <= last:
+            months.append(month)
+            month = partitioning.next_month(month)
+
+        statements = partitioning.convert_to_partitioned_sql(months)
+        if not options['execute']:
+            for statement in statements:
+                self.stdout.write(f'{statement};')
+            return
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+        self.stdout.write(self.style.SUCCESS(
+            f'Partitioned the login attempt table into {len(months)} monthly partitions.'
+        ))
@@ -1,8 +1,9 @@
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import RegexValidator
-from apps.core.models import TimeStampedModel, Tenant
+from apps.core.models import DirtyFieldsMixin, TimeStampedModel, Tenant
 import uuid
 
 class UserManager(BaseUserManager):
@@ -38,7 +39,7 @@ class UserManager(BaseUserManager):
 
         return self._create_user(email, password, **extra_fields)
 
-class User(AbstractUser, TimeStampedModel):
+class User(DirtyFieldsMixin, AbstractUser, TimeStampedModel):
     """Custom User model for multi-tenant SaaS CRM."""
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -162,6 +163,9 @@ class UserRole(TimeStampedModel):
     class Meta:
         unique_together = ('user', 'role')
         ordering = ['-assigned_at']
+        indexes = [
+            models.Index(fields=['is_active', 'expires_at'], name='accounts_userrole_expiry_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.email} - {self.role.name}"
@@ -177,15 +181,47 @@ class LoginAttempt(TimeStampedModel):
         related_name='login_attempts',
         null=True
     )
+    # Not a foreign key, so expired rows can go with their partition; failed
+    # attempts take the tenant of the host they were made on
+    tenant_id = models.UUIDField(null=True, blank=True)
     email = models.EmailField()  # Store email even for failed attempts
     ip_address = models.GenericIPAddressField()
     user_agent = models.TextField()
     successful = models.BooleanField(default=False)
     failure_reason = models.CharField(max_length=100, blank=True)
+    # When the attempt was made, not when the audit buffer wrote it
+    created_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='accounts_login_user_idx'),
+            models.Index(fields=['email', '-created_at'], name='accounts_login_email_idx'),
+            models.Index(fields=['ip_address', '-created_at'], name='accounts_login_ip_idx'),
+            models.Index(fields=['created_at'], name='accounts_login_created_idx'),
+        ]
 
     def __str__(self):
         status = 'successful' if self.successful else 'failed'
         return f"{self.email} - {status} login from {self.ip_address}"
+
+class LoginAttemptDailyRollup(models.Model):
+    """
+    Login attempt counts per day, tenant and IP address. Kept after the
+    attempts themselves have passed LOGIN_ATTEMPT_RETENTION_DAYS.
+    """
+    date = models.DateField()
+    tenant_id = models.UUIDField(null=True, blank=True)
+    ip_address = models.GenericIPAddressField()
+    successful_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-date']
+        indexes = [
+            models.Index(fields=['date', 'tenant_id'], name='accounts_rollup_date_idx'),
+            models.Index(fields=['ip_address', '-date'], name='accounts_rollup_ip_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.ip_address}: {self.successful_count} ok, {self.failed_count} failed"
@@ -0,0 +1,133 @@
+from datetime import date, datetime, time, timezone as dt_timezone
+from django.db import connection
+from django.utils import timezone
+from .models import LoginAttempt
+import re
+
+PARTITION_SUFFIX = re.compile(r'_p(\d{4})(\d{2})$')
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+def next_month(value):
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y%m}'
+
+def _bound(month):
+    return datetime.combine(month, time.min, tzinfo=dt_timezone.utc).isoformat()
+
+def is_partitioned(table=None):
+    """
+    Whether ``table`` (the LoginAttempt table by default) is a PostgreSQL
+    partitioned table. Always False on other databases.
+    """
+    if connection.vendor != 'postgresql':
+        return False
+    table = table or LoginAttempt._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid '
+            'WHERE c.relname = %s', [table]
+        )
+        return cursor.fetchone() is not None
+
+def list_partitions(table=None):
+    """
+    Return {month: partition name} for the monthly partitions of ``table``.
+    """
+    table = table or LoginAttempt._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits i '
+            'JOIN pg_class parent ON parent.oid = i.inhparent '
+            'JOIN pg_class child ON child.oid = i.inhrelid '
+            'WHERE parent.relname = %s', [table]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        match = PARTITION_SUFFIX.search(name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+def create_partition_sql(table, month):
+    qn = connection.ops.quote_name
+    return (
+        f'CREATE TABLE IF NOT EXISTS {qn(partition_name(table, month))} '
+        f'PARTITION OF {qn(table)} '
+        f"FOR VALUES FROM ('{_bound(month)}') TO ('{_bound(next_month(month))}')"
+    )
+
+def ensure_partitions(months_ahead=2, table=None):
+    """
+    Create the partitions for the current month and ``months_ahead`` months
+    after it. Returns the names of the partitions that were missing.
+    """
+    table = table or LoginAttempt._meta.db_table
+    existing = list_partitions(table)
+    month = month_start(timezone.now())
+    created = []
+    with connection.cursor() as cursor:
+        for _ in range(months_ahead + 1):
+            if month not in existing:
+                cursor.execute(create_partition_sql(table, month))
+                created.append(partition_name(table, month))
+            month = next_month(month)
+    return created
+
+def drop_partitions_before(cutoff, table=None):
+    """
+    Drop every partition whose whole month lies before ``cutoff``. Returns
+    the names of the dropped partitions.
+    """
+    table = table or LoginAttempt._meta.db_table
+    qn = connection.ops.quote_name
+    dropped = []
+    with connection.cursor() as cursor:
+        for month, name in sorted(list_partitions(table).items()):
+            if next_month(month) <= cutoff.date():
+                cursor.execute(f'DROP TABLE IF EXISTS {qn(name)}')
+                dropped.append(name)
+    return dropped
+
+def convert_to_partitioned_sql(months):
+    """
+    The statements that turn the plain LoginAttempt table into one
+    partitioned by month on created_at, with a partition for each of
+    ``months`` (which must cover every existing row) and the rows copied
+    across. The primary key becomes (id, created_at) because PostgreSQL
+    requires it to include the partition key.
+    """
+    opts = LoginAttempt._meta
+    table = opts.db_table
+    legacy = f'{table}_legacy'
+    qn = connection.ops.quote_name
+    statements = [
+        f'ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}',
+        f'CREATE TABLE {qn(table)} (LIKE {qn(legacy)} INCLUDING DEFAULTS) '
+        f'PARTITION BY RANGE ({qn(opts.get_field("created_at").column)})',
+    ]
+    statements.extend(create_partition_sql(table, month) for month in months)
+    statements.append(f'INSERT INTO {qn(table)} SELECT * FROM {qn(legacy)}')
+    # Indexes are built once the rows are in, under their original names
+    statements.append(f'DROP TABLE {qn(legacy)}')
+    statements.append(
+        f'ALTER TABLE {qn(table)} ADD PRIMARY KEY '
+        f'({qn(opts.pk.column)}, {qn(opts.get_field("created_at").column)})'
+    )
+    user_field = opts.get_field('user')
+    statements.append(
+        f'ALTER TABLE {qn(table)} ADD FOREIGN KEY ({qn(user_field.column)}) '
+        f'REFERENCES {qn(user_field.related_model._meta.db_table)} '
+        f'({qn(user_field.target_field.column)}) DEFERRABLE INITIALLY DEFERRED'
+    )
+    for index in opts.indexes:
+        columns = ', '.join(
+            qn(opts.get_field(name.lstrip('-')).column) + (' DESC' if name.startswith('-') else '')
+            for name in index.fields
+        )
+        statements.append(f'CREATE INDEX {qn(index.name)} ON {qn(table)} ({columns})')
+    return statements
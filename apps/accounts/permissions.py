@@ -0,0 +1,237 @@
+from django.conf import settings
+from django.contrib.auth.backends import BaseBackend
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import UserRole
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Role flags in bit order. Append new flags at the end so cached masks
+# keep their meaning.
+ROLE_PERMISSION_FIELDS = (
+    'can_manage_users',
+    'can_manage_roles',
+    'can_manage_clients',
+    'can_manage_projects',
+    'can_manage_invoices',
+    'can_manage_expenses',
+    'can_manage_settings',
+)
+PERMISSION_BITS = {name: 1 << index for index, name in enumerate(ROLE_PERMISSION_FIELDS)}
+ALL_PERMISSIONS = (1 << len(ROLE_PERMISSION_FIELDS)) - 1
+
+class PermissionSet:
+    """
+    The compiled permissions of a user: role flags OR-ed into ``mask`` and
+    the union of the roles' custom permission keys. Admins pass every role
+    and custom check, but never a Django model permission ("app.codename"),
+    which is left to ModelBackend.
+    """
+    __slots__ = ('mask', 'custom', 'is_admin', 'expires_at')
+
+    def __init__(self, mask=0, custom=frozenset(), is_admin=False, expires_at=None):
+        self.mask = mask
+        self.custom = custom
+        self.is_admin = is_admin
+        self.expires_at = expires_at
+
+    def __repr__(self):
+        return f'<PermissionSet mask={self.mask:#b} custom={sorted(self.custom)}>'
+
+    def has_perm(self, perm):
+        if not is_role_permission(perm):
+            return False
+        if self.is_admin:
+            return True
+        bit = PERMISSION_BITS.get(perm)
+        if bit is not None:
+            return bool(self.mask & bit)
+        return perm in self.custom
+
+    def has_perms(self, perms):
+        return all(self.has_perm(perm) for perm in perms)
+
+    def to_cache(self):
+        return (self.mask, tuple(self.custom), self.is_admin, self.expires_at)
+
+    @classmethod
+    def from_cache(cls, value):
+        mask, custom, is_admin, expires_at = value
+        return cls(mask, frozenset(custom), is_admin, expires_at)
+
+def is_role_permission(perm):
+    """
+    Whether ``perm`` is a Role flag or custom key this module answers for.
+    Anything with an app label belongs to ModelBackend.
+    """
+    return isinstance(perm, str) and '.' not in perm
+
+ADMIN_PERMISSIONS = PermissionSet(ALL_PERMISSIONS, is_admin=True)
+NO_PERMISSIONS = PermissionSet()
+
+def custom_permission_keys(value):
+    """
+    Keys granted by a Role.custom_permissions value: the truthy keys of a
+    dict or the items of a list. Keys with an app label are ignored, so a
+    role cannot grant Django model permissions.
+    """
+    if isinstance(value, dict):
+        keys = {str(key) for key, granted in value.items() if granted}
+    elif isinstance(value, (list, tuple)):
+        keys = {str(key) for key in value}
+    else:
+        return set()
+    return {key for key in keys if is_role_permission(key)}
+
+def compile_permissions(user):
+    """
+    Build the PermissionSet for a user from their active, unexpired roles
+    in their tenant with a single query.
+    """
+    now = timezone.now()
+    rows = UserRole.objects.filter(
+        Q(expires_at__isnull=True) | Q(expires_at__gt=now),
+        user=user,
+        is_active=True,
+        role__tenant_id=user.tenant_id,
+    ).values_list(
+        *[f'role__{field}' for field in ROLE_PERMISSION_FIELDS],
+        'role__custom_permissions',
+        'expires_at',
+    )
+    mask = 0
+    custom = set()
+    expires_at = None
+    for row in rows:
+        flags, custom_permissions, role_expires_at = row[:-2], row[-2], row[-1]
+        for field, granted in zip(ROLE_PERMISSION_FIELDS, flags):
+            if granted:
+                mask |= PERMISSION_BITS[field]
+        custom |= custom_permission_keys(custom_permissions)
+        if role_expires_at and (expires_at is None or role_expires_at < expires_at):
+            expires_at = role_expires_at
+    return PermissionSet(mask, frozenset(custom), expires_at=expires_at)
+
+def _version_key(scope, pk):
+    return f'accounts:perms:version:{scope}:{pk}'
+
+def _initial_version():
+    # Starting from the clock rather than 1 means a version key that was
+    # evicted cannot come back with a number an old cache entry still uses.
+    return int(time.time() * 1000)
+
+def bump_version(scope, pk):
+    """
+    Invalidate cached permissions for a user (scope 'user') or for every
+    user of a tenant (scope 'tenant').
+    """
+    key = _version_key(scope, pk)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version(), None)
+
+def invalidate_users(user_ids):
+    """
+    Drop the cached permissions of each user in ``user_ids``, e.g. after a
+    queryset.update() on their role assignments that sent no signals.
+
+    The versions are bumped once the current transaction commits; bumped
+    earlier, a concurrent request could compile the still-committed old
+    roles and cache them under the new version.
+    """
+    user_ids = set(user_ids)
+
+    def bump():
+        for user_id in user_ids:
+            bump_version('user', user_id)
+    transaction.on_commit(bump)
+
+def invalidate_tenant(tenant_id):
+    """
+    Drop the cached permissions of every user of the tenant, once the
+    current transaction commits.
+    """
+    transaction.on_commit(lambda: bump_version('tenant', tenant_id))
+
+def expire_user_roles(now=None):
+    """
+    Deactivate every active role assignment whose expires_at has passed
+    with one UPDATE, then invalidate each affected user's cached
+    permissions once. Returns the number of assignments deactivated.
+    """
+    now = now or timezone.now()
+    expired = UserRole.objects.filter(is_active=True, expires_at__lte=now)
+    with transaction.atomic():
+        user_ids = set(expired.values_list('user_id', flat=True))
+        if not user_ids:
+            return 0
+        count = expired.update(is_active=False, updated_at=now)
+        invalidate_users(user_ids)
+    logger.info('Deactivated %d expired role assignments for %d users', count, len(user_ids))
+    return count
+
+def _versions(user):
+    keys = [_version_key('user', user.pk), _version_key('tenant', user.tenant_id)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _initial_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+def get_permissions(user):
+    """
+    Return the user's PermissionSet. It is cached under the current user
+    and tenant version stamps until the earliest role expiry, and memoised
+    on the user object for the rest of the request.
+    """
+    permissions = getattr(user, '_permission_set', None)
+    if permissions is not None:
+        return permissions
+
+    if not user.is_active or user.is_anonymous:
+        permissions = NO_PERMISSIONS
+    elif user.is_superuser or user.is_tenant_admin:
+        permissions = ADMIN_PERMISSIONS
+    else:
+        user_version, tenant_version = _versions(user)
+        key = f'accounts:perms:{user.pk}:{user_version}:{tenant_version}'
+        cached = cache.get(key)
+        if cached is not None:
+            permissions = PermissionSet.from_cache(cached)
+        if permissions is None or (
+            permissions.expires_at and permissions.expires_at <= timezone.now()
+        ):
+            permissions = compile_permissions(user)
+            timeout = getattr(settings, 'PERMISSION_CACHE_TIMEOUT', 60 * 60)
+            if permissions.expires_at:
+                remaining = (permissions.expires_at - timezone.now()).total_seconds()
+                timeout = max(min(timeout, int(remaining)), 1)
+            cache.set(key, permissions.to_cache(), timeout)
+
+    user._permission_set = permissions
+    return permissions
+
+def has_role_perm(user, perm):
+    """
+    Whether the user holds ``perm``, a Role flag such as
+    'can_manage_clients' or a custom permission key.
+    """
+    return get_permissions(user).has_perm(perm)
+
+class RolePermissionBackend(BaseBackend):
+    """
+    Authorization backend that answers user.has_perm() for Role flags and
+    custom permission keys, next to ModelBackend's app permissions. It
+    never grants an "app.codename" permission, tenant admin or not.
+    """
+
+    def has_perm(self, user_obj, perm, obj=None):
+        if obj is not None or not is_role_permission(perm):
+            return False
+        return has_role_perm(user_obj, perm)
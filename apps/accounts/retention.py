@@ -0,0 +1,108 @@
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from . import partitioning
+from .models import LoginAttempt, LoginAttemptDailyRollup
+import logging
+
+logger = logging.getLogger(__name__)
+
+def retention_days():
+    return getattr(settings, 'LOGIN_ATTEMPT_RETENTION_DAYS', 90)
+
+def retention_cutoff():
+    return timezone.now() - timedelta(days=retention_days())
+
+def recent_attempts(queryset=None):
+    """
+    Login attempts from the last LOGIN_HISTORY_DAYS days. The created_at
+    bound lets PostgreSQL skip every partition but the recent ones.
+    """
+    if queryset is None:
+        queryset = LoginAttempt.objects.all()
+    since = timezone.now() - timedelta(days=getattr(settings, 'LOGIN_HISTORY_DAYS', 30))
+    return queryset.filter(created_at__gte=since)
+
+def _day_bounds(day):
+    start = datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+    return start, start + timedelta(days=1)
+
+def rollup_day(day):
+    """
+    Replace the rollup rows for one (UTC) day with fresh counts per tenant
+    and IP address. Returns the number of rollup rows written.
+    """
+    start, end = _day_bounds(day)
+    counts = (
+        LoginAttempt.objects.filter(created_at__gte=start, created_at__lt=end)
+        .order_by()
+        .values('tenant_id', 'ip_address')
+        .annotate(
+            successful_count=Count('id', filter=Q(successful=True)),
+            failed_count=Count('id', filter=Q(successful=False)),
+        )
+    )
+    with transaction.atomic():
+        LoginAttemptDailyRollup.objects.filter(date=day).delete()
+        rollups = LoginAttemptDailyRollup.objects.bulk_create(
+            [LoginAttemptDailyRollup(date=day, **row) for row in counts]
+        )
+    return len(rollups)
+
+def rollup_login_attempts():
+    """
+    Roll up every complete day since the last rolled-up day, so each day is
+    counted before its attempts can expire. Returns the days processed.
+    """
+    today = timezone.now().astimezone(dt_timezone.utc).date()
+    last = LoginAttemptDailyRollup.objects.order_by('-date').values_list('date', flat=True).first()
+    if last is not None:
+        day = last + timedelta(days=1)
+    else:
+        first = LoginAttempt.objects.aggregate(first=Min('created_at'))['first']
+        if first is None:
+            return []
+        day = first.astimezone(dt_timezone.utc).date()
+
+    days = []
+    while day < today:
+        rollup_day(day)
+        days.append(day)
+        day += timedelta(days=1)
+    return days
+
+def delete_expired_attempts(cutoff, chunk_size=None):
+    """
+    Delete attempts older than ``cutoff`` in chunks, keeping each DELETE
+    and its locks short. Returns the number of rows deleted.
+    """
+    chunk_size = chunk_size or getattr(settings, 'LOGIN_ATTEMPT_DELETE_CHUNK', 5000)
+    deleted = 0
+    while True:
+        ids = list(
+            LoginAttempt.objects.filter(created_at__lt=cutoff)
+            .order_by('created_at')
+            .values_list('pk', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return deleted
+        deleted += LoginAttempt.objects.filter(pk__in=ids).delete()[0]
+
+def prune_login_attempts():
+    """
+    Roll up finished days, then remove attempts older than
+    LOGIN_ATTEMPT_RETENTION_DAYS: by dropping whole monthly partitions when
+    the table is partitioned, with chunked DELETEs otherwise.
+    """
+    days = rollup_login_attempts()
+    cutoff = retention_cutoff()
+    result = {'rolled_up_days': len(days)}
+    if partitioning.is_partitioned():
+        result['created_partitions'] = partitioning.ensure_partitions()
+        result['dropped_partitions'] = partitioning.drop_partitions_before(cutoff)
+    # With partitions this only touches the month that straddles the cutoff
+    result['deleted'] = delete_expired_attempts(cutoff)
+    logger.info('Pruned login attempts: %s', result)
+    return result
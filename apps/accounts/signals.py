@@ -1,8 +1,11 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
+from django.contrib.auth.models import update_last_login
 from django.contrib.auth.signals import user_logged_in, user_login_failed
-from .models import User, LoginAttempt, UserRole
+from .audit import record_login_attempt
+from .models import User, Role, UserRole
+from .permissions import invalidate_tenant, invalidate_users
 import uuid
 
 @receiver(pre_save, sender=User)
@@ -10,14 +13,18 @@ def handle_password_change(sender, instance, **kwargs):
     """
     Track when a user's password is changed.
     """
-    if instance.pk:  # Only for existing users
-        try:
-            old_user = User.objects.get(pk=instance.pk)
-            if old_user.password != instance.password:
-                instance.password_changed_at = timezone.now()
-                instance.force_password_change = False
-        except User.DoesNotExist:
-            pass
+    update_fields = kwargs.get('update_fields')
+    if instance._state.adding or (update_fields and 'password' not in update_fields):
+        return
+    if instance.tracks_changes:
+        changed = 'password' in instance.changed_fields
+    else:
+        # Instances not loaded from the database have nothing to compare with
+        old_password = User.objects.filter(pk=instance.pk).values_list('password', flat=True).first()
+        changed = old_password is not None and old_password != instance.password
+    if changed:
+        instance.password_changed_at = timezone.now()
+        instance.force_password_change = False
 
 @receiver(post_save, sender=User)
 def create_user_api_key(sender, instance, created, **kwargs):
@@ -28,24 +35,43 @@ def create_user_api_key(sender, instance, created, **kwargs):
         instance.api_key = uuid.uuid4()
         instance.save(update_fields=['api_key'])
 
+# last_login is written by the audit buffer together with last_login_ip, in
+# place of the UPDATE django.contrib.auth issues on every login
+user_logged_in.disconnect(update_last_login, dispatch_uid='update_last_login')
+
+@receiver(post_save, sender=User)
+def invalidate_user_permissions(sender, instance, created, **kwargs):
+    """
+    Moving a user to another tenant changes which of their roles apply.
+    """
+    if not created and 'tenant' in instance.changed_fields:
+        invalidate_users([instance.pk])
+
+@receiver([post_save, post_delete], sender=Role)
+def invalidate_role_permissions(sender, instance, **kwargs):
+    """
+    A role change can affect every user of the tenant holding it.
+    """
+    invalidate_tenant(instance.tenant_id)
+
+@receiver([post_save, post_delete], sender=UserRole)
+def invalidate_assignment_permissions(sender, instance, **kwargs):
+    invalidate_users([instance.user_id])
+
 @receiver(user_logged_in)
 def track_successful_login(sender, request, user, **kwargs):
     """
-    Track successful login attempts.
+    Track successful login attempts. The audit buffer also updates the
+    user's last login time, IP and active timestamp when it flushes.
     """
     if request:
-        LoginAttempt.objects.create(
-            user=user,
+        record_login_attempt(
             email=user.email,
             ip_address=get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', ''),
-            successful=True
+            successful=True,
+            user=user,
         )
-        
-        # Update user's last login IP and active timestamp
-        user.last_login_ip = get_client_ip(request)
-        user.last_active = timezone.now()
-        user.save(update_fields=['last_login_ip', 'last_active'])
 
 @receiver(user_login_failed)
 def track_failed_login(sender, credentials, request, **kwargs):
@@ -53,27 +79,23 @@ def track_failed_login(sender, credentials, request, **kwargs):
     Track failed login attempts.
     """
     if request:
-        LoginAttempt.objects.create(
+        record_login_attempt(
             email=credentials.get('email', ''),
             ip_address=get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', ''),
             successful=False,
-            failure_reason=kwargs.get('error_message', 'Unknown error')
+            failure_reason=kwargs.get('error_message', 'Unknown error'),
+            tenant_id=getattr(getattr(request, 'tenant', None), 'pk', None),
         )
 
-@receiver(post_save, sender=UserRole)
-def handle_role_assignment(sender, instance, created, **kwargs):
+@receiver(pre_save, sender=UserRole)
+def handle_role_assignment(sender, instance, **kwargs):
     """
-    Handle role assignment updates.
+    Deactivate an assignment that is saved after it has expired. Untouched
+    assignments are expired by the expire_user_roles task.
     """
-    if created:
-        # You might want to send notifications or perform other actions
-        # when a role is assigned to a user
-        pass
-    elif instance.expires_at and instance.expires_at <= timezone.now():
-        # Automatically deactivate expired roles
+    if instance.is_active and instance.expires_at and instance.expires_at <= timezone.now():
         instance.is_active = False
-        instance.save(update_fields=['is_active'])
 
 def get_client_ip(request):
     """
@@ -0,0 +1,23 @@
+from celery import shared_task
+from . import audit, permissions, retention
+
+@shared_task(ignore_result=True)
+def flush_login_audit():
+    """
+    Write the login attempts buffered in Redis in bulk.
+    """
+    return audit.flush()
+
+@shared_task(ignore_result=True)
+def prune_login_attempts():
+    """
+    Roll up finished days of login attempts and drop the expired ones.
+    """
+    return retention.prune_login_attempts()
+
+@shared_task(ignore_result=True)
+def expire_user_roles():
+    """
+    Deactivate role assignments past their expiry date.
+    """
+    return permissions.expire_user_roles()
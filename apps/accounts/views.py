@@ -13,20 +13,32 @@ from django.utils.translation import gettext_lazy as _
 from django.http import JsonResponse
 from django.db import transaction
 from rest_framework import generics, permissions
+from common.pagination import KeysetPaginationMixin
 from .models import User, Role, UserRole, LoginAttempt
 from .forms import (
     CustomUserCreationForm, CustomUserChangeForm, 
     RoleForm, UserRoleForm, TwoFactorSetupForm
 )
+from .permissions import has_role_perm
+from .retention import recent_attempts
 from .serializers import UserSerializer, RoleSerializer
 import uuid
 import pyotp
 
 class TenantAdminRequiredMixin(UserPassesTestMixin):
-    """Verify that the current user is a tenant admin."""
-    
+    """
+    Verify that the current user is a tenant admin, or holds
+    ``required_permission`` through one of their roles.
+    """
+    required_permission = None
+
     def test_func(self):
-        return self.request.user.is_authenticated and self.request.user.is_tenant_admin
+        user = self.request.user
+        if not user.is_authenticated:
+            return False
+        if user.is_tenant_admin:
+            return True
+        return bool(self.required_permission) and has_role_perm(user, self.required_permission)
 
 class CustomLoginView(auth_views.LoginView):
     template_name = 'accounts/login.html'
@@ -68,7 +80,7 @@ class ProfileView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['user_roles'] = self.request.user.user_roles.select_related('role').all()
-        context['login_history'] = self.request.user.login_attempts.all()[:5]
+        context['login_history'] = recent_attempts(self.request.user.login_attempts.all())[:5]
         return context
 
 class ProfileEditView(LoginRequiredMixin, SuccessMessageMixin, UpdateView):
@@ -197,6 +209,7 @@ class APIKeyListView(LoginRequiredMixin, ListView):
         return User.objects.filter(id=self.request.user.id)
 
 class UserListView(TenantAdminRequiredMixin, ListView):
+    required_permission = 'can_manage_users'
     model = User
     template_name = 'accounts/user_list.html'
     context_object_name = 'users'
@@ -205,6 +218,7 @@ class UserListView(TenantAdminRequiredMixin, ListView):
         return User.objects.filter(tenant=self.request.user.tenant)
 
 class UserCreateView(TenantAdminRequiredMixin, SuccessMessageMixin, CreateView):
+    required_permission = 'can_manage_users'
     model = User
     form_class = CustomUserCreationForm
     template_name = 'accounts/user_form.html'
@@ -216,6 +230,7 @@ class UserCreateView(TenantAdminRequiredMixin, SuccessMessageMixin, CreateView):
         return super().form_valid(form)
 
 class UserUpdateView(TenantAdminRequiredMixin, SuccessMessageMixin, UpdateView):
+    required_permission = 'can_manage_users'
     model = User
     form_class = CustomUserChangeForm
     template_name = 'accounts/user_form.html'
@@ -226,6 +241,7 @@ class UserUpdateView(TenantAdminRequiredMixin, SuccessMessageMixin, UpdateView):
         return User.objects.filter(tenant=self.request.user.tenant)
 
 class UserDeleteView(TenantAdminRequiredMixin, DeleteView):
+    required_permission = 'can_manage_users'
     model = User
     template_name = 'accounts/user_confirm_delete.html'
     success_url = reverse_lazy('accounts:user_list')
@@ -238,6 +254,7 @@ class UserDeleteView(TenantAdminRequiredMixin, DeleteView):
         return super().delete(request, *args, **kwargs)
 
 class RoleListView(TenantAdminRequiredMixin, ListView):
+    required_permission = 'can_manage_roles'
     model = Role
     template_name = 'accounts/role_list.html'
     context_object_name = 'roles'
@@ -246,6 +263,7 @@ class RoleListView(TenantAdminRequiredMixin, ListView):
         return Role.objects.filter(tenant=self.request.user.tenant)
 
 class RoleCreateView(TenantAdminRequiredMixin, SuccessMessageMixin, CreateView):
+    required_permission = 'can_manage_roles'
     model = Role
     form_class = RoleForm
     template_name = 'accounts/role_form.html'
@@ -257,6 +275,7 @@ class RoleCreateView(TenantAdminRequiredMixin, SuccessMessageMixin, CreateView):
         return super().form_valid(form)
 
 class RoleUpdateView(TenantAdminRequiredMixin, SuccessMessageMixin, UpdateView):
+    required_permission = 'can_manage_roles'
     model = Role
     form_class = RoleForm
     template_name = 'accounts/role_form.html'
@@ -269,6 +288,7 @@ class RoleUpdateView(TenantAdminRequiredMixin, SuccessMessageMixin, UpdateView):
 from .forms import UserInviteForm
 
 class InvitationListView(TenantAdminRequiredMixin, ListView):
+    required_permission = 'can_manage_users'
     template_name = 'accounts/invitation_list.html'
     context_object_name = 'invitations'
 
@@ -276,6 +296,7 @@ class InvitationListView(TenantAdminRequiredMixin, ListView):
         return User.objects.filter(tenant=self.request.user.tenant, is_active=False)
 
 class InvitationCreateView(TenantAdminRequiredMixin, FormView):
+    required_permission = 'can_manage_users'
     template_name = 'accounts/invitation_form.html'
     form_class = UserInviteForm
     success_url = reverse_lazy('accounts:invitation_list')
@@ -306,14 +327,14 @@ class InvitationDeclineView(RedirectView):
         messages.success(request, _("Invitation has been declined."))
         return super().get(request, *args, **kwargs)
 
-class LoginHistoryView(LoginRequiredMixin, ListView):
-    model = User
+class LoginHistoryView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
+    model = LoginAttempt
     template_name = 'accounts/login_history.html'
     context_object_name = 'login_history'
+    keyset_ordering = ('-created_at', 'id')
 
     def get_queryset(self):
-        # Implement logic to fetch login history
-        return User.objects.filter(id=self.request.user.id)
+        return recent_attempts(self.request.user.login_attempts.all())
 
 class UserActivityView(LoginRequiredMixin, ListView):
     model = User
@@ -351,6 +372,7 @@ class SessionListView(LoginRequiredMixin, ListView):
         return User.objects.filter(id=self.request.user.id)
 
 class UserRoleManageView(TenantAdminRequiredMixin, UpdateView):
+    required_permission = 'can_manage_roles'
     model = User
     template_name = 'accounts/user_role_manage.html'
     form_class = UserRoleForm
@@ -372,6 +394,7 @@ class UserRoleManageView(TenantAdminRequiredMixin, UpdateView):
         return super().form_valid(form)
 
 class RoleDeleteView(TenantAdminRequiredMixin, DeleteView):
+    required_permission = 'can_manage_roles'
     model = Role
     template_name = 'accounts/role_confirm_delete.html'
     success_url = reverse_lazy('accounts:role_list')
@@ -1,6 +1,7 @@
 from django.contrib import admin
+from django.db.models import OuterRef, Subquery
 from django.utils.html import format_html
-from .models import Tenant, Domain, TenantSettings
+from .models import Tenant, Domain, TenantSettings, StripeOutbox
 
 class DomainInline(admin.TabularInline):
     model = Domain
@@ -53,10 +54,15 @@ class TenantAdmin(admin.ModelAdmin):
         return "No Logo"
     logo_preview.short_description = 'Logo'
 
+    def get_queryset(self, request):
+        # One subquery instead of a domain lookup per row
+        primary = Domain.objects.filter(tenant=OuterRef('pk'), is_primary=True).values('domain')[:1]
+        return super().get_queryset(request).annotate(primary_domain_name=Subquery(primary))
+
     def primary_domain(self, obj):
-        domain = obj.get_primary_domain()
-        return domain.domain if domain else '-'
+        return obj.primary_domain_name or '-'
     primary_domain.short_description = 'Primary Domain'
+    primary_domain.admin_order_field = 'primary_domain_name'
 
     def save_model(self, request, obj, form, change):
         """
@@ -71,6 +77,7 @@ class TenantAdmin(admin.ModelAdmin):
 class DomainAdmin(admin.ModelAdmin):
     list_display = ('domain', 'tenant', 'is_primary', 'verified', 
                    'verification_method', 'created_at')
+    list_select_related = ('tenant',)
     list_filter = ('is_primary', 'verified', 'verification_method', 'created_at')
     search_fields = ('domain', 'tenant__name')
     readonly_fields = ('created_at', 'updated_at', 'verification_token')
@@ -95,6 +102,7 @@ class DomainAdmin(admin.ModelAdmin):
 class TenantSettingsAdmin(admin.ModelAdmin):
     list_display = ('tenant', 'enable_projects', 'enable_tasks', 
                    'enable_invoicing', 'enable_support', 'force_2fa')
+    list_select_related = ('tenant',)
     list_filter = ('enable_projects', 'enable_tasks', 'enable_invoicing', 
                   'enable_support', 'force_2fa')
     search_fields = ('tenant__name',)
@@ -122,3 +130,16 @@ class TenantSettingsAdmin(admin.ModelAdmin):
     def has_add_permission(self, request):
         # Prevent manual creation as settings are auto-created with tenants
         return False
+
+@admin.register(StripeOutbox)
+class StripeOutboxAdmin(admin.ModelAdmin):
+    list_display = ('tenant_id', 'action', 'status', 'version', 'attempts',
+                   'created_at', 'sent_at')
+    list_filter = ('action', 'status', 'created_at')
+    search_fields = ('tenant_id', 'stripe_customer_id')
+    readonly_fields = ('tenant_id', 'action', 'payload', 'stripe_customer_id',
+                      'version', 'attempts', 'last_error', 'sent_at',
+                      'created_at', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
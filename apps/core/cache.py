@@ -0,0 +1,238 @@
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.http.request import split_domain_port
+from types import MappingProxyType
+import threading
+import time
+
+# Cached in place of a tenant for hosts that do not map to one, so unknown
+# hosts are answered from cache as well.
+NO_TENANT = '__no_tenant__'
+_MISSING = object()
+
+class LocalTTLCache:
+    """
+    A small thread-safe LRU cache whose entries expire after ``ttl`` seconds.
+    Used as a per-process layer in front of the shared Redis cache.
+    """
+
+    def __init__(self, maxsize=1024, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+_local_tenants = LocalTTLCache(
+    maxsize=getattr(settings, 'TENANT_LOCAL_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'TENANT_LOCAL_CACHE_TTL', 30),
+)
+_local_settings = LocalTTLCache(
+    maxsize=getattr(settings, 'TENANT_LOCAL_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'TENANT_LOCAL_CACHE_TTL', 30),
+)
+
+def normalize_host(host):
+    """
+    Lowercase the host and strip the port and any trailing dot.
+    """
+    domain, _port = split_domain_port(host or '')
+    return domain
+
+def tenant_cache_key(host):
+    return f'core:tenant:host:{host}'
+
+def _load_tenant(host):
+    from .models import Domain
+
+    domain = (
+        Domain.objects.select_related('tenant')
+        .filter(domain__iexact=host, tenant__is_active=True)
+        .first()
+    )
+    return domain.tenant if domain else None
+
+def get_tenant_for_host(host):
+    """
+    Resolve a request host to its active Tenant, or None.
+
+    Lookups go through the per-process LRU first, then the shared cache and
+    only then the database, so a request on a hot host costs no queries.
+    """
+    host = normalize_host(host)
+    if not host:
+        return None
+
+    tenant = _local_tenants.get(host, _MISSING)
+    if tenant is not _MISSING:
+        return tenant
+
+    key = tenant_cache_key(host)
+    tenant = cache.get(key, _MISSING)
+    if tenant is _MISSING:
+        tenant = _load_tenant(host)
+        cache.set(
+            key,
+            NO_TENANT if tenant is None else tenant,
+            getattr(settings, 'TENANT_CACHE_TIMEOUT', 3600),
+        )
+    elif isinstance(tenant, str):
+        tenant = None
+
+    _local_tenants.set(host, tenant)
+    return tenant
+
+def invalidate_hosts(hosts):
+    """
+    Drop the cached tenant for each of the given hosts.
+
+    Only the local LRU of the calling process can be cleared; other processes
+    pick up the change once their entry expires (TENANT_LOCAL_CACHE_TTL).
+    """
+    hosts = {normalize_host(host) for host in hosts if host}
+    hosts.discard('')
+    if not hosts:
+        return
+    for host in hosts:
+        _local_tenants.delete(host)
+    cache.delete_many([tenant_cache_key(host) for host in hosts])
+
+def invalidate_tenant(tenant):
+    """
+    Drop the cached tenant for every domain that points at it.
+    """
+    invalidate_hosts(tenant.domains.values_list('domain', flat=True))
+
+# TenantSettings columns that are not settings
+SETTINGS_EXCLUDED_FIELDS = ('id', 'tenant', 'created_at', 'updated_at')
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+class TenantSettingsSnapshot:
+    """
+    A read-only copy of a tenant's TenantSettings, read like the model:
+    ``request.tenant_settings.enable_invoicing``. ``version`` is the row's
+    updated_at in microseconds, or 0 for a tenant without a row, whose
+    snapshot holds the field defaults.
+    """
+    __slots__ = ('tenant_id', 'version', '_values')
+
+    def __init__(self, tenant_id, version, values):
+        object.__setattr__(self, 'tenant_id', tenant_id)
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, '_values', _freeze(values))
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(f"'TenantSettingsSnapshot' object has no attribute '{name}'")
+
+    def __setattr__(self, name, value):
+        raise AttributeError('TenantSettingsSnapshot is read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError('TenantSettingsSnapshot is read-only')
+
+    def __repr__(self):
+        return f'<TenantSettingsSnapshot {self.tenant_id} v{self.version}>'
+
+    def as_dict(self):
+        return dict(self._values)
+
+def tenant_settings_key(tenant_id):
+    return f'core:tenant_settings:{tenant_id}'
+
+def _load_tenant_settings(tenant_id):
+    """
+    (version, values) of the tenant's TenantSettings row, as stored in
+    the shared cache.
+    """
+    from .models import TenantSettings
+
+    fields = [
+        field for field in TenantSettings._meta.concrete_fields
+        if field.name not in SETTINGS_EXCLUDED_FIELDS
+    ]
+    row = (
+        TenantSettings.objects.filter(tenant_id=tenant_id)
+        .values('updated_at', *[field.attname for field in fields])
+        .first()
+    )
+    if row is None:
+        return 0, {field.name: field.get_default() for field in fields}
+    version = int(row['updated_at'].timestamp() * 1000000)
+    return version, {field.name: row[field.attname] for field in fields}
+
+def get_tenant_settings(tenant):
+    """
+    The TenantSettingsSnapshot of ``tenant`` (None for no tenant), from
+    the per-process LRU, then the shared cache, then the database.
+    """
+    if tenant is None:
+        return None
+    snapshot = _local_settings.get(tenant.pk)
+    if snapshot is not None:
+        return snapshot
+
+    key = tenant_settings_key(tenant.pk)
+    cached = cache.get(key)
+    if cached is None:
+        cached = _load_tenant_settings(tenant.pk)
+        cache.set(key, cached, getattr(settings, 'TENANT_CACHE_TIMEOUT', 3600))
+    snapshot = TenantSettingsSnapshot(tenant.pk, *cached)
+    _local_settings.set(tenant.pk, snapshot)
+    return snapshot
+
+def refresh_tenant_settings(tenant_id):
+    """
+    Store a new snapshot of the tenant's settings, read back from the
+    database so that saves committing out of order leave the latest one.
+
+    As with hosts, other processes keep their local copy until it expires
+    (TENANT_LOCAL_CACHE_TTL).
+    """
+    cached = _load_tenant_settings(tenant_id)
+    cache.set(tenant_settings_key(tenant_id), cached, getattr(settings, 'TENANT_CACHE_TIMEOUT', 3600))
+    _local_settings.set(tenant_id, TenantSettingsSnapshot(tenant_id, *cached))
+
+def invalidate_tenant_settings(tenant_id):
+    _local_settings.delete(tenant_id)
+    cache.delete(tenant_settings_key(tenant_id))
@@ -1,8 +1,15 @@
+from .cache import get_tenant_settings
+
 def tenant_context(request):
     """
-    Context processor to add tenant information to the context.
-    Placeholder implementation.
+    Add the request's tenant and its settings snapshot to the context,
+    e.g. {% if tenant_settings.enable_invoicing %}.
     """
+    tenant = getattr(request, 'tenant', None)
+    tenant_settings = getattr(request, 'tenant_settings', None)
+    if tenant_settings is None:
+        tenant_settings = get_tenant_settings(tenant)
     return {
-        'tenant': getattr(request, 'tenant', None)
+        'tenant': tenant,
+        'tenant_settings': tenant_settings,
     }
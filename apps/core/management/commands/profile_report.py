@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from common import profiling
+import os
+import shutil
+
+class Command(BaseCommand):
+    help = ('Aggregate the request profiles saved by ProfilingMiddleware per URL name: '
+            'time split and the hottest stacks, optionally writing one merged '
+            'collapsed-stack file per URL name for flamegraph tools.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--view', help='Only this URL name, e.g. crm:lead_list.')
+        parser.add_argument('--top', type=int, default=10, help='Hottest stacks shown per URL name.')
+        parser.add_argument('--output', help='Directory for merged <url name>.collapsed files.')
+        parser.add_argument('--token', nargs='?', const='', metavar='LABEL',
+                            help='Print a signed header value that forces profiling, and exit.')
+        parser.add_argument('--clear', action='store_true', help='Delete the saved profiles afterwards.')
+
+    def handle(self, *args, **options):
+        if options['token'] is not None:
+            self.stdout.write(profiling.make_token(options['token']))
+            return
+        results = profiling.aggregate(options['view'])
+        if not results:
+            self.stdout.write('No profiles recorded.')
+        if options['output']:
+            os.makedirs(options['output'], exist_ok=True)
+        for name, result in sorted(results.items(), key=lambda item: -item[1]['wall_p95_ms']):
+            self.stdout.write(
+                f"{name}: {result['requests']} requests, wall p50 {result['wall_p50_ms']}ms "
+                f"p95 {result['wall_p95_ms']}ms; avg db {result['avg_db_ms']}ms "
+                f"({result['avg_queries']} queries), template {result['avg_template_ms']}ms, "
+                f"cache {result['avg_cache_ms']}ms, python {result['avg_python_ms']}ms"
+            )
+            samples = sum(result['stacks'].values())
+            for stack, count in result['stacks'].most_common(options['top']):
+                self.stdout.write(f"  {count * 100 / samples:5.1f}%  {';'.join(stack.split(';')[-3:])}")
+            if options['output']:
+                with open(os.path.join(options['output'], f'{name}{profiling.STACKS_SUFFIX}'), 'w') as f:
+                    for stack, count in result['stacks'].most_common():
+                        f.write(f'{stack} {count}\n')
+        if options['clear'] and os.path.isdir(profiling.profile_dir()):
+            shutil.rmtree(profiling.profile_dir())
+            self.stdout.write(self.style.SUCCESS('Profiles cleared.'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from common import query_cache
+
+class Command(BaseCommand):
+    help = ('Show the hit ratio and bytes read and written of each query cache '
+            '(CRM list pages and detail objects) and the invalidations per model.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Clear the recorded stats afterwards.')
+
+    def handle(self, *args, **options):
+        query_cache.flush_stats()
+        stats = query_cache.report()
+        self.stdout.write('Query cache by name:')
+        for row in stats['caches']:
+            self.stdout.write(
+                f"  {row['hit_ratio'] * 100:6.1f}% {row['hits']:9d} hits {row['misses']:9d} misses "
+                f"{row['bytes_read'] / 1024:10.1f}kB read {row['bytes_written'] / 1024:10.1f}kB written  {row['name']}"
+            )
+        self.stdout.write('')
+        self.stdout.write('Invalidations by model:')
+        for model, count in sorted(stats['invalidations'].items(), key=lambda item: item[1], reverse=True):
+            self.stdout.write(f'  {count:9d}  {model}')
+        if options['reset']:
+            query_cache.reset()
+            self.stdout.write(self.style.SUCCESS('Stats cleared.'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from common import query_inspector
+
+class Command(BaseCommand):
+    help = ('List the views running the most queries per request and the queries '
+            'most often repeated within one request (likely N+1s), as recorded by '
+            'QueryInspectorMiddleware.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20, help='Rows per section.')
+        parser.add_argument('--reset', action='store_true', help='Clear the recorded stats afterwards.')
+
+    def handle(self, *args, **options):
+        stats = query_inspector.report(options['limit'])
+        self.stdout.write('Queries per request by view:')
+        for row in stats['views']:
+            self.stdout.write(
+                f"  {row['avg_queries']:8.1f} avg {row['max_queries']:6d} max "
+                f"{row['avg_ms']:8.1f}ms {row['requests']:7d} requests  {row['view']}"
+            )
+        self.stdout.write('')
+        self.stdout.write('Repeated queries (possible N+1):')
+        for row in stats['repeated']:
+            self.stdout.write(
+                f"  {row['requests']:7d} requests {row['avg_per_request'] or 0:8.1f}/request  {row['view']}"
+            )
+            self.stdout.write(f"      {row['sql'][:500]}")
+        if options['reset']:
+            query_inspector.reset()
+            self.stdout.write(self.style.SUCCESS('Stats cleared.'))
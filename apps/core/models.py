@@ -1,8 +1,71 @@
 from django.db import models
 from django.conf import settings
 from django.core.validators import RegexValidator
+import copy
 import uuid
 
+_NOT_LOADED = object()
+
+class DirtyFieldsMixin:
+    """
+    Model mixin that snapshots field values as loaded from the database so
+    changes can be detected without re-reading the row.
+
+    ``changed_fields`` is the set of field names whose value differs from the
+    snapshot. The snapshot is refreshed after save() returns, so post_save
+    receivers still see what the save changed.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_fields()
+        return instance
+
+    def _snapshot_fields(self, fields=None):
+        snapshot = self.__dict__.get('_loaded_values') if fields else None
+        if snapshot is None:
+            snapshot = {}
+        for field in self._meta.concrete_fields:
+            if fields and field.name not in fields and field.attname not in fields:
+                continue
+            if field.attname in self.__dict__:
+                value = self.__dict__[field.attname]
+                snapshot[field.attname] = copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+        self._loaded_values = snapshot
+
+    @property
+    def tracks_changes(self):
+        """
+        True when the instance has a snapshot to compare against.
+        """
+        return '_loaded_values' in self.__dict__
+
+    @property
+    def changed_fields(self):
+        snapshot = self.__dict__.get('_loaded_values', {})
+        return {
+            field.name for field in self._meta.concrete_fields
+            if field.attname in snapshot
+            and self.__dict__.get(field.attname, snapshot[field.attname]) != snapshot[field.attname]
+        }
+
+    def loaded_value(self, name, default=None):
+        """
+        The value a field had when the instance was loaded or last saved.
+        """
+        attname = self._meta.get_field(name).attname
+        value = self.__dict__.get('_loaded_values', {}).get(attname, _NOT_LOADED)
+        return default if value is _NOT_LOADED else value
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._snapshot_fields(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._snapshot_fields(fields)
+
 class TimeStampedModel(models.Model):
     """
     An abstract base class model that provides self-updating
@@ -14,7 +77,7 @@ class TimeStampedModel(models.Model):
     class Meta:
         abstract = True
 
-class Tenant(TimeStampedModel):
+class Tenant(DirtyFieldsMixin, TimeStampedModel):
     """
     The main tenant model for multi-tenancy support.
     Each tenant represents a separate organization/company.
@@ -75,7 +138,7 @@ class Tenant(TimeStampedModel):
         primary_domain = self.get_primary_domain()
         return primary_domain.domain if primary_domain else None
 
-class Domain(TimeStampedModel):
+class Domain(DirtyFieldsMixin, TimeStampedModel):
     """
     Domain model for handling multiple domains per tenant.
     Allows for white-labeling and multiple access points to the same tenant.
@@ -126,7 +189,9 @@ class Domain(TimeStampedModel):
 class TenantSettings(TimeStampedModel):
     """
     Additional settings specific to each tenant that might change frequently.
-    Separated from the main Tenant model for performance reasons.
+    Separated from the main Tenant model for performance reasons. Read them
+    through request.tenant_settings (apps.core.cache.get_tenant_settings),
+    a cached snapshot, rather than tenant.settings, which costs a query.
     """
     tenant = models.OneToOneField(Tenant, on_delete=models.CASCADE, related_name='settings')
     
@@ -157,3 +222,52 @@ class TenantSettings(TimeStampedModel):
 
     def __str__(self):
         return f"Settings for {self.tenant.name}"
+
+class StripeOutbox(TimeStampedModel):
+    """
+    Stripe customer changes waiting to be sent. Rows are written in the same
+    transaction as the tenant and sent by a Celery task once it commits;
+    pending syncs for a tenant are coalesced into a single row.
+    """
+    ACTION_CHOICES = [
+        ('sync', 'Create or update customer'),
+        ('delete', 'Delete customer'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('cancelled', 'Cancelled'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # Not a foreign key: delete entries outlive the tenant they belong to
+    tenant_id = models.UUIDField(db_index=True)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    payload = models.JSONField(default=dict, blank=True)
+    stripe_customer_id = models.CharField(max_length=100, null=True, blank=True)
+    version = models.PositiveIntegerField(default=1)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Stripe Outbox Entry'
+        verbose_name_plural = 'Stripe Outbox'
+        ordering = ['created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tenant_id', 'action'],
+                condition=models.Q(status='pending'),
+                name='core_stripe_outbox_pending_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.action} for tenant {self.tenant_id} ({self.status})"
+
+    @property
+    def idempotency_key(self):
+        # Stable across retries of the same version, new for every change
+        return f"tenant-{self.tenant_id}-{self.action}-{self.pk}-v{self.version}"
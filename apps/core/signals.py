@@ -1,8 +1,13 @@
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.conf import settings
+from django.db import transaction
+from .cache import invalidate_hosts, invalidate_tenant_settings, refresh_tenant_settings
 from .models import Tenant, Domain, TenantSettings
-import stripe
+from .stripe_sync import (
+    STRIPE_CUSTOMER_FIELDS, queue_customer_delete, queue_customer_sync,
+    stripe_customer_payload
+)
 
 @receiver(post_save, sender=Tenant)
 def create_tenant_settings(sender, instance, created, **kwargs):
@@ -15,56 +20,23 @@ def create_tenant_settings(sender, instance, created, **kwargs):
 @receiver(post_save, sender=Tenant)
 def setup_stripe_customer(sender, instance, created, **kwargs):
     """
-    Create or update Stripe customer when a Tenant is saved
+    Queue a Stripe customer create/update when a billing-relevant field
+    changed. The Stripe call itself happens in Celery after commit.
     """
-    if settings.STRIPE_SECRET_KEY:
-        stripe.api_key = settings.STRIPE_SECRET_KEY
-        
-        try:
-            if created and not instance.stripe_customer_id:
-                # Create new Stripe customer
-                customer = stripe.Customer.create(
-                    email=instance.email,
-                    name=instance.name,
-                    metadata={
-                        'tenant_id': str(instance.id),
-                        'subscription_plan': instance.subscription_plan
-                    }
-                )
-                # Update tenant with Stripe customer ID
-                Tenant.objects.filter(id=instance.id).update(
-                    stripe_customer_id=customer.id
-                )
-            elif instance.stripe_customer_id:
-                # Update existing Stripe customer
-                stripe.Customer.modify(
-                    instance.stripe_customer_id,
-                    email=instance.email,
-                    name=instance.name,
-                    metadata={
-                        'tenant_id': str(instance.id),
-                        'subscription_plan': instance.subscription_plan
-                    }
-                )
-        except stripe.error.StripeError as e:
-            # Log the error but don't prevent tenant creation/update
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"Stripe error for tenant {instance.id}: {str(e)}")
+    if not settings.STRIPE_SECRET_KEY:
+        return
+    if not created and instance.tracks_changes and \
+            not instance.changed_fields.intersection(STRIPE_CUSTOMER_FIELDS):
+        return
+    queue_customer_sync(instance, stripe_customer_payload(instance))
 
 @receiver(post_delete, sender=Tenant)
 def cleanup_stripe_customer(sender, instance, **kwargs):
     """
-    Clean up Stripe customer when a Tenant is deleted
+    Queue removal of the Stripe customer when a Tenant is deleted
     """
-    if settings.STRIPE_SECRET_KEY and instance.stripe_customer_id:
-        stripe.api_key = settings.STRIPE_SECRET_KEY
-        try:
-            stripe.Customer.delete(instance.stripe_customer_id)
-        except stripe.error.StripeError as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"Error deleting Stripe customer {instance.stripe_customer_id}: {str(e)}")
+    if settings.STRIPE_SECRET_KEY:
+        queue_customer_delete(instance)
 
 @receiver(post_save, sender=Domain)
 def handle_primary_domain(sender, instance, created, **kwargs):
@@ -95,3 +67,40 @@ def handle_domain_deletion(sender, instance, **kwargs):
         if next_domain:
             next_domain.is_primary = True
             next_domain.save()
+
+@receiver(post_save, sender=Tenant)
+@receiver(post_delete, sender=Tenant)
+def invalidate_tenant_cache(sender, instance, **kwargs):
+    """
+    Drop cached host lookups for a tenant once the change commits. The hosts
+    are read now; after a delete the cascaded domains drop their own.
+    """
+    hosts = list(instance.domains.values_list('domain', flat=True))
+    transaction.on_commit(lambda: invalidate_hosts(hosts))
+
+@receiver(post_save, sender=Domain)
+@receiver(post_delete, sender=Domain)
+def invalidate_domain_cache(sender, instance, **kwargs):
+    """
+    Drop the cached host lookup once a domain save, rename or delete commits
+    """
+    hosts = [instance.domain, instance.loaded_value('domain')]
+    transaction.on_commit(lambda: invalidate_hosts(hosts))
+
+@receiver(post_save, sender=TenantSettings)
+def refresh_tenant_settings_cache(sender, instance, raw=False, **kwargs):
+    """
+    Replace the cached settings snapshot once the save commits
+    """
+    if raw:
+        return
+    tenant_id = instance.tenant_id
+    transaction.on_commit(lambda: refresh_tenant_settings(tenant_id))
+
+@receiver(post_delete, sender=TenantSettings)
+def invalidate_tenant_settings_cache(sender, instance, **kwargs):
+    """
+    Drop the cached settings snapshot when the row is removed
+    """
+    tenant_id = instance.tenant_id
+    transaction.on_commit(lambda: invalidate_tenant_settings(tenant_id))
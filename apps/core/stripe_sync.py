@@ -0,0 +1,115 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Tenant, StripeOutbox
+import logging
+import stripe
+
+logger = logging.getLogger(__name__)
+
+# Tenant fields mirrored on the Stripe customer
+STRIPE_CUSTOMER_FIELDS = ('name', 'email', 'subscription_plan')
+
+def stripe_customer_payload(tenant):
+    """
+    The customer parameters Stripe should hold for a tenant.
+    """
+    return {
+        'email': tenant.email,
+        'name': tenant.name,
+        'metadata': {
+            'tenant_id': str(tenant.pk),
+            'subscription_plan': tenant.subscription_plan,
+        },
+    }
+
+def _dispatch(entry_id):
+    from .tasks import process_stripe_outbox
+
+    transaction.on_commit(lambda: process_stripe_outbox.delay(str(entry_id)))
+
+def queue_customer_sync(tenant, payload):
+    """
+    Record that the tenant's Stripe customer needs creating or updating.
+    An entry that is still pending just takes the new payload, so repeated
+    saves result in a single Stripe call.
+    """
+    with transaction.atomic():
+        updated = StripeOutbox.objects.filter(
+            tenant_id=tenant.pk, action='sync', status='pending'
+        ).update(payload=payload, version=F('version') + 1, updated_at=timezone.now())
+        if updated:
+            # The task already scheduled for that entry sends the new version
+            return
+        entry = StripeOutbox.objects.create(tenant_id=tenant.pk, action='sync', payload=payload)
+    _dispatch(entry.pk)
+
+def queue_customer_delete(tenant):
+    """
+    Record that the Stripe customer of a deleted tenant must be removed and
+    drop any update that has not been sent yet.
+    """
+    with transaction.atomic():
+        StripeOutbox.objects.filter(
+            tenant_id=tenant.pk, action='sync', status='pending'
+        ).update(status='cancelled', updated_at=timezone.now())
+        if not tenant.stripe_customer_id:
+            return
+        entry = StripeOutbox.objects.create(
+            tenant_id=tenant.pk,
+            action='delete',
+            stripe_customer_id=tenant.stripe_customer_id,
+        )
+    _dispatch(entry.pk)
+
+def send_outbox_entry(entry):
+    """
+    Perform the Stripe call for an outbox entry. Raises stripe.error.StripeError.
+    """
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    if entry.action == 'delete':
+        stripe.Customer.delete(entry.stripe_customer_id, idempotency_key=entry.idempotency_key)
+        return
+
+    customer_ids = Tenant.objects.filter(pk=entry.tenant_id).values_list(
+        'stripe_customer_id', flat=True
+    )
+    if not customer_ids:
+        # The tenant is gone; its delete entry takes care of Stripe
+        return
+    customer_id = customer_ids[0]
+    if customer_id:
+        stripe.Customer.modify(customer_id, idempotency_key=entry.idempotency_key, **entry.payload)
+        return
+
+    customer = stripe.Customer.create(idempotency_key=entry.idempotency_key, **entry.payload)
+    stored = Tenant.objects.filter(pk=entry.tenant_id).update(stripe_customer_id=customer.id)
+    if not stored:
+        # Deleted while the customer was being created
+        stripe.Customer.delete(customer.id)
+
+def process_entry(entry_id):
+    """
+    Send a pending outbox entry and mark it sent. Returns False when the
+    entry was changed while it was being sent and needs another pass.
+    """
+    entry = StripeOutbox.objects.filter(pk=entry_id, status='pending').first()
+    if entry is None:
+        return True
+    try:
+        send_outbox_entry(entry)
+    except stripe.error.StripeError as e:
+        StripeOutbox.objects.filter(pk=entry.pk).update(
+            attempts=F('attempts') + 1, last_error=str(e)
+        )
+        raise
+    return bool(StripeOutbox.objects.filter(pk=entry.pk, version=entry.version).update(
+        status='sent', sent_at=timezone.now(), attempts=F('attempts') + 1, last_error=''
+    ))
+
+def mark_failed(entry_id, error):
+    StripeOutbox.objects.filter(pk=entry_id, status='pending').update(
+        status='failed', last_error=str(error)
+    )
+    logger.error(f"Giving up on Stripe outbox entry {entry_id}: {error}")
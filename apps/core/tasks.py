@@ -0,0 +1,35 @@
+from celery import shared_task
+from datetime import timedelta
+from django.utils import timezone
+from . import stripe_sync
+from .models import StripeOutbox
+import stripe
+
+@shared_task(bind=True, max_retries=6, ignore_result=True)
+def process_stripe_outbox(self, entry_id):
+    """
+    Send one Stripe outbox entry, retrying with exponential backoff.
+    """
+    try:
+        done = stripe_sync.process_entry(entry_id)
+    except stripe.error.StripeError as e:
+        if self.request.retries >= self.max_retries:
+            stripe_sync.mark_failed(entry_id, e)
+            return
+        raise self.retry(exc=e, countdown=30 * 2 ** self.request.retries)
+    if not done:
+        # The payload changed mid-flight; send the newer version
+        process_stripe_outbox.delay(entry_id)
+
+@shared_task(ignore_result=True)
+def flush_stripe_outbox():
+    """
+    Re-dispatch pending entries whose task never ran, e.g. because the
+    broker was unavailable when the tenant was saved.
+    """
+    stale = timezone.now() - timedelta(minutes=5)
+    entry_ids = StripeOutbox.objects.filter(
+        status='pending', updated_at__lt=stale
+    ).values_list('pk', flat=True)
+    for entry_id in entry_ids:
+        process_stripe_outbox.delay(str(entry_id))
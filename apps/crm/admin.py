@@ -1,5 +1,14 @@
 from django.contrib import admin
-from .models import Client, Contact, Lead, Communication, Document
+from .exports import stream_export
+from .models import Client, Contact, Lead, Communication, Document, ImportJob, DuplicateCandidate, LeadStatusTransition
+
+@admin.action(description='Export selected as CSV')
+def export_csv(modeladmin, request, queryset):
+    return stream_export(request, queryset, 'csv')
+
+@admin.action(description='Export selected as XLSX')
+def export_xlsx(modeladmin, request, queryset):
+    return stream_export(request, queryset, 'xlsx')
 
 @admin.register(Client)
 class ClientAdmin(admin.ModelAdmin):
@@ -7,13 +16,16 @@ class ClientAdmin(admin.ModelAdmin):
     search_fields = ('name', 'email', 'phone')
     list_filter = ('is_active', 'created_at')
     ordering = ('name',)
+    actions = [export_csv, export_xlsx]
 
 @admin.register(Contact)
 class ContactAdmin(admin.ModelAdmin):
     list_display = ('first_name', 'last_name', 'email', 'phone', 'client', 'is_primary', 'is_active')
+    list_select_related = ('client',)
     search_fields = ('first_name', 'last_name', 'email', 'phone', 'client__name')
     list_filter = ('is_primary', 'is_active')
     ordering = ('last_name', 'first_name')
+    actions = [export_csv, export_xlsx]
 
 @admin.register(Lead)
 class LeadAdmin(admin.ModelAdmin):
@@ -21,17 +33,49 @@ class LeadAdmin(admin.ModelAdmin):
     search_fields = ('first_name', 'last_name', 'email', 'source')
     list_filter = ('status', 'is_active', 'created_at')
     ordering = ('-created_at',)
+    readonly_fields = ('score',)
+    actions = [export_csv, export_xlsx]
 
 @admin.register(Communication)
 class CommunicationAdmin(admin.ModelAdmin):
     list_display = ('communication_type', 'client', 'contact', 'subject', 'date', 'created_by')
+    list_select_related = ('client', 'contact', 'created_by')
     search_fields = ('subject', 'client__name', 'contact__first_name', 'contact__last_name')
     list_filter = ('communication_type', 'date')
     ordering = ('-date',)
+    actions = [export_csv, export_xlsx]
 
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
     list_display = ('client', 'lead', 'uploaded_by', 'file', 'created_at')
+    list_select_related = ('client', 'lead', 'uploaded_by')
     search_fields = ('client__name', 'lead__first_name', 'lead__last_name', 'uploaded_by__email')
     list_filter = ('created_at',)
     ordering = ('-created_at',)
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('original_name', 'tenant', 'kind', 'status', 'rows_processed', 'created_count', 'updated_count', 'error_count', 'created_at')
+    list_filter = ('kind', 'status', 'created_at')
+    search_fields = ('original_name', 'tenant__name')
+    ordering = ('-created_at',)
+    readonly_fields = (
+        'status', 'file_size', 'bytes_processed', 'rows_processed', 'created_count', 'updated_count',
+        'error_count', 'errors', 'last_error', 'started_at', 'finished_at',
+    )
+
+@admin.register(DuplicateCandidate)
+class DuplicateCandidateAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'object_a', 'object_b', 'score', 'status', 'tenant', 'updated_at')
+    list_filter = ('kind', 'status')
+    search_fields = ('object_a', 'object_b', 'tenant__name')
+    ordering = ('-score',)
+    readonly_fields = ('tenant', 'kind', 'object_a', 'object_b', 'score', 'reasons')
+
+@admin.register(LeadStatusTransition)
+class LeadStatusTransitionAdmin(admin.ModelAdmin):
+    list_display = ('lead_id', 'from_status', 'to_status', 'seconds_in_stage', 'changed_at', 'tenant')
+    list_filter = ('to_status', 'changed_at')
+    search_fields = ('lead_id',)
+    ordering = ('-changed_at',)
+    readonly_fields = ('tenant', 'lead_id', 'from_status', 'to_status', 'seconds_in_stage', 'changed_at')
@@ -0,0 +1,231 @@
+from django.conf import settings
+from django.db.models import Q
+from django_redis import get_redis_connection
+from .models import Client, Contact
+from .search import normalize
+import json
+import re
+
+# Sorted sets of "term\0pk" members, all with score 0, so ZRANGEBYLEX
+# returns every record with a term starting with the typed prefix.
+INDEX_KEY = 'crm:autocomplete:{tenant_id}:{kind}'
+ENTRIES_KEY = 'crm:autocomplete:{tenant_id}:{kind}:entries'
+BUILT_KEY = 'crm:autocomplete:{tenant_id}:{kind}:built'
+# Held while an index is built, and set while a build task is queued
+BUILD_LOCK_KEY = 'crm:autocomplete:{tenant_id}:{kind}:lock'
+BUILD_QUEUED_KEY = 'crm:autocomplete:{tenant_id}:{kind}:queued'
+SEPARATOR = '\0'
+MAX_TERM_LENGTH = 100
+
+def _client_entry(client):
+    return {
+        'label': client.name,
+        'terms': _phrase_terms(client.name) + _email_terms(client.email),
+    }
+
+def _contact_entry(contact):
+    name = f'{contact.first_name} {contact.last_name}'.strip()
+    return {
+        'label': f'{name} <{contact.email}>' if contact.email else name,
+        'client': str(contact.client_id),
+        'terms': (
+            _phrase_terms(name)
+            + _phrase_terms(f'{contact.last_name} {contact.first_name}')[:1]
+            + _email_terms(contact.email)
+        ),
+    }
+
+# kind -> (model, entry builder)
+AUTOCOMPLETE_MODELS = {
+    'client': (Client, _client_entry),
+    'contact': (Contact, _contact_entry),
+}
+# kind -> (fields matched by the database fallback, its ordering)
+FALLBACK_LOOKUPS = {
+    'client': (('name', 'email'), ('name', 'id')),
+    'contact': (('first_name', 'last_name', 'email'), ('last_name', 'first_name', 'id')),
+}
+KINDS_BY_MODEL = {model: kind for kind, (model, _entry) in AUTOCOMPLETE_MODELS.items()}
+
+def normalize_term(text):
+    return re.sub(r'\s+', ' ', normalize(text or '')).strip()[:MAX_TERM_LENGTH]
+
+def _phrase_terms(text):
+    """
+    The phrase from each word onwards, so "acme" finds "The Acme Company".
+    """
+    words = normalize_term(text).split(' ')
+    return [' '.join(words[index:]) for index in range(len(words)) if words[index]]
+
+def _email_terms(email):
+    email = normalize_term(email)
+    return [email] if email else []
+
+def _redis():
+    return get_redis_connection('default')
+
+def _keys(tenant_id, kind):
+    return (
+        INDEX_KEY.format(tenant_id=tenant_id, kind=kind),
+        ENTRIES_KEY.format(tenant_id=tenant_id, kind=kind),
+        BUILT_KEY.format(tenant_id=tenant_id, kind=kind),
+    )
+
+def _members(pk, terms):
+    return [f'{term}{SEPARATOR}{pk}' for term in set(terms)]
+
+def _is_indexable(obj):
+    return getattr(obj, 'is_active', True)
+
+def update_object(obj):
+    """
+    Replace the terms of one client or contact, or drop them if it is
+    inactive. Does nothing until the tenant's index has been built.
+    """
+    kind = KINDS_BY_MODEL[type(obj)]
+    index_key, entries_key, built_key = _keys(obj.tenant_id, kind)
+    conn = _redis()
+    if not conn.exists(built_key):
+        return
+    old = conn.hget(entries_key, str(obj.pk))
+    with conn.pipeline() as pipe:
+        if old:
+            old_members = _members(obj.pk, json.loads(old)['terms'])
+            if old_members:
+                pipe.zrem(index_key, *old_members)
+        if _is_indexable(obj):
+            entry = AUTOCOMPLETE_MODELS[kind][1](obj)
+            pipe.hset(entries_key, str(obj.pk), json.dumps(entry))
+            pipe.zadd(index_key, {member: 0 for member in _members(obj.pk, entry['terms'])})
+        else:
+            pipe.hdel(entries_key, str(obj.pk))
+        pipe.execute()
+
+def remove_object(obj):
+    kind = KINDS_BY_MODEL[type(obj)]
+    index_key, entries_key, _built_key = _keys(obj.tenant_id, kind)
+    conn = _redis()
+    old = conn.hget(entries_key, str(obj.pk))
+    if not old:
+        return
+    with conn.pipeline() as pipe:
+        pipe.zrem(index_key, *_members(obj.pk, json.loads(old)['terms']))
+        pipe.hdel(entries_key, str(obj.pk))
+        pipe.execute()
+
+def build_timeout():
+    return getattr(settings, 'AUTOCOMPLETE_BUILD_TIMEOUT', 600)
+
+def build_index(tenant_id, kind, batch_size=1000):
+    """
+    (Re)build a tenant's index for ``kind`` from the database. Returns the
+    number of records indexed. Builds of one index run one at a time
+    behind a Redis lock, so two never interleave their delete and refill.
+    """
+    model, make_entry = AUTOCOMPLETE_MODELS[kind]
+    index_key, entries_key, built_key = _keys(tenant_id, kind)
+    conn = _redis()
+    lock = conn.lock(
+        BUILD_LOCK_KEY.format(tenant_id=tenant_id, kind=kind),
+        timeout=build_timeout(), blocking_timeout=build_timeout(),
+    )
+    with lock:
+        conn.delete(index_key, entries_key, built_key)
+        count = 0
+        pipe = conn.pipeline()
+        for obj in model.objects.filter(tenant_id=tenant_id, is_active=True).order_by().iterator(chunk_size=batch_size):
+            entry = make_entry(obj)
+            pipe.hset(entries_key, str(obj.pk), json.dumps(entry))
+            pipe.zadd(index_key, {member: 0 for member in _members(obj.pk, entry['terms'])})
+            count += 1
+            if count % batch_size == 0:
+                pipe.execute()
+        pipe.set(built_key, 1)
+        pipe.execute()
+    return count
+
+def schedule_build(tenant_id, kind):
+    """
+    Queue one build_autocomplete_index task for an index that is missing,
+    however many requests notice it meanwhile.
+    """
+    from .tasks import build_autocomplete_index
+
+    queued_key = BUILD_QUEUED_KEY.format(tenant_id=tenant_id, kind=kind)
+    if _redis().set(queued_key, 1, nx=True, ex=build_timeout()):
+        build_autocomplete_index.delay(str(tenant_id), kind)
+
+def build_scheduled_index(tenant_id, kind):
+    try:
+        return build_index(tenant_id, kind)
+    finally:
+        _redis().delete(BUILD_QUEUED_KEY.format(tenant_id=tenant_id, kind=kind))
+
+def suggest_from_database(tenant_id, kind, query, limit, client_id=None):
+    """
+    Suggestions from a case-insensitive prefix match on the names and
+    email, served while the tenant's index is being built.
+    """
+    model, make_entry = AUTOCOMPLETE_MODELS[kind]
+    fields, ordering = FALLBACK_LOOKUPS[kind]
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f'{field}__istartswith': query})
+    queryset = model.objects.filter(condition, tenant_id=tenant_id, is_active=True)
+    if client_id and kind == 'contact':
+        queryset = queryset.filter(client_id=client_id)
+    return [
+        {'id': str(obj.pk), 'label': make_entry(obj)['label']}
+        for obj in queryset.order_by(*ordering)[:limit]
+    ]
+
+def suggest(tenant_id, kind, query, limit=None, client_id=None):
+    """
+    Return up to ``limit`` {'id', 'label'} dicts for records with a name or
+    email term starting with ``query``, in term order. Contacts can be
+    narrowed to one client.
+    """
+    limit = limit or getattr(settings, 'AUTOCOMPLETE_LIMIT', 10)
+    prefix = normalize_term(query)
+    if not prefix:
+        return []
+    index_key, entries_key, built_key = _keys(tenant_id, kind)
+    conn = _redis()
+    if not conn.exists(built_key):
+        # Cold start or eviction: build in the background, not per keystroke
+        schedule_build(tenant_id, kind)
+        return suggest_from_database(tenant_id, kind, query.strip(), limit, client_id)
+
+    results = []
+    seen = set()
+    start = 0
+    # Over-fetch: one record has several terms and filters drop some
+    page_size = limit * 4
+    while len(results) < limit:
+        members = conn.zrangebylex(
+            index_key, b'[' + prefix.encode(), b'[' + prefix.encode() + b'\xff',
+            start=start, num=page_size,
+        )
+        if not members:
+            break
+        start += len(members)
+        pks = []
+        for member in members:
+            pk = member.decode().rsplit(SEPARATOR, 1)[1]
+            if pk not in seen:
+                seen.add(pk)
+                pks.append(pk)
+        if not pks:
+            continue
+        for pk, raw in zip(pks, conn.hmget(entries_key, pks)):
+            if raw is None:
+                continue
+            entry = json.loads(raw)
+            if client_id and entry.get('client') != str(client_id):
+                continue
+            results.append({'id': pk, 'label': entry['label']})
+            if len(results) >= limit:
+                break
+        if len(members) < page_size:
+            break
+    return results
@@ -0,0 +1,425 @@
+from collections import defaultdict
+from itertools import groupby
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from common import query_cache
+from .models import Contact, Lead, DedupeKey, DuplicateCandidate
+from .search import normalize
+import logging
+import re
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - numpy is optional
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+DEDUPE_MODELS = {
+    'lead': Lead,
+    'contact': Contact,
+}
+KINDS_BY_MODEL = {model: kind for kind, model in DEDUPE_MODELS.items()}
+FEATURE_FIELDS = ('id', 'tenant_id', 'first_name', 'last_name', 'email', 'phone')
+# Mailbox providers that ignore dots in the local part
+DOTLESS_DOMAINS = frozenset({'gmail.com', 'googlemail.com'})
+# Share of the score from each field; phone only counts when both records
+# have one.
+NAME_WEIGHT = 0.5
+EMAIL_WEIGHT = 0.3
+PHONE_WEIGHT = 0.2
+# Addresses that normalize to the same mailbox are the same person
+SAME_EMAIL_SCORE = 0.95
+MIN_PHONE_DIGITS = 7
+
+def threshold():
+    return getattr(settings, 'DEDUPE_THRESHOLD', 0.7)
+
+def max_block_size():
+    return getattr(settings, 'DEDUPE_MAX_BLOCK_SIZE', 200)
+
+def canonical_email(email):
+    """
+    Lower-case the address and drop +tags, and dots for Gmail, so
+    "John.Doe+ads@GMail.com" and "johndoe@gmail.com" compare equal.
+    """
+    email = (email or '').strip().lower()
+    local, _at, domain = email.rpartition('@')
+    if not local:
+        return email
+    local = local.split('+', 1)[0]
+    if domain in DOTLESS_DOMAINS:
+        local = local.replace('.', '')
+        domain = 'gmail.com'
+    return f'{local}@{domain}'
+
+def canonical_phone(phone):
+    """
+    The last ten digits of a phone number, which drops country prefixes
+    and formatting. Returns '' for values too short to be a phone number.
+    """
+    digits = re.sub(r'\D', '', phone or '')
+    return digits[-10:] if len(digits) >= MIN_PHONE_DIGITS else ''
+
+def _name_tokens(first_name, last_name):
+    return re.findall(r'[a-z0-9]+', normalize(f'{first_name or ""} {last_name or ""}'))
+
+def record_keys(first_name, last_name, email, phone):
+    """
+    Blocking keys for a record. Each name order gives a key, so "Jon Smith"
+    meets "John Smith" through the surname and "John Smyth" through the
+    first name.
+    """
+    keys = set()
+    email = canonical_email(email)
+    if '@' in email:
+        keys.add(('email', email))
+    phone = canonical_phone(phone)
+    if phone:
+        keys.add(('phone', phone))
+    first = _name_tokens(first_name, '')
+    last = _name_tokens('', last_name)
+    if first and last:
+        keys.add(('name', f'{last[-1][:4]}|{first[0][0]}'))
+        keys.add(('name', f'{first[0][:4]}|{last[-1][0]}'))
+    return keys
+
+def _trigrams(text):
+    text = f'  {text} '
+    return frozenset(text[index:index + 3] for index in range(len(text) - 2))
+
+class Features:
+    """
+    What a record is compared on, computed once per record.
+    """
+    __slots__ = ('pk', 'tenant_id', 'name', 'email', 'email_grams', 'phone')
+
+    def __init__(self, pk, tenant_id, first_name, last_name, email, phone):
+        self.pk = pk
+        self.tenant_id = tenant_id
+        # Token order is ignored, so swapped first and last names match
+        self.name = _trigrams(' '.join(sorted(_name_tokens(first_name, last_name))))
+        self.email = canonical_email(email)
+        self.email_grams = _trigrams(self.email)
+        self.phone = canonical_phone(phone)
+
+def load_features(kind, pks):
+    model = DEDUPE_MODELS[kind]
+    return {
+        row[0]: Features(*row)
+        for row in model.objects.filter(pk__in=list(pks)).values_list(*FEATURE_FIELDS)
+    }
+
+def _dice_matrix(left, right):
+    """
+    Dice similarity of every pair of trigram sets, from one matrix product
+    of the sets encoded as 0/1 rows.
+    """
+    vocabulary = {}
+    for grams in left + right:
+        for gram in grams:
+            vocabulary.setdefault(gram, len(vocabulary))
+
+    def encode(sets):
+        matrix = numpy.zeros((len(sets), len(vocabulary)), dtype=numpy.float32)
+        for row, grams in enumerate(sets):
+            matrix[row, [vocabulary[gram] for gram in grams]] = 1
+        return matrix
+
+    a, b = encode(left), encode(right)
+    shared = a @ b.T
+    total = a.sum(axis=1)[:, None] + b.sum(axis=1)[None, :]
+    return numpy.divide(2 * shared, total, out=numpy.zeros_like(shared), where=total > 0)
+
+def _score_numpy(left, right):
+    names = _dice_matrix([f.name for f in left], [f.name for f in right])
+    emails = _dice_matrix([f.email_grams for f in left], [f.email_grams for f in right])
+    left_phones = numpy.array([f.phone for f in left], dtype=object)[:, None]
+    right_phones = numpy.array([f.phone for f in right], dtype=object)[None, :]
+    both_phones = (left_phones != '') & (right_phones != '')
+    phones = (left_phones == right_phones) & both_phones
+    scores = (NAME_WEIGHT * names + EMAIL_WEIGHT * emails + PHONE_WEIGHT * phones) / (
+        NAME_WEIGHT + EMAIL_WEIGHT + PHONE_WEIGHT * both_phones
+    )
+    same_email = numpy.array([f.email for f in left], dtype=object)[:, None] == numpy.array([f.email for f in right], dtype=object)[None, :]
+    scores = numpy.where(same_email, numpy.maximum(scores, SAME_EMAIL_SCORE), scores)
+    return scores, names, emails, phones
+
+def _dice(a, b):
+    total = len(a) + len(b)
+    return 2 * len(a & b) / total if total else 0.0
+
+def _score_python(left, right):
+    scores, names, emails, phones = [], [], [], []
+    for a in left:
+        rows = ([], [], [], [])
+        for b in right:
+            name, email = _dice(a.name, b.name), _dice(a.email_grams, b.email_grams)
+            both_phones = bool(a.phone and b.phone)
+            phone = both_phones and a.phone == b.phone
+            score = (NAME_WEIGHT * name + EMAIL_WEIGHT * email + PHONE_WEIGHT * phone) / (
+                NAME_WEIGHT + EMAIL_WEIGHT + PHONE_WEIGHT * both_phones
+            )
+            if a.email == b.email:
+                score = max(score, SAME_EMAIL_SCORE)
+            for values, value in zip(rows, (score, name, email, phone)):
+                values.append(value)
+        for values, row in zip((scores, names, emails, phones), rows):
+            values.append(row)
+    return scores, names, emails, phones
+
+def score_pairs(left, right, same=False):
+    """
+    Score every record in ``left`` against every record in ``right`` in
+    one go (vectorized with numpy when it is installed). Returns
+    [(a, b, score, reasons)] for pairs at or above DEDUPE_THRESHOLD; with
+    ``same`` the lists are one block and each pair is scored once.
+    """
+    if not left or not right:
+        return []
+    limit = threshold()
+    if numpy is not None:
+        scores, names, emails, phones = _score_numpy(left, right)
+        hits = numpy.argwhere(scores >= limit)
+        if same:
+            hits = hits[hits[:, 0] < hits[:, 1]]
+    else:
+        scores, names, emails, phones = _score_python(left, right)
+        hits = [
+            (i, j) for i in range(len(left)) for j in range(i + 1 if same else 0, len(right))
+            if scores[i][j] >= limit
+        ]
+    pairs = []
+    for i, j in hits:
+        a, b = left[i], right[j]
+        if a.pk == b.pk:
+            continue
+        reasons = {
+            'name': round(float(names[i][j]), 3),
+            'email': round(float(emails[i][j]), 3),
+            'phone': bool(phones[i][j]),
+        }
+        pairs.append((a, b, round(float(scores[i][j]), 4), reasons))
+    return pairs
+
+def _candidate(kind, a, b, score, reasons):
+    object_a, object_b = sorted((a.pk, b.pk), key=str)
+    return DuplicateCandidate(
+        tenant_id=a.tenant_id, kind=kind, object_a=object_a, object_b=object_b,
+        score=score, reasons=reasons,
+    )
+
+def save_candidates(kind, pairs):
+    """
+    Upsert candidate pairs. Dismissed and merged pairs keep their status;
+    only their score and reasons are refreshed.
+    """
+    best = {}
+    for pair in pairs:
+        candidate = _candidate(kind, *pair)
+        key = (candidate.object_a, candidate.object_b)
+        if key not in best or best[key].score < candidate.score:
+            best[key] = candidate
+    DuplicateCandidate.objects.bulk_create(
+        list(best.values()),
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['kind', 'object_a', 'object_b'],
+        update_fields=['score', 'reasons', 'updated_at'],
+    )
+    return len(best)
+
+def _key_rows(kind, features):
+    return [
+        DedupeKey(tenant_id=record.tenant_id, kind=kind, object_id=record.pk, key_type=key_type, value=value[:255])
+        for record, keys in features
+        for key_type, value in keys
+    ]
+
+def refresh_records(kind, pks):
+    """
+    Recompute the keys of some records and compare them with every record
+    they share a key with. Used after saves and bulk writes; candidates of
+    these records that no longer match are dropped. Returns the number of
+    candidate pairs found.
+    """
+    rows = DEDUPE_MODELS[kind].objects.filter(pk__in=list(pks)).values_list(*FEATURE_FIELDS)
+    keyed = [(Features(*row), record_keys(*row[2:])) for row in rows]
+    if not keyed:
+        return 0
+    features = {record.pk: record for record, _keys in keyed}
+    with transaction.atomic():
+        DedupeKey.objects.filter(kind=kind, object_id__in=list(features)).delete()
+        DedupeKey.objects.bulk_create(_key_rows(kind, keyed), batch_size=1000)
+        _open_candidates(kind, features).delete()
+
+        by_tenant = defaultdict(set)
+        for record, keys in keyed:
+            by_tenant[record.tenant_id].update(value for _key_type, value in keys)
+        members = defaultdict(set)
+        for tenant_id, values in by_tenant.items():
+            rows = DedupeKey.objects.filter(
+                tenant_id=tenant_id, kind=kind, value__in=list(values)
+            ).values_list('key_type', 'value', 'object_id')
+            for key_type, value, object_id in rows:
+                members[(tenant_id, key_type, value)].add(object_id)
+
+        limit = max_block_size()
+        others = {}
+        for record, keys in keyed:
+            others[record.pk] = set()
+            for key_type, value in keys:
+                block = members[(record.tenant_id, key_type, value)]
+                if len(block) <= limit:
+                    others[record.pk] |= block
+            others[record.pk].discard(record.pk)
+        others_features = load_features(kind, set().union(*others.values()) - set(features))
+        others_features.update(features)
+
+        pairs = []
+        for record, _keys in keyed:
+            pairs.extend(score_pairs([record], [others_features[pk] for pk in others[record.pk] if pk in others_features]))
+        return save_candidates(kind, pairs)
+
+def refresh_queryset(queryset, batch_size=1000):
+    """
+    refresh_records() for every lead or contact in ``queryset``, a batch at
+    a time, e.g. after bulk_create sent no post_save.
+    """
+    kind = KINDS_BY_MODEL[queryset.model]
+    found = 0
+    batch = []
+    for pk in queryset.order_by().values_list('pk', flat=True).iterator(chunk_size=batch_size):
+        batch.append(pk)
+        if len(batch) >= batch_size:
+            found += refresh_records(kind, batch)
+            batch = []
+    if batch:
+        found += refresh_records(kind, batch)
+    return found
+
+def _open_candidates(kind, pks):
+    pks = list(pks)
+    return DuplicateCandidate.objects.filter(
+        Q(object_a__in=pks) | Q(object_b__in=pks), kind=kind, status='open'
+    )
+
+def remove_records(kind, pks):
+    DedupeKey.objects.filter(kind=kind, object_id__in=list(pks)).delete()
+    DuplicateCandidate.objects.filter(
+        Q(object_a__in=list(pks)) | Q(object_b__in=list(pks)), kind=kind
+    ).exclude(status='merged').delete()
+
+def rebuild_tenant(tenant_id, kind, batch_size=2000):
+    """
+    Recompute every key of a tenant's leads or contacts, then score each
+    block of records sharing a key. Blocks bigger than
+    DEDUPE_MAX_BLOCK_SIZE (a very common name) are skipped. Returns the
+    number of candidate pairs found.
+    """
+    model = DEDUPE_MODELS[kind]
+    DedupeKey.objects.filter(tenant_id=tenant_id, kind=kind).delete()
+    DuplicateCandidate.objects.filter(tenant_id=tenant_id, kind=kind, status='open').delete()
+
+    keys = []
+    rows = model.objects.filter(tenant_id=tenant_id).order_by().values_list(*FEATURE_FIELDS)
+    for pk, row_tenant_id, *fields in rows.iterator(chunk_size=batch_size):
+        keys.extend(
+            DedupeKey(tenant_id=row_tenant_id, kind=kind, object_id=pk, key_type=key_type, value=value[:255])
+            for key_type, value in record_keys(*fields)
+        )
+        if len(keys) >= batch_size:
+            DedupeKey.objects.bulk_create(keys)
+            keys = []
+    DedupeKey.objects.bulk_create(keys)
+
+    found = 0
+    limit = max_block_size()
+    blocks = []
+    pending_ids = 0
+    key_rows = (
+        DedupeKey.objects.filter(tenant_id=tenant_id, kind=kind)
+        .order_by('key_type', 'value')
+        .values_list('key_type', 'value', 'object_id')
+        .iterator(chunk_size=batch_size)
+    )
+    for key, group in groupby(key_rows, key=lambda row: row[:2]):
+        block = [object_id for _key_type, _value, object_id in group]
+        if len(block) < 2:
+            continue
+        if len(block) > limit:
+            logger.info('Skipping dedupe block %s of %d %ss', key, len(block), kind)
+            continue
+        blocks.append(block)
+        pending_ids += len(block)
+        if pending_ids >= batch_size:
+            found += _score_blocks(kind, blocks)
+            blocks, pending_ids = [], 0
+    if blocks:
+        found += _score_blocks(kind, blocks)
+    return found
+
+def _score_blocks(kind, blocks):
+    features = load_features(kind, {pk for block in blocks for pk in block})
+    pairs = []
+    for block in blocks:
+        records = [features[pk] for pk in block if pk in features]
+        pairs.extend(score_pairs(records, records, same=True))
+    return save_candidates(kind, pairs)
+
+# Fields a merge copies from a duplicate when the surviving record has no value
+MERGE_FILL_FIELDS = {
+    'lead': ('phone', 'source', 'notes', 'client'),
+    'contact': ('phone', 'job_title'),
+}
+
+def merge_records(survivor, duplicates):
+    """
+    Merge ``duplicates`` into ``survivor``: every row pointing at a
+    duplicate (communications, documents, ...) is repointed with one
+    UPDATE per relation, blank fields are filled from the duplicates, and
+    the duplicates are deleted. Returns the survivor.
+    """
+    kind = KINDS_BY_MODEL[type(survivor)]
+    duplicates = [obj for obj in duplicates if obj.pk != survivor.pk]
+    if any(obj.tenant_id != survivor.tenant_id for obj in duplicates):
+        raise ValueError('Cannot merge records of different tenants.')
+    duplicate_ids = [obj.pk for obj in duplicates]
+    if not duplicate_ids:
+        return survivor
+
+    with transaction.atomic():
+        for relation in survivor._meta.related_objects:
+            if relation.one_to_many and not relation.related_model._meta.auto_created:
+                relation.related_model._base_manager.filter(
+                    **{f'{relation.field.name}__in': duplicate_ids}
+                ).update(**{relation.field.name: survivor})
+                query_cache.bump_on_commit(survivor.tenant_id, relation.related_model)
+
+        changed = []
+        for name in MERGE_FILL_FIELDS[kind]:
+            attname = survivor._meta.get_field(name).attname
+            if getattr(survivor, attname) in (None, ''):
+                for obj in duplicates:
+                    if getattr(obj, attname) not in (None, ''):
+                        setattr(survivor, attname, getattr(obj, attname))
+                        changed.append(name)
+                        break
+        if hasattr(survivor, 'tags'):
+            tags = list(survivor.tags or [])
+            for obj in duplicates:
+                tags.extend(tag for tag in obj.tags or [] if tag not in tags)
+            if tags != list(survivor.tags or []):
+                survivor.tags = tags
+                changed.append('tags')
+
+        DuplicateCandidate.objects.filter(
+            Q(object_a=survivor.pk, object_b__in=duplicate_ids) | Q(object_a__in=duplicate_ids, object_b=survivor.pk),
+            kind=kind,
+        ).update(status='merged')
+        DEDUPE_MODELS[kind].objects.filter(pk__in=duplicate_ids).delete()
+        if changed:
+            survivor.save(update_fields=changed + ['updated_at'])
+    logger.info('Merged %d %ss into %s', len(duplicate_ids), kind, survivor.pk)
+    return survivor
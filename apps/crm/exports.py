@@ -0,0 +1,336 @@
+from django.conf import settings
+from django.db import models
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from xml.sax.saxutils import escape
+from .models import Client, Contact, Lead, Communication
+import csv
+import re
+import zipfile
+import zlib
+
+# kind -> (model, [(header, values_list lookup)]). Related names are
+# joined in the same query instead of being loaded per row.
+EXPORT_COLUMNS = {
+    'client': (Client, [
+        ('ID', 'id'),
+        ('Name', 'name'),
+        ('Email', 'email'),
+        ('Phone', 'phone'),
+        ('Website', 'website'),
+        ('Address', 'address'),
+        ('Tags', 'tags'),
+        ('Active', 'is_active'),
+        ('Created', 'created_at'),
+        ('Updated', 'updated_at'),
+    ]),
+    'contact': (Contact, [
+        ('ID', 'id'),
+        ('First name', 'first_name'),
+        ('Last name', 'last_name'),
+        ('Email', 'email'),
+        ('Phone', 'phone'),
+        ('Job title', 'job_title'),
+        ('Client', 'client__name'),
+        ('Client ID', 'client_id'),
+        ('Primary', 'is_primary'),
+        ('Tags', 'tags'),
+        ('Active', 'is_active'),
+        ('Created', 'created_at'),
+    ]),
+    'lead': (Lead, [
+        ('ID', 'id'),
+        ('First name', 'first_name'),
+        ('Last name', 'last_name'),
+        ('Email', 'email'),
+        ('Phone', 'phone'),
+        ('Source', 'source'),
+        ('Status', 'status'),
+        ('Score', 'score'),
+        ('Client', 'client__name'),
+        ('Notes', 'notes'),
+        ('Active', 'is_active'),
+        ('Created', 'created_at'),
+    ]),
+    'communication': (Communication, [
+        ('ID', 'id'),
+        ('Type', 'communication_type'),
+        ('Date', 'date'),
+        ('Subject', 'subject'),
+        ('Body', 'body'),
+        ('Client', 'client__name'),
+        ('Contact email', 'contact__email'),
+        ('Created by', 'created_by__email'),
+        ('Created', 'created_at'),
+    ]),
+}
+EXPORT_KINDS_BY_MODEL = {model: kind for kind, (model, _columns) in EXPORT_COLUMNS.items()}
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+# Spreadsheet apps evaluate cells starting with these as formulas
+FORMULA_PREFIXES = '=+-@\t\r'
+NUMBER_PATTERN = re.compile(r'[+-]?[\d\s().-]+')
+ILLEGAL_XML_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+# Output is yielded once this much has accumulated, keeping chunks few
+# and memory flat.
+FLUSH_BYTES = 64 * 1024
+
+def chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+def export_rows(queryset, lookups):
+    """
+    Yield value tuples for ``lookups``, fetched ``EXPORT_CHUNK_SIZE`` rows at
+    a time so no more than one chunk of rows is held in memory.
+    """
+    return queryset.values_list(*lookups).iterator(chunk_size=chunk_size())
+
+def _lookup_field(model, lookup):
+    *relations, name = lookup.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+def _join(value):
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return ', '.join(str(item) for item in value)
+    return str(value)
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+def _csv_bool(value):
+    return None if value is None else ('true' if value else 'false')
+
+def _csv_text(value):
+    # Phone numbers and negative numbers are left alone
+    if value and value[0] in FORMULA_PREFIXES and not NUMBER_PATTERN.fullmatch(value):
+        return "'" + value
+    return value
+
+def _csv_json(value):
+    return _csv_text(_join(value))
+
+def column_converters(model, lookups, fmt):
+    """
+    Return [(index, converter)] for the columns whose values need turning
+    into text for ``fmt``. Converters are picked once per column from the
+    model field, so the per-row work is a handful of function calls; ints,
+    UUIDs and None are written as they come.
+    """
+    converters = []
+    for index, lookup in enumerate(lookups):
+        field = _lookup_field(model, lookup)
+        if isinstance(field, models.BooleanField):
+            converter = _csv_bool if fmt == 'csv' else None
+        elif isinstance(field, models.JSONField):
+            converter = _csv_json if fmt == 'csv' else _join
+        elif isinstance(field, models.DateField):
+            converter = _isoformat
+        elif isinstance(field, (models.CharField, models.TextField)):
+            converter = _csv_text if fmt == 'csv' else None
+        elif isinstance(field, (models.UUIDField, models.ForeignKey)):
+            converter = None if fmt == 'csv' else str
+        else:
+            converter = None
+        if converter is not None:
+            converters.append((index, converter))
+    return converters
+
+def convert_rows(rows, converters):
+    for row in rows:
+        row = list(row)
+        for index, converter in converters:
+            row[index] = converter(row[index])
+        yield row
+
+class _Buffer:
+    """
+    Write-only file object whose contents are taken with drain(). csv and
+    zipfile write into it; the response yields what has been written.
+    """
+
+    def __init__(self, empty=b''):
+        self.empty = empty
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = self.empty.join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+def stream_csv(headers, rows, compress=True):
+    """
+    Yield CSV as bytes, gzip-compressed incrementally when ``compress``.
+    The header row is flushed on its own so the first byte goes out before
+    the query has run.
+    """
+    buffer = _Buffer('')
+    writer = csv.writer(buffer)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def encode(text, final=False):
+        data = text.encode('utf-8')
+        if compressor is None:
+            return data
+        data = compressor.compress(data)
+        return data + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+    # A BOM lets Excel detect UTF-8
+    writer.writerow(headers)
+    yield encode('\ufeff' + buffer.drain())
+    for row in rows:
+        writer.writerow(row)
+        if buffer.size >= FLUSH_BYTES:
+            data = buffer.drain().encode('utf-8')
+            if compressor is None:
+                yield data
+            else:
+                data = compressor.compress(data)
+                if data:
+                    yield data
+    yield encode(buffer.drain(), final=True)
+
+def _column_letter(index):
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+def _xlsx_cell(reference, value):
+    if not value and value != 0:
+        return ''
+    if isinstance(value, bool):
+        return f'<c r="{reference}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{reference}"><v>{value}</v></c>'
+    text = escape(ILLEGAL_XML_CHARS.sub('', value))
+    return f'<c r="{reference}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+def _xlsx_row(number, letters, values):
+    cells = ''.join(_xlsx_cell(f'{letter}{number}', value) for letter, value in zip(letters, values))
+    return f'<row r="{number}">{cells}</row>'
+
+XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="xl/workbook.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>'
+)
+XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+    '</Relationships>'
+)
+
+def stream_xlsx(headers, rows, sheet_name='Export'):
+    """
+    Yield a single-sheet XLSX workbook as it is written. The zip is
+    written to an unseekable buffer, so zipfile streams each part with a
+    trailing data descriptor instead of seeking back, and the sheet is
+    deflated row by row rather than built in memory first.
+    """
+    buffer = _Buffer()
+    letters = [_column_letter(index) for index in range(len(headers))]
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', XLSX_CONTENT_TYPES)
+        archive.writestr('_rels/.rels', XLSX_ROOT_RELS)
+        archive.writestr('xl/workbook.xml', XLSX_WORKBOOK.format(name=escape(sheet_name[:31])))
+        archive.writestr('xl/_rels/workbook.xml.rels', XLSX_WORKBOOK_RELS)
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<sheetData>' + _xlsx_row(1, letters, headers)
+            ).encode('utf-8'))
+            yield buffer.drain()
+            pending = []
+            pending_size = 0
+            for number, row in enumerate(rows, start=2):
+                pending.append(_xlsx_row(number, letters, row))
+                pending_size += len(pending[-1])
+                if pending_size >= FLUSH_BYTES:
+                    sheet.write(''.join(pending).encode('utf-8'))
+                    pending, pending_size = [], 0
+                    if buffer.size:
+                        yield buffer.drain()
+            sheet.write((''.join(pending) + '</sheetData></worksheet>').encode('utf-8'))
+    yield buffer.drain()
+
+def accepts_gzip(request):
+    return 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+
+def export_filename(kind, fmt):
+    return f'{kind}s-{timezone.now():%Y%m%d-%H%M%S}.{fmt}'
+
+def stream_export(request, queryset, fmt='csv'):
+    """
+    Return a StreamingHttpResponse exporting ``queryset`` (a Client,
+    Contact, Lead or Communication queryset) as CSV, gzip-encoded when the
+    client accepts it, or as XLSX.
+    """
+    kind = EXPORT_KINDS_BY_MODEL[queryset.model]
+    _model, columns = EXPORT_COLUMNS[kind]
+    headers = [header for header, _lookup in columns]
+    lookups = [lookup for _header, lookup in columns]
+    rows = convert_rows(
+        export_rows(queryset, lookups),
+        column_converters(queryset.model, lookups, fmt),
+    )
+
+    if fmt == 'xlsx':
+        response = StreamingHttpResponse(
+            stream_xlsx(headers, rows, sheet_name=f'{kind.title()}s'),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+    else:
+        compress = accepts_gzip(request)
+        response = StreamingHttpResponse(
+            stream_csv(headers, rows, compress=compress),
+            content_type='text/csv; charset=utf-8',
+        )
+        if compress:
+            # Set before GZipMiddleware sees the response, so it is not
+            # compressed twice.
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(kind, fmt)}"'
+    # Ask nginx-style proxies not to buffer the whole body before sending it
+    response['X-Accel-Buffering'] = 'no'
+    return response
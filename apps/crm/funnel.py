@@ -0,0 +1,169 @@
+from bisect import bisect_left
+from collections import Counter
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from .models import Lead, LeadStatusTransition, LeadFunnelCounter, LeadStageDurationBucket
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+# Upper bounds in seconds of the time-in-stage buckets; the last bucket
+# holds everything longer than 90 days
+DURATION_BUCKETS = (HOUR, 6 * HOUR, DAY, 3 * DAY, 7 * DAY, 14 * DAY, 30 * DAY, 60 * DAY, 90 * DAY)
+# Statuses in funnel order; a move to a later one counts as progress
+FUNNEL_STAGES = ('new', 'contacted', 'qualified', 'converted')
+
+def duration_bucket(seconds):
+    return bisect_left(DURATION_BUCKETS, seconds)
+
+def _add(model, lookup, deltas):
+    """
+    UPDATE ... SET field = field + n for one counter row, creating it if
+    it does not exist yet.
+    """
+    rows = model.objects.filter(**lookup)
+    if rows.update(**{name: F(name) + delta for name, delta in deltas.items()}):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # Created concurrently since the UPDATE
+        rows.update(**{name: F(name) + delta for name, delta in deltas.items()})
+
+def record_transitions(tenant_id, changes, at=None):
+    """
+    Append (lead id, from status, to status, lead created_at) changes to the
+    history and advance the tenant's funnel counters and stage-duration
+    histograms, in the caller's transaction. from status is blank for a
+    new lead. Returns the transitions written.
+    """
+    changes = [change for change in changes if change[1] != change[2]]
+    if not changes:
+        return []
+    at = at or timezone.now()
+    # Time in stage runs from the lead's previous transition, or its creation
+    last_changed = dict(
+        LeadStatusTransition.objects.filter(lead_id__in=[change[0] for change in changes])
+        .order_by().values('lead_id').annotate(last=Max('changed_at')).values_list('lead_id', 'last')
+    )
+    transitions = []
+    counters = Counter()
+    seconds = Counter()
+    buckets = Counter()
+    for lead_id, from_status, to_status, created_at in changes:
+        in_stage = None
+        if from_status:
+            since = last_changed.get(lead_id) or created_at
+            in_stage = max(int((at - since).total_seconds()), 0) if since else None
+        transitions.append(LeadStatusTransition(
+            tenant_id=tenant_id, lead_id=lead_id, from_status=from_status or '', to_status=to_status,
+            seconds_in_stage=in_stage, changed_at=at,
+        ))
+        counters[(from_status or '', to_status)] += 1
+        if in_stage is not None:
+            seconds[(from_status, to_status)] += in_stage
+            buckets[(from_status, duration_bucket(in_stage))] += 1
+    LeadStatusTransition.objects.bulk_create(transitions)
+    # In a fixed order so concurrent writers lock counter rows alike
+    for (from_status, to_status), count in sorted(counters.items()):
+        _add(
+            LeadFunnelCounter,
+            {'tenant_id': tenant_id, 'from_status': from_status, 'to_status': to_status},
+            {'count': count, 'total_seconds': seconds[(from_status, to_status)]},
+        )
+    for (status, bucket), count in sorted(buckets.items()):
+        _add(LeadStageDurationBucket, {'tenant_id': tenant_id, 'status': status, 'bucket': bucket}, {'count': count})
+    return transitions
+
+def record_created(leads):
+    """
+    Record the initial status of leads written with bulk_create, which
+    sends no post_save.
+    """
+    rows = list(leads.order_by().values_list('tenant_id', 'id', 'status', 'created_at'))
+    if rows:
+        record_transitions(rows[0][0], [(lead_id, '', status, created_at) for _tenant_id, lead_id, status, created_at in rows])
+
+def set_status(lead, status):
+    """
+    Move a lead to ``status``, writing only the changed columns. The
+    post_save receiver records the transition in the same transaction.
+    """
+    with transaction.atomic():
+        lead.status = status
+        lead.save(update_fields=['status', 'updated_at'])
+    return lead
+
+def _percentile(histogram, fraction):
+    """
+    Upper bound in seconds of the bucket holding the given share of
+    ``histogram`` ({bucket: count}); None past the last bound.
+    """
+    total = sum(histogram.values())
+    if not total:
+        return None
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= total * fraction:
+            return DURATION_BUCKETS[bucket] if bucket < len(DURATION_BUCKETS) else None
+    return None
+
+def funnel_report(tenant_id):
+    """
+    Conversion rates and stage velocity for a tenant, read from the
+    precomputed counters only: a few dozen rows however many leads and
+    transitions the tenant has.
+    """
+    counters = list(
+        LeadFunnelCounter.objects.filter(tenant_id=tenant_id)
+        .values_list('from_status', 'to_status', 'count', 'total_seconds')
+    )
+    histograms = {}
+    for status, bucket, count in LeadStageDurationBucket.objects.filter(tenant_id=tenant_id).values_list(
+        'status', 'bucket', 'count'
+    ):
+        histograms.setdefault(status, {})[bucket] = count
+
+    entered = Counter()
+    left = Counter()
+    advanced = Counter()
+    seconds = Counter()
+    for from_status, to_status, count, total_seconds in counters:
+        entered[to_status] += count
+        if from_status:
+            left[from_status] += count
+            seconds[from_status] += total_seconds
+            if (
+                from_status in FUNNEL_STAGES and to_status in FUNNEL_STAGES
+                and FUNNEL_STAGES.index(to_status) > FUNNEL_STAGES.index(from_status)
+            ):
+                advanced[from_status] += count
+
+    stages = []
+    for status, _label in Lead.LEAD_STATUS_CHOICES:
+        histogram = histograms.get(status, {})
+        stages.append({
+            'status': status,
+            'entered': entered[status],
+            'left': left[status],
+            'advanced': advanced[status],
+            'advance_rate': round(advanced[status] / entered[status], 4) if entered[status] else None,
+            'average_seconds': seconds[status] // left[status] if left[status] else None,
+            'median_seconds': _percentile(histogram, 0.5),
+            'p90_seconds': _percentile(histogram, 0.9),
+            'histogram': [histogram.get(bucket, 0) for bucket in range(len(DURATION_BUCKETS) + 1)],
+        })
+    created = sum(count for from_status, _to, count, _seconds in counters if not from_status)
+    return {
+        'created': created,
+        'converted': entered['converted'],
+        'conversion_rate': round(entered['converted'] / created, 4) if created else None,
+        'bucket_bounds': list(DURATION_BUCKETS),
+        'stages': stages,
+        'transitions': [
+            {'from': from_status or None, 'to': to_status, 'count': count}
+            for from_status, to_status, count, _seconds in counters
+        ],
+    }
@@ -0,0 +1,415 @@
+from django.conf import settings
+from django.contrib.auth.models import BaseUserManager
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.utils import timezone
+from apps.dashboard import metrics
+from common import query_cache
+from . import autocomplete, dedupe, funnel, scoring
+from .models import Client, Contact, Lead, ImportJob
+from .search import index_queryset
+import csv
+import io
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# kind -> model, the field matched against the (tenant, field) unique
+# constraint, and the columns an import may set. 'client' is a client name.
+IMPORT_SPECS = {
+    'client': {
+        'model': Client,
+        'key': 'name',
+        'fields': ('name', 'email', 'phone', 'website', 'address', 'tags', 'is_active'),
+        # A "Company" column in a client file is the client's own name
+        'aliases': {'client': 'name'},
+    },
+    'contact': {
+        'model': Contact,
+        'key': 'email',
+        'fields': ('first_name', 'last_name', 'email', 'phone', 'job_title', 'client', 'tags', 'is_primary', 'is_active'),
+    },
+    'lead': {
+        'model': Lead,
+        'key': 'email',
+        'fields': ('first_name', 'last_name', 'email', 'phone', 'source', 'status', 'client', 'notes', 'is_active'),
+    },
+}
+# Header spellings seen in other CRMs' exports and in ours
+HEADER_ALIASES = {
+    'active': 'is_active',
+    'primary': 'is_primary',
+    'company': 'client',
+    'company_name': 'client',
+    'client_name': 'client',
+    'organization': 'client',
+    'account': 'client',
+    'e_mail': 'email',
+    'email_address': 'email',
+    'phone_number': 'phone',
+    'firstname': 'first_name',
+    'lastname': 'last_name',
+    'title': 'job_title',
+    'url': 'website',
+}
+# Dashboard metric recounted after an import of each kind
+IMPORT_METRICS = {'client': 'new_clients', 'lead': 'leads'}
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y', 'x'}
+FALSE_VALUES = {'0', 'false', 'f', 'no', 'n'}
+SNIFF_BYTES = 16 * 1024
+
+class ImportFileError(Exception):
+    """
+    The file cannot be imported at all, e.g. a required column is missing.
+    """
+
+class _JobMoved(Exception):
+    pass
+
+def chunk_size():
+    return getattr(settings, 'IMPORT_CHUNK_SIZE', 2000)
+
+def normalize_header(header):
+    name = re.sub(r'[^a-z0-9]+', '_', header.strip().lower()).strip('_')
+    return HEADER_ALIASES.get(name, name)
+
+def map_columns(kind, headers):
+    """
+    Return {column index: field name} for the recognised headers. Raises
+    ImportFileError when a column the model requires is missing.
+    """
+    spec = IMPORT_SPECS[kind]
+    columns = {}
+    for index, header in enumerate(headers):
+        name = normalize_header(header)
+        name = spec.get('aliases', {}).get(name, name)
+        if name in spec['fields'] and name not in columns.values():
+            columns[index] = name
+    missing = [
+        name for name in spec['fields']
+        if name not in columns.values() and _is_required(spec['model']._meta.get_field(name))
+    ]
+    if spec['key'] not in columns.values() and spec['key'] not in missing:
+        missing.insert(0, spec['key'])
+    if missing:
+        raise ImportFileError(f'Missing required column(s): {", ".join(missing)}.')
+    return columns
+
+def _is_required(field):
+    return not field.blank and not field.has_default()
+
+def _clean_value(field, value):
+    value = value.strip()
+    if not value and field.has_default():
+        # A blank cell means the field's default, e.g. a lead's status, for
+        # new records; import_chunk keeps the current value of existing ones
+        return field.get_default()
+    if isinstance(field, models.BooleanField):
+        lowered = value.lower()
+        if not lowered:
+            return field.get_default()
+        if lowered in TRUE_VALUES:
+            return True
+        if lowered in FALSE_VALUES:
+            return False
+        raise ValidationError('Enter yes or no.')
+    if isinstance(field, models.JSONField):
+        return [tag.strip() for tag in re.split(r'[,;]', value) if tag.strip()]
+    if isinstance(field, models.IntegerField):
+        if not value:
+            return field.get_default()
+        try:
+            return int(value)
+        except ValueError:
+            raise ValidationError('Enter a whole number.')
+    if isinstance(field, models.EmailField):
+        value = BaseUserManager.normalize_email(value)
+    elif isinstance(field, models.URLField) and value and '://' not in value:
+        value = f'https://{value}'
+    if not value and field.null:
+        value = None
+    return field.clean(value, None)
+
+def clean_row(kind, columns, row):
+    """
+    Validate one CSV row. Returns (cleaned_data, errors); a 'client' value
+    is still a client name at this point.
+    """
+    model = IMPORT_SPECS[kind]['model']
+    cleaned = {}
+    errors = {}
+    for index, name in columns.items():
+        value = row[index] if index < len(row) else ''
+        if name == 'client':
+            value = value.strip()
+            if not value and _is_required(model._meta.get_field('client')):
+                errors[name] = ['This field cannot be blank.']
+            cleaned[name] = value
+            continue
+        try:
+            cleaned[name] = _clean_value(model._meta.get_field(name), value)
+        except ValidationError as e:
+            errors[name] = e.messages
+    return cleaned, errors
+
+def _blank_defaults(model, columns, row):
+    """
+    The columns of ``row`` left blank whose field has a default.
+    """
+    return {
+        name for index, name in columns.items()
+        if name != 'client'
+        and not (row[index] if index < len(row) else '').strip()
+        and model._meta.get_field(name).has_default()
+    }
+
+def _keep_current_values(model, tenant, key, by_key, blanks):
+    """
+    Replace the defaults filled into blank cells of rows matching existing
+    records with those records' current values, so a blank cell leaves the
+    column as it is rather than resetting it.
+    """
+    names = set().union(*blanks.values()) if blanks else set()
+    if not names:
+        return
+    current = {
+        row[key]: row
+        for row in model.objects.filter(tenant=tenant, **{f'{key}__in': list(blanks)}).values(key, *names)
+    }
+    for value, blank_names in blanks.items():
+        if value in current:
+            for name in blank_names:
+                by_key[value][name] = current[value][name]
+
+def _resolve_clients(tenant, rows, errors):
+    """
+    Replace client names with ids, moving rows that name an unknown client
+    to ``errors``.
+    """
+    names = {cleaned['client'] for _number, cleaned in rows if cleaned.get('client')}
+    if not names:
+        return rows
+    client_ids = dict(Client.objects.filter(tenant=tenant, name__in=names).values_list('name', 'pk'))
+    resolved = []
+    for number, cleaned in rows:
+        name = cleaned.pop('client', None)
+        if name and name not in client_ids:
+            errors.append({'row': number, 'errors': {'client': [f'Unknown client "{name}".']}})
+            continue
+        cleaned['client_id'] = client_ids.get(name)
+        resolved.append((number, cleaned))
+    return resolved
+
+def import_chunk(job, columns, rows):
+    """
+    Validate and upsert one chunk of (row number, values) pairs with a
+    single INSERT ... ON CONFLICT (tenant, key) DO UPDATE. Only the columns
+    present in the file are updated on existing records. Returns
+    (created, updated, errors).
+    """
+    spec = IMPORT_SPECS[job.kind]
+    model, key = spec['model'], spec['key']
+    errors = []
+    valid = []
+    blanks = {}
+    for number, row in rows:
+        cleaned, row_errors = clean_row(job.kind, columns, row)
+        if row_errors:
+            errors.append({'row': number, 'errors': row_errors})
+        else:
+            valid.append((number, cleaned))
+            blank_names = _blank_defaults(model, columns, row)
+            if blank_names:
+                blanks[cleaned[key]] = blank_names
+            else:
+                blanks.pop(cleaned[key], None)
+    if 'client' in columns.values():
+        valid = _resolve_clients(job.tenant, valid, errors)
+
+    # A key repeated within the chunk would hit the same row twice in one
+    # statement, which PostgreSQL rejects; the last occurrence wins.
+    by_key = {cleaned[key]: cleaned for _number, cleaned in valid}
+    if not by_key:
+        return 0, 0, errors
+    matches = model.objects.filter(tenant=job.tenant, **{f'{key}__in': list(by_key)})
+    if model is Lead:
+        # Statuses before the upsert, for the status history
+        previous = dict(matches.values_list(key, 'status'))
+        existing = set(previous)
+    else:
+        existing = set(matches.values_list(key, flat=True))
+    _keep_current_values(
+        model, job.tenant, key, by_key,
+        {value: names for value, names in blanks.items() if value in existing and value in by_key},
+    )
+    update_fields = [name for name in columns.values() if name != key] + ['updated_at']
+    model.objects.bulk_create(
+        [model(tenant=job.tenant, **cleaned) for cleaned in by_key.values()],
+        update_conflicts=True,
+        unique_fields=['tenant', key],
+        update_fields=update_fields,
+    )
+    query_cache.bump_on_commit(job.tenant_id, model)
+    if model is Lead:
+        _record_status_changes(job.tenant, by_key, previous)
+    updated = len(existing)
+    return len(by_key) - updated, updated, errors
+
+def _record_status_changes(tenant, by_key, previous):
+    """
+    bulk_create sends no post_save, so record the status each new lead
+    starts in and each status the file changed.
+    """
+    changed = {
+        email: (previous.get(email, ''), cleaned.get('status', previous.get(email, 'new')))
+        for email, cleaned in by_key.items()
+    }
+    changed = {email: statuses for email, statuses in changed.items() if statuses[0] != statuses[1]}
+    if not changed:
+        return
+    leads = Lead.objects.filter(tenant=tenant, email__in=list(changed)).values_list('email', 'pk', 'created_at')
+    funnel.record_transitions(tenant.pk, [
+        (lead_id, *changed[email], created_at) for email, lead_id, created_at in leads
+    ])
+
+def _open_rows(job):
+    """
+    Return (binary file, csv reader) for the job's upload. The delimiter is
+    sniffed from the start of the file so ; and tab separated exports work.
+    """
+    raw = job.file.open('rb')
+    sample = raw.read(SNIFF_BYTES).decode('utf-8-sig', errors='replace')
+    raw.seek(0)
+    try:
+        delimiter = csv.Sniffer().sniff(sample[:sample.rfind('\n') + 1] or sample, delimiters=',;\t|').delimiter
+    except csv.Error:
+        delimiter = ','
+    text = io.TextIOWrapper(raw, encoding='utf-8-sig', errors='replace', newline='')
+    return raw, csv.reader(text, delimiter=delimiter)
+
+def _record_chunk(job, rows_read, bytes_read, created, updated, errors):
+    """
+    Advance the job's counters in the chunk's transaction. The UPDATE only
+    matches if no other worker has moved the job on and it has not been
+    cancelled; otherwise the chunk is rolled back.
+    """
+    max_errors = getattr(settings, 'IMPORT_MAX_ERRORS', 1000)
+    kept_errors = job.errors + errors[:max(max_errors - len(job.errors), 0)]
+    matched = ImportJob.objects.filter(
+        pk=job.pk, status='running', rows_processed=job.rows_processed
+    ).update(
+        rows_processed=job.rows_processed + rows_read,
+        bytes_processed=bytes_read,
+        created_count=job.created_count + created,
+        updated_count=job.updated_count + updated,
+        error_count=job.error_count + len(errors),
+        errors=kept_errors,
+        updated_at=timezone.now(),
+    )
+    if not matched:
+        return False
+    job.rows_processed += rows_read
+    job.bytes_processed = bytes_read
+    job.created_count += created
+    job.updated_count += updated
+    job.error_count += len(errors)
+    job.errors = kept_errors
+    return True
+
+def run_import(job_id, time_limit=None):
+    """
+    Import a job's file chunk by chunk, starting after the rows already
+    processed. Returns True when the job is finished (or was stopped) and
+    False when ``time_limit`` seconds ran out first.
+    """
+    job = ImportJob.objects.select_related('tenant').get(pk=job_id)
+    if job.status not in ('pending', 'running'):
+        return True
+    if job.status == 'pending':
+        ImportJob.objects.filter(pk=job.pk, status='pending').update(
+            status='running', started_at=timezone.now(), updated_at=timezone.now()
+        )
+        job.refresh_from_db()
+        if job.status != 'running':
+            return True
+
+    started = time.monotonic()
+    raw, reader = _open_rows(job)
+    try:
+        try:
+            columns = map_columns(job.kind, next(reader, []))
+        except ImportFileError as e:
+            _finish(job, 'failed', str(e))
+            return True
+
+        # Row numbers count the header as row 1, as spreadsheets do
+        for _skipped in range(job.rows_processed):
+            if next(reader, None) is None:
+                break
+        number = job.rows_processed + 1
+        size = chunk_size()
+        while True:
+            rows = []
+            for row in reader:
+                number += 1
+                if any(value.strip() for value in row):
+                    rows.append((number, row))
+                if number - 1 - job.rows_processed >= size:
+                    break
+            rows_read = number - 1 - job.rows_processed
+            if not rows_read:
+                break
+            try:
+                with transaction.atomic():
+                    created, updated, errors = import_chunk(job, columns, rows)
+                    if not _record_chunk(job, rows_read, raw.tell(), created, updated, errors):
+                        raise _JobMoved
+            except _JobMoved:
+                logger.info('Import %s was cancelled or resumed elsewhere; stopping', job.pk)
+                return True
+            if time_limit and time.monotonic() - started >= time_limit:
+                return False
+    finally:
+        raw.close()
+
+    _finish(job, 'completed')
+    return True
+
+def index_imported_records(job):
+    """
+    Bring the search and autocomplete indexes, duplicate candidates, lead
+    scores and dashboard metrics up to date for every record the job wrote.
+    bulk_create sends no post_save, and indexing costs more than the upsert
+    itself, so it runs once the import has finished rather than per chunk.
+    Returns the search documents rewritten.
+    """
+    model = IMPORT_SPECS[job.kind]['model']
+    since = job.started_at or job.created_at
+    written = model.objects.filter(tenant_id=job.tenant_id, updated_at__gte=since)
+    rewritten = index_queryset(written)
+    if job.kind in autocomplete.AUTOCOMPLETE_MODELS:
+        autocomplete.build_index(job.tenant_id, job.kind)
+    if job.kind in dedupe.DEDUPE_MODELS:
+        dedupe.refresh_queryset(written)
+    if job.kind == 'lead':
+        scoring.rescore_queryset(written, job.tenant_id)
+    if job.kind in IMPORT_METRICS:
+        metrics.reconcile_tenant(job.tenant_id, [IMPORT_METRICS[job.kind]])
+    return rewritten
+
+def _finish(job, status, error=''):
+    now = timezone.now()
+    ImportJob.objects.filter(pk=job.pk, status='running').update(
+        status=status, last_error=error, finished_at=now, updated_at=now
+    )
+    job.refresh_from_db()
+    logger.info(
+        'Import %s %s: %d rows, %d created, %d updated, %d invalid',
+        job.pk, job.status, job.rows_processed, job.created_count, job.updated_count, job.error_count,
+    )
+
+def fail_import(job_id, error):
+    job = ImportJob.objects.get(pk=job_id)
+    _finish(job, 'failed', error)
@@ -0,0 +1,123 @@
+from django.conf import settings
+from django.contrib.auth.models import BaseUserManager
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from datetime import date
+from django.db import transaction
+from django.utils import timezone
+from apps.dashboard import metrics
+from common import query_cache
+from .funnel import record_created
+from .models import Lead
+from .dedupe import refresh_queryset
+from .scoring import rescore_queryset
+from .search import index_queryset
+
+# Fields refreshed when an incoming lead matches an existing (tenant, email);
+# status and notes stay as the sales team left them.
+LEAD_UPSERT_FIELDS = ['first_name', 'last_name', 'phone', 'source', 'updated_at']
+LEAD_TEXT_FIELDS = ('first_name', 'last_name', 'phone')
+
+def extract_lead_items(data):
+    """
+    Return the list of lead payloads in a webhook body, which may be a
+    single object, a bare array or an object with a ``leads`` array.
+    """
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict) and isinstance(data.get('leads'), list):
+        return data['leads']
+    return [data]
+
+def clean_lead(item):
+    """
+    Validate one payload item. Returns (cleaned_data, errors).
+    """
+    if not isinstance(item, dict):
+        return None, {'__all__': ['Expected an object.']}
+
+    errors = {}
+    cleaned = {}
+    email = BaseUserManager.normalize_email(str(item.get('email') or '').strip())
+    try:
+        validate_email(email)
+    except ValidationError:
+        errors['email'] = ['Enter a valid email address.']
+    cleaned['email'] = email
+
+    for field in LEAD_TEXT_FIELDS:
+        value = str(item.get(field) or '').strip()
+        max_length = Lead._meta.get_field(field).max_length
+        if len(value) > max_length:
+            errors[field] = [f'Ensure this value has at most {max_length} characters.']
+        cleaned[field] = value
+    return cleaned, errors
+
+def ingest_leads(tenant, items, source, batch_size=None):
+    """
+    Validate and upsert a list of lead payloads for a tenant.
+
+    Valid items are written with one INSERT ... ON CONFLICT (tenant, email)
+    DO UPDATE per batch. The search index, duplicate candidates, scores and
+    dashboard metrics of each batch are brought up to date by an
+    index_ingested_leads task once it commits, so the webhook request only
+    pays for the upsert. Returns one result dict per item, in order, with a
+    ``status`` of created, updated, duplicate (repeated email within the
+    payload) or invalid.
+    """
+    from .tasks import index_ingested_leads
+
+    batch_size = batch_size or getattr(settings, 'LEAD_INGEST_BATCH_SIZE', 1000)
+    results = []
+    pending = {}
+    for index, item in enumerate(items):
+        cleaned, errors = clean_lead(item)
+        if errors:
+            results.append({'index': index, 'status': 'invalid', 'errors': errors})
+        elif cleaned['email'] in pending:
+            results.append({'index': index, 'status': 'duplicate', 'email': cleaned['email']})
+        else:
+            result = {'index': index, 'status': None, 'email': cleaned['email']}
+            pending[cleaned['email']] = (cleaned, result)
+            results.append(result)
+
+    batch = list(pending.values())
+    for start in range(0, len(batch), batch_size):
+        chunk = batch[start:start + batch_size]
+        emails = [cleaned['email'] for cleaned, _result in chunk]
+        with transaction.atomic():
+            existing = set(
+                Lead.objects.filter(tenant=tenant, email__in=emails)
+                .values_list('email', flat=True)
+            )
+            Lead.objects.bulk_create(
+                [
+                    Lead(tenant=tenant, source=source, status='new', is_active=True, **cleaned)
+                    for cleaned, _result in chunk
+                ],
+                update_conflicts=True,
+                unique_fields=['tenant', 'email'],
+                update_fields=LEAD_UPSERT_FIELDS,
+            )
+            # The funnel counters and cached pages must not disagree with
+            # the leads, so these stay in the batch; bulk_create sends no
+            # post_save, and everything else derived waits for the task
+            if len(existing) < len(chunk):
+                record_created(Lead.objects.filter(tenant=tenant, email__in=emails).exclude(email__in=existing))
+            query_cache.bump_on_commit(tenant.pk, Lead)
+            args = (str(tenant.pk), emails, len(chunk) - len(existing), timezone.localdate().isoformat())
+            transaction.on_commit(lambda args=args: index_ingested_leads.delay(*args))
+        for cleaned, result in chunk:
+            result['status'] = 'updated' if cleaned['email'] in existing else 'created'
+    return results
+
+def index_ingested_leads(tenant_id, emails, created, day):
+    """
+    Bring the search index, duplicate candidates, scores and the day's new
+    lead count up to date for one batch written by ingest_leads.
+    """
+    written = Lead.objects.filter(tenant_id=tenant_id, email__in=emails)
+    index_queryset(written)
+    refresh_queryset(written)
+    rescore_queryset(written, tenant_id)
+    metrics.apply({(tenant_id, date.fromisoformat(day), 'leads', 'new'): created})
@@ -0,0 +1,115 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from apps.core.models import Tenant
+from apps.crm import views
+from common.pagination import KeysetPaginator
+import re
+import uuid
+
+LIST_VIEWS = (
+    views.ClientListView,
+    views.ContactListView,
+    views.LeadListView,
+    views.CommunicationListView,
+    views.DocumentListView,
+)
+
+# Plan fragments that mean a full table scan or an explicit sort step
+PLAN_PROBLEMS = {
+    'sqlite': [
+        (re.compile(r'\bSCAN (?!.*\bUSING (COVERING )?INDEX\b)\S+'), 'sequential scan'),
+        (re.compile(r'USE TEMP B-TREE FOR ORDER BY'), 'filesort'),
+    ],
+    'postgresql': [
+        (re.compile(r'\bSeq Scan\b'), 'sequential scan'),
+        (re.compile(r'\bSort\b'), 'filesort'),
+    ],
+    'mysql': [
+        (re.compile(r'\bALL\b'), 'sequential scan'),
+        (re.compile(r'Using filesort'), 'filesort'),
+    ],
+}
+
+def find_plan_problems(plan, vendor):
+    """
+    Return a list of (problem, plan line) pairs for the given EXPLAIN output.
+    """
+    problems = []
+    for line in plan.splitlines():
+        for pattern, problem in PLAN_PROBLEMS.get(vendor, []):
+            if pattern.search(line):
+                problems.append((problem, line.strip()))
+    return problems
+
+class Command(BaseCommand):
+    help = ('Run EXPLAIN on the query behind each CRM list view (first page and '
+            'a seek page) and fail if any of them falls back to a sequential '
+            'scan or a filesort.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant',
+            help='Slug of the tenant to explain against. Defaults to the first tenant.',
+        )
+        parser.add_argument(
+            '--show-plans', action='store_true',
+            help='Print the full plan for every query.',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in PLAN_PROBLEMS:
+            raise CommandError(f'Plan checks are not supported on {connection.vendor}.')
+
+        if options['tenant']:
+            tenant = Tenant.objects.filter(slug=options['tenant']).first()
+            if tenant is None:
+                raise CommandError(f"Tenant '{options['tenant']}' does not exist.")
+        else:
+            tenant = Tenant.objects.first()
+
+        failures = 0
+        for view_class in LIST_VIEWS:
+            for label, queryset in self.get_querysets(view_class, tenant):
+                plan = self.explain(queryset)
+                problems = find_plan_problems(plan, connection.vendor)
+                name = f'{view_class.__name__} ({label})'
+                if options['show_plans']:
+                    self.stdout.write(f'{name}:\n{plan}\n')
+                if problems:
+                    failures += 1
+                    for problem, line in problems:
+                        self.stderr.write(self.style.ERROR(f'{name}: {problem}: {line}'))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f'{name}: ok'))
+
+        if failures:
+            raise CommandError(f'{failures} list view queries are not served by an index.')
+
+    def get_querysets(self, view_class, tenant):
+        request = RequestFactory().get('/')
+        # The plan does not depend on the tenant, so any id will do
+        request.tenant = tenant.pk if tenant else uuid.uuid4()
+        request.user = AnonymousUser()
+        view = view_class()
+        view.setup(request)
+        paginator = KeysetPaginator(
+            view.get_queryset(), view.get_paginate_by(None), ordering=view.keyset_ordering
+        )
+        yield 'first page', paginator.page_queryset()
+
+        sample = paginator.queryset.order_by(*paginator.ordering).first()
+        if sample is not None:
+            yield 'seek page', paginator.page_queryset(paginator.position(sample))
+
+    def explain(self, queryset):
+        if connection.vendor != 'postgresql':
+            return queryset.explain()
+        # Small tables make the planner prefer scans and sorts regardless of
+        # indexes; disabling both shows whether an index could serve the query.
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('SET LOCAL enable_sort = off')
+            return queryset.explain()
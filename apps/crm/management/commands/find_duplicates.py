@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.core.models import Tenant
+from apps.crm import dedupe
+
+class Command(BaseCommand):
+    help = ('Recompute the dedupe keys of every lead and contact and score each '
+            'group of records sharing a key, replacing the open duplicate '
+            'candidates. Dismissed and merged pairs keep their status.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant',
+            help='Slug of the tenant to scan. Defaults to every tenant.',
+        )
+        parser.add_argument(
+            '--kind', action='append', choices=list(dedupe.DEDUPE_MODELS),
+            help='Record type to scan; may be repeated. Defaults to all of them.',
+        )
+
+    def handle(self, *args, **options):
+        tenants = Tenant.objects.all()
+        if options['tenant']:
+            tenants = tenants.filter(slug=options['tenant'])
+            if not tenants.exists():
+                raise CommandError(f"Tenant '{options['tenant']}' does not exist.")
+
+        for tenant in tenants:
+            for kind in options['kind'] or dedupe.DEDUPE_MODELS:
+                found = dedupe.rebuild_tenant(tenant.pk, kind)
+                self.stdout.write(f'{tenant.slug} {kind}: {found} candidate pairs.')
@@ -0,0 +1,84 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from apps.core.models import Tenant
+from apps.crm import synthetic
+from apps.crm.models import Communication, Lead
+
+class Command(BaseCommand):
+    help = ('Generate synthetic tenants with users, roles, clients, contacts, leads, '
+            'communications and documents for capacity testing. Rows are written '
+            'with bulk_create in batches while signal receivers are muted; the same '
+            'seed and options always give the same data.')
+
+    def add_arguments(self, parser):
+        defaults = synthetic.DEFAULTS
+        parser.add_argument('--tenants', type=int, default=1, help='Tenants to create.')
+        parser.add_argument('--prefix', default='synthetic', help='Tenants are named <prefix>-1, <prefix>-2, ...')
+        parser.add_argument('--domain-suffix', default='localhost', help='Tenants are served at <slug>.<suffix>.')
+        parser.add_argument('--users', type=int, default=defaults['users'], help='Users per tenant.')
+        parser.add_argument('--clients', type=int, default=defaults['clients'], help='Clients per tenant.')
+        for name, help_text in (
+            ('contacts_per_client', 'Contacts per client'),
+            ('leads_per_client', 'Leads per client'),
+            ('communications_per_contact', 'Communications per contact'),
+            ('documents_per_client', 'Documents per client'),
+        ):
+            parser.add_argument(
+                f"--{name.replace('_', '-')}", default=str(defaults[name]),
+                help=f'{help_text}: N, LOW:HIGH (uniform) or ~MEAN (long-tailed). Default {defaults[name]}.',
+            )
+        for name, help_text in (
+            ('status_mix', 'Lead status weights'),
+            ('source_mix', 'Lead source weights'),
+            ('communication_mix', 'Communication type weights'),
+        ):
+            parser.add_argument(
+                f"--{name.replace('_', '-')}", default=str(defaults[name]),
+                help=f'{help_text}, e.g. "{defaults[name]}".',
+            )
+        parser.add_argument('--days', type=int, default=defaults['days'], help='Spread records over this many days.')
+        parser.add_argument('--anchor', type=date.fromisoformat, help='Last day of the spread (YYYY-MM-DD); defaults to today.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+        parser.add_argument('--batch-size', type=int, default=synthetic.BATCH_SIZE, help='Rows per INSERT.')
+        parser.add_argument('--search-index', action='store_true', help='Also build the search index.')
+        parser.add_argument('--skip-derived', action='store_true',
+                            help='Leave scores, metrics, funnel counters and the typeahead index unbuilt.')
+        parser.add_argument('--reset', action='store_true', help='Delete tenants with the same slugs first.')
+
+    def handle(self, *args, **options):
+        try:
+            distributions = {
+                name: synthetic.Distribution(options[name])
+                for name in ('contacts_per_client', 'leads_per_client', 'communications_per_contact', 'documents_per_client')
+            }
+            mixes = {
+                'status_mix': synthetic.Mix(options['status_mix'], [status for status, _label in Lead.LEAD_STATUS_CHOICES]),
+                'source_mix': synthetic.Mix(options['source_mix']),
+                'communication_mix': synthetic.Mix(
+                    options['communication_mix'], [kind for kind, _label in Communication.COMM_TYPE_CHOICES]
+                ),
+            }
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        slugs = [f"{options['prefix']}-{number}" for number in range(1, options['tenants'] + 1)]
+        existing = list(Tenant.objects.filter(slug__in=slugs))
+        if existing:
+            if not options['reset']:
+                raise CommandError(
+                    f"{', '.join(tenant.slug for tenant in existing)} already exist; pass --reset to recreate them."
+                )
+            synthetic.delete_tenants(existing)
+            self.stdout.write(f'Deleted {len(existing)} tenants.')
+
+        generator = synthetic.Generator(
+            seed=options['seed'], anchor=options['anchor'], batch_size=options['batch_size'], log=self.stdout.write,
+            users=options['users'], clients=options['clients'], days=options['days'], **distributions, **mixes,
+        )
+        tenants = generator.generate(slugs, options['domain_suffix'])
+        if not options['skip_derived']:
+            for tenant in tenants:
+                synthetic.build_derived(tenant, options['search_index'], log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(
+            'Created ' + ', '.join(f'{count} {name}s' for name, count in generator.counts.items())
+        ))
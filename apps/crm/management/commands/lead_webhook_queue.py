@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from apps.crm import webhook_queue
+import json
+
+class Command(BaseCommand):
+    help = 'Show lead webhook queue metrics, drain the queue or requeue dead letters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--drain', action='store_true',
+            help='Drain the queue in this process instead of waiting for Celery.',
+        )
+        parser.add_argument(
+            '--requeue-dead', type=int, nargs='?', const=-1, metavar='LIMIT',
+            help='Move dead-lettered payloads back onto the queue (all by default).',
+        )
+
+    def handle(self, *args, **options):
+        if options['requeue_dead'] is not None:
+            limit = None if options['requeue_dead'] < 0 else options['requeue_dead']
+            moved = webhook_queue.requeue_dead_letters(limit)
+            self.stdout.write(f'Requeued {moved} dead-lettered payloads.')
+        if options['drain']:
+            processed = webhook_queue.drain()
+            self.stdout.write(f'Processed {processed} queued payloads.')
+        self.stdout.write(json.dumps(webhook_queue.queue_stats(), indent=2))
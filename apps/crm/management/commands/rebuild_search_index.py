@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.core.models import Tenant
+from apps.crm import autocomplete, search
+from apps.crm.models import SearchDocument
+
+class Command(BaseCommand):
+    help = ('Bring the CRM search index up to date with the clients, contacts, '
+            'leads and communications it covers, and rebuild the client and '
+            'contact typeahead indexes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant',
+            help='Slug of the tenant to index. Defaults to every tenant.',
+        )
+        parser.add_argument(
+            '--kind', action='append', choices=list(search.INDEXED_MODELS),
+            help='Record type to index; may be repeated. Defaults to all of them.',
+        )
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Drop the existing index entries first instead of diffing them.',
+        )
+
+    def handle(self, *args, **options):
+        tenant = None
+        if options['tenant']:
+            tenant = Tenant.objects.filter(slug=options['tenant']).first()
+            if tenant is None:
+                raise CommandError(f"Tenant '{options['tenant']}' does not exist.")
+
+        for kind in options['kind'] or search.INDEXED_MODELS:
+            model = search.INDEXED_MODELS[kind][0]
+            queryset = model.objects.all()
+            documents = SearchDocument.objects.filter(kind=kind)
+            if tenant is not None:
+                queryset = queryset.filter(tenant=tenant)
+                documents = documents.filter(tenant=tenant)
+            if options['clear']:
+                documents.delete()
+            else:
+                # Entries whose record was deleted without a signal
+                documents.exclude(object_id__in=queryset.values('pk')).delete()
+            rewritten = search.index_queryset(queryset)
+            self.stdout.write(f'{kind}: {rewritten} index entries written.')
+
+            if kind in autocomplete.AUTOCOMPLETE_MODELS:
+                tenants = [tenant] if tenant is not None else Tenant.objects.all()
+                indexed = sum(autocomplete.build_index(t.pk, kind) for t in tenants)
+                self.stdout.write(f'{kind}: {indexed} records in the typeahead index.')
@@ -1,6 +1,7 @@
 from django.db import models
 from django.conf import settings
-from apps.core.models import TimeStampedModel, Tenant
+from django.core.validators import FileExtensionValidator
+from apps.core.models import DirtyFieldsMixin, TimeStampedModel, Tenant
 import uuid
 
 class Client(TimeStampedModel):
@@ -20,6 +21,13 @@ class Client(TimeStampedModel):
     class Meta:
         ordering = ['name']
         unique_together = ('tenant', 'name')
+        indexes = [
+            models.Index(
+                fields=['tenant', 'name', 'id'],
+                condition=models.Q(is_active=True),
+                name='crm_client_active_name_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -43,11 +51,18 @@ class Contact(TimeStampedModel):
     class Meta:
         ordering = ['last_name', 'first_name']
         unique_together = ('tenant', 'email')
+        indexes = [
+            models.Index(
+                fields=['tenant', 'last_name', 'first_name', 'id'],
+                condition=models.Q(is_active=True),
+                name='crm_contact_active_name_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
-class Lead(TimeStampedModel):
+class Lead(DirtyFieldsMixin, TimeStampedModel):
     """
     Lead model for tracking potential clients.
     """
@@ -75,11 +90,18 @@ class Lead(TimeStampedModel):
     class Meta:
         ordering = ['-created_at']
         unique_together = ('tenant', 'email')
+        indexes = [
+            models.Index(
+                fields=['tenant', '-created_at', 'id'],
+                condition=models.Q(is_active=True),
+                name='crm_lead_active_created_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.status})"
 
-class Communication(TimeStampedModel):
+class Communication(DirtyFieldsMixin, TimeStampedModel):
     """
     Communication log for clients and contacts.
     """
@@ -103,6 +125,9 @@ class Communication(TimeStampedModel):
 
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['tenant', '-date', 'id'], name='crm_comm_tenant_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.communication_type} with {self.client.name} on {self.date.strftime('%Y-%m-%d')}"
@@ -121,6 +146,238 @@ class Document(TimeStampedModel):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['tenant', '-created_at', 'id'], name='crm_doc_tenant_created_idx'),
+        ]
 
     def __str__(self):
         return f"Document for {self.client.name} uploaded on {self.created_at.strftime('%Y-%m-%d')}"
+
+class SearchDocument(models.Model):
+    """
+    One searchable CRM record in the tenant's search index. The title and
+    subtitle are copied here so results render without touching the
+    source tables.
+    """
+    KIND_CHOICES = [
+        ('client', 'Client'),
+        ('contact', 'Contact'),
+        ('lead', 'Lead'),
+        ('communication', 'Communication'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='search_documents')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.UUIDField()
+    title = models.CharField(max_length=255)
+    subtitle = models.CharField(max_length=255, blank=True)
+    # Hash of the indexed terms; an unchanged record skips the rewrite
+    checksum = models.CharField(max_length=40)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('kind', 'object_id')
+
+    def __str__(self):
+        return f"{self.kind}: {self.title}"
+
+class SearchPosting(models.Model):
+    """
+    A term occurring in a SearchDocument, weighted by the field it came
+    from. tenant is repeated here so lookups stay on one index.
+    """
+    id = models.BigAutoField(primary_key=True)
+    tenant_id = models.UUIDField()
+    term = models.CharField(max_length=64)
+    document = models.ForeignKey(SearchDocument, on_delete=models.CASCADE, related_name='postings')
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['tenant_id', 'term', 'document'], name='crm_search_term_idx'),
+        ]
+
+    def __str__(self):
+        return self.term
+
+class ImportJob(TimeStampedModel):
+    """
+    A CSV upload of clients, contacts or leads, imported in chunks by a
+    Celery task. rows_processed is committed with each chunk, so an
+    interrupted job resumes after the last chunk it wrote.
+    """
+    KIND_CHOICES = [
+        ('client', 'Clients'),
+        ('contact', 'Contacts'),
+        ('lead', 'Leads'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='import_jobs')
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='import_jobs')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    file = models.FileField(upload_to='crm/imports/', validators=[FileExtensionValidator(['csv', 'txt'])])
+    original_name = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    file_size = models.PositiveBigIntegerField(default=0)
+    bytes_processed = models.PositiveBigIntegerField(default=0)
+    rows_processed = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    # The first IMPORT_MAX_ERRORS invalid rows: [{'row': n, 'errors': {...}}]
+    errors = models.JSONField(default=list, blank=True)
+    last_error = models.TextField(blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['tenant', '-created_at'], name='crm_import_tenant_created_idx'),
+            models.Index(fields=['status', 'updated_at'], name='crm_import_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} import {self.original_name} ({self.status})"
+
+    @property
+    def progress(self):
+        """
+        Share of the file read so far, from 0 to 100.
+        """
+        if self.status == 'completed':
+            return 100
+        if not self.file_size:
+            return 0
+        return min(int(self.bytes_processed * 100 / self.file_size), 99)
+
+class DedupeKey(models.Model):
+    """
+    A normalized blocking key (email, phone or name) of a lead or contact.
+    Records sharing a key are compared for duplicates; records that share
+    none never are.
+    """
+    KIND_CHOICES = [
+        ('lead', 'Lead'),
+        ('contact', 'Contact'),
+    ]
+    KEY_TYPE_CHOICES = [
+        ('email', 'Email'),
+        ('phone', 'Phone'),
+        ('name', 'Name'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    tenant_id = models.UUIDField()
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.UUIDField()
+    key_type = models.CharField(max_length=10, choices=KEY_TYPE_CHOICES)
+    value = models.CharField(max_length=255)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['tenant_id', 'kind', 'key_type', 'value'], name='crm_dedupe_key_idx'),
+            models.Index(fields=['kind', 'object_id'], name='crm_dedupe_object_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}: {self.key_type}={self.value}"
+
+class DuplicateCandidate(TimeStampedModel):
+    """
+    A pair of leads or contacts that look like the same person, scored
+    from 0 to 1. object_a is always the smaller id so each pair has one row.
+    """
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('merged', 'Merged'),
+        ('dismissed', 'Dismissed'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='duplicate_candidates')
+    kind = models.CharField(max_length=20, choices=DedupeKey.KIND_CHOICES)
+    object_a = models.UUIDField()
+    object_b = models.UUIDField()
+    score = models.FloatField()
+    # Keys the pair shares and per-field similarities, for display
+    reasons = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open')
+
+    class Meta:
+        unique_together = ('kind', 'object_a', 'object_b')
+        indexes = [
+            models.Index(fields=['tenant', 'kind', 'status', '-score', 'id'], name='crm_duplicate_open_idx'),
+            models.Index(fields=['kind', 'object_b'], name='crm_duplicate_object_b_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_a} ~ {self.object_b} ({self.score:.2f})"
+
+class LeadStatusTransition(models.Model):
+    """
+    Append-only history of lead status changes, including the status a lead
+    was created with (from_status blank). Rows outlive the lead.
+    """
+    id = models.BigAutoField(primary_key=True)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='lead_status_transitions')
+    lead_id = models.UUIDField()
+    from_status = models.CharField(max_length=20, choices=Lead.LEAD_STATUS_CHOICES, blank=True)
+    to_status = models.CharField(max_length=20, choices=Lead.LEAD_STATUS_CHOICES)
+    # Time spent in from_status, since the previous transition
+    seconds_in_stage = models.PositiveIntegerField(null=True, blank=True)
+    changed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-changed_at']
+        indexes = [
+            models.Index(fields=['lead_id', '-changed_at'], name='crm_transition_lead_idx'),
+            models.Index(fields=['tenant', '-changed_at'], name='crm_transition_tenant_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.lead_id}: {self.from_status or '-'} -> {self.to_status}"
+
+class LeadFunnelCounter(models.Model):
+    """
+    Running count of one tenant's transitions between two statuses and the
+    total time leads spent in from_status before making them.
+    """
+    id = models.BigAutoField(primary_key=True)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='lead_funnel_counters')
+    from_status = models.CharField(max_length=20, choices=Lead.LEAD_STATUS_CHOICES, blank=True)
+    to_status = models.CharField(max_length=20, choices=Lead.LEAD_STATUS_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+    total_seconds = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('tenant', 'from_status', 'to_status')
+
+    def __str__(self):
+        return f"{self.from_status or '-'} -> {self.to_status}: {self.count}"
+
+class LeadStageDurationBucket(models.Model):
+    """
+    Histogram of the time leads spent in a status before leaving it; see
+    funnel.DURATION_BUCKETS for the bucket bounds.
+    """
+    id = models.BigAutoField(primary_key=True)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='lead_stage_durations')
+    status = models.CharField(max_length=20, choices=Lead.LEAD_STATUS_CHOICES)
+    bucket = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('tenant', 'status', 'bucket')
+
+    def __str__(self):
+        return f"{self.status} bucket {self.bucket}: {self.count}"
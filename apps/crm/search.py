@@ -0,0 +1,271 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, Q, Sum, Value, When
+from .models import Client, Contact, Lead, Communication, SearchDocument, SearchPosting
+import hashlib
+import re
+import unicodedata
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+PHONE_PATTERN = re.compile(r'\+?[\d\s().-]{6,}')
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = SearchPosting._meta.get_field('term').max_length
+MAX_QUERY_TERMS = 8
+MAX_TERM_WEIGHT = 1000
+# Fragments of nearly every email and URL; they would match the whole tenant
+STOP_TERMS = frozenset({'com', 'net', 'org', 'www', 'http', 'https', 'mailto'})
+
+def _name(obj):
+    return f'{obj.first_name} {obj.last_name}'.strip()
+
+def _communication_title(obj):
+    return obj.subject or obj.get_communication_type_display()
+
+# kind -> (model, {field: weight}, title, subtitle)
+INDEXED_MODELS = {
+    'client': (
+        Client,
+        {'name': 10, 'email': 8, 'phone': 8, 'tags': 5, 'website': 3, 'address': 1},
+        lambda obj: obj.name,
+        lambda obj: obj.email or obj.phone or '',
+    ),
+    'contact': (
+        Contact,
+        {'first_name': 10, 'last_name': 10, 'email': 8, 'phone': 8, 'tags': 5, 'job_title': 3},
+        _name,
+        lambda obj: obj.email,
+    ),
+    'lead': (
+        Lead,
+        {'first_name': 10, 'last_name': 10, 'email': 8, 'phone': 8, 'source': 2, 'notes': 1},
+        _name,
+        lambda obj: obj.email,
+    ),
+    'communication': (
+        Communication,
+        {'subject': 6, 'body': 1},
+        _communication_title,
+        lambda obj: obj.date.strftime('%Y-%m-%d') if obj.date else '',
+    ),
+}
+KINDS_BY_MODEL = {model: kind for kind, (model, *_rest) in INDEXED_MODELS.items()}
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', str(text))
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+def tokenize(value):
+    """
+    Split a value into lower-case, accent-free alphanumeric terms.
+    """
+    if value is None or value == '':
+        return []
+    if isinstance(value, (list, tuple)):
+        return [term for item in value for term in tokenize(item)]
+    return [
+        term for term in TOKEN_PATTERN.findall(normalize(value))
+        if MIN_TERM_LENGTH <= len(term) <= MAX_TERM_LENGTH and term not in STOP_TERMS
+    ]
+
+def field_terms(value):
+    """
+    Index terms for a field value. Phone numbers also get their digits run
+    together, whole and as the national and local number, so "5551234" and
+    "555-1234" both find "+1 (202) 555-1234".
+    """
+    terms = tokenize(value)
+    if isinstance(value, str) and PHONE_PATTERN.fullmatch(value.strip()):
+        digits = re.sub(r'\D', '', value)
+        terms.extend({digits, digits[-10:], digits[-7:]} - set(terms))
+    return terms
+
+def document_terms(kind, obj):
+    """
+    Return {term: weight} for a record, adding up the weights of every
+    field and occurrence a term appears in.
+    """
+    _model, fields, _title, _subtitle = INDEXED_MODELS[kind]
+    terms = {}
+    for field, weight in fields.items():
+        for term in field_terms(getattr(obj, field)):
+            terms[term] = min(terms.get(term, 0) + weight, MAX_TERM_WEIGHT)
+    return terms
+
+def _document_fields(kind, obj):
+    _model, _fields, title, subtitle = INDEXED_MODELS[kind]
+    terms = document_terms(kind, obj)
+    title = title(obj)[:255]
+    subtitle = (subtitle(obj) or '')[:255]
+    digest = hashlib.sha1(repr((sorted(terms.items()), title, subtitle)).encode()).hexdigest()
+    return terms, {'tenant_id': obj.tenant_id, 'title': title, 'subtitle': subtitle, 'checksum': digest}
+
+def is_indexable(obj):
+    return getattr(obj, 'is_active', True)
+
+def _postings(document, terms):
+    return [
+        SearchPosting(tenant_id=document.tenant_id, term=term, document=document, weight=weight)
+        for term, weight in terms.items()
+    ]
+
+def index_object(obj):
+    """
+    Add or refresh one record in the index. Records whose terms, title and
+    subtitle are unchanged cost a single SELECT.
+    """
+    kind = KINDS_BY_MODEL[type(obj)]
+    if not is_indexable(obj):
+        remove_object(obj)
+        return
+    terms, values = _document_fields(kind, obj)
+    document = SearchDocument.objects.filter(kind=kind, object_id=obj.pk).first()
+    if document is not None and document.checksum == values['checksum']:
+        return
+    with transaction.atomic():
+        if document is None:
+            document = SearchDocument.objects.create(kind=kind, object_id=obj.pk, **values)
+        else:
+            for name, value in values.items():
+                setattr(document, name, value)
+            document.save()
+            document.postings.all().delete()
+        SearchPosting.objects.bulk_create(_postings(document, terms))
+
+def remove_object(obj):
+    SearchDocument.objects.filter(kind=KINDS_BY_MODEL[type(obj)], object_id=obj.pk).delete()
+
+def index_queryset(queryset, batch_size=500):
+    """
+    Bring the index up to date for every record in ``queryset``, a batch
+    at a time with bulk statements. Used after bulk writes that send no
+    signals and by rebuild_search_index. Returns the documents rewritten.
+    """
+    kind = KINDS_BY_MODEL[queryset.model]
+    rewritten = 0
+    batch = []
+    for obj in queryset.order_by().iterator(chunk_size=batch_size):
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            rewritten += _index_batch(kind, batch)
+            batch = []
+    if batch:
+        rewritten += _index_batch(kind, batch)
+    return rewritten
+
+def _index_batch(kind, objects):
+    existing = {
+        document.object_id: document
+        for document in SearchDocument.objects.filter(kind=kind, object_id__in=[obj.pk for obj in objects])
+    }
+    removed, changed, created = [], [], []
+    for obj in objects:
+        document = existing.get(obj.pk)
+        if not is_indexable(obj):
+            if document is not None:
+                removed.append(document.pk)
+            continue
+        terms, values = _document_fields(kind, obj)
+        if document is None:
+            created.append((SearchDocument(kind=kind, object_id=obj.pk, **values), terms))
+        elif document.checksum != values['checksum']:
+            for name, value in values.items():
+                setattr(document, name, value)
+            changed.append((document, terms))
+
+    with transaction.atomic():
+        if removed:
+            SearchDocument.objects.filter(pk__in=removed).delete()
+        if changed:
+            SearchPosting.objects.filter(document__in=[document for document, _terms in changed]).delete()
+            SearchDocument.objects.bulk_update(
+                [document for document, _terms in changed],
+                ['tenant', 'title', 'subtitle', 'checksum', 'updated_at'],
+            )
+        if created:
+            SearchDocument.objects.bulk_create([document for document, _terms in created])
+        SearchPosting.objects.bulk_create(
+            [posting for document, terms in changed + created for posting in _postings(document, terms)],
+            batch_size=5000,
+        )
+    return len(changed) + len(created) + len(removed)
+
+def _prefix_upper_bound(prefix):
+    """
+    The smallest term greater than every term starting with ``prefix``,
+    or None. Terms are lower-case alphanumerics, where digits sort before
+    letters, so a range scan replaces LIKE 'prefix%' and can use the index.
+    """
+    while prefix:
+        last = prefix[-1]
+        if last == 'z':
+            prefix = prefix[:-1]
+            continue
+        return prefix[:-1] + ('a' if last == '9' else chr(ord(last) + 1))
+    return None
+
+def query_terms(query):
+    terms = []
+    for term in tokenize(query):
+        if term not in terms:
+            terms.append(term)
+    return terms[:MAX_QUERY_TERMS]
+
+def search(tenant, query, kinds=None, limit=20, offset=0):
+    """
+    Return (results, has_more) for a query within a tenant. Every query
+    term has to match; the last one also matches as a prefix so results
+    appear while typing. Results are ranked by the summed weight of the
+    matching terms, e.g. a name hit outranks a hit in a note.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return [], False
+
+    postings = SearchPosting.objects.filter(tenant_id=tenant.pk)
+    groups = [{term} for term in terms]
+    prefix_limit = getattr(settings, 'SEARCH_PREFIX_EXPANSIONS', 50)
+    expansions = postings.filter(term__gte=terms[-1])
+    upper = _prefix_upper_bound(terms[-1])
+    if upper:
+        expansions = expansions.filter(term__lt=upper)
+    groups[-1].update(
+        expansions.order_by('term').values_list('term', flat=True).distinct()[:prefix_limit]
+    )
+
+    terms = set().union(*groups)
+    matches = postings.filter(term__in=terms)
+    if kinds:
+        matches = matches.filter(document__kind__in=kinds)
+    ranked = matches.values('document_id').annotate(score=Sum('weight'))
+    if len(groups) > 1:
+        # Start from the rarest term: when it is selective, rank only the
+        # documents it occurs in instead of every posting of common terms.
+        sizes = postings.filter(term__in=terms).aggregate(**{
+            f'group_{index}': Count('pk', filter=Q(term__in=group))
+            for index, group in enumerate(groups)
+        })
+        rarest = min(range(len(groups)), key=lambda index: sizes[f'group_{index}'])
+        if not sizes[f'group_{rarest}']:
+            return [], False
+        if sizes[f'group_{rarest}'] <= getattr(settings, 'SEARCH_CANDIDATE_LIMIT', 5000):
+            candidates = postings.filter(term__in=groups[rarest]).values_list('document_id', flat=True)
+            ranked = ranked.filter(document_id__in=list(candidates))
+        matched_terms = Count(
+            Case(*[When(term__in=group, then=Value(index)) for index, group in enumerate(groups)]),
+            distinct=True,
+        )
+        ranked = ranked.annotate(matched=matched_terms).filter(matched=len(groups))
+    ranked = list(
+        ranked.order_by('-score', 'document_id')
+        .values_list('document_id', 'score')[offset:offset + limit + 1]
+    )
+    has_more = len(ranked) > limit
+    ranked = ranked[:limit]
+
+    documents = SearchDocument.objects.in_bulk([document_id for document_id, _score in ranked])
+    results = []
+    for document_id, score in ranked:
+        document = documents.get(document_id)
+        if document is not None:
+            results.append((document, score))
+    return results, has_more
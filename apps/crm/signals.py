@@ -1,2 +1,113 @@
-# Placeholder signals file for CRM app
-# Add signal handlers here as needed
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from common import query_cache
+from .models import Client, Contact, Lead, Communication, Document
+from . import autocomplete, dedupe, funnel, tasks
+from .search import index_object, remove_object
+
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=Contact)
+@receiver(post_save, sender=Lead)
+@receiver(post_save, sender=Communication)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    """
+    Re-index a CRM record once the transaction that saved it commits.
+    """
+    if raw:
+        return
+    transaction.on_commit(lambda: index_object(instance))
+
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=Contact)
+@receiver(post_delete, sender=Lead)
+@receiver(post_delete, sender=Communication)
+def remove_from_search_index(sender, instance, **kwargs):
+    remove_object(instance)
+
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=Contact)
+@receiver(post_save, sender=Lead)
+@receiver(post_save, sender=Communication)
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=Contact)
+@receiver(post_delete, sender=Lead)
+@receiver(post_delete, sender=Communication)
+@receiver(post_delete, sender=Document)
+def invalidate_query_cache(sender, instance, raw=False, **kwargs):
+    """
+    Move the tenant's cached pages and objects of this model to a new
+    generation once the write commits.
+    """
+    if raw:
+        return
+    query_cache.bump_on_commit(instance.tenant_id, sender)
+
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=Contact)
+def update_autocomplete_index(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(lambda: autocomplete.update_object(instance))
+
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=Contact)
+def remove_from_autocomplete_index(sender, instance, **kwargs):
+    transaction.on_commit(lambda: autocomplete.remove_object(instance))
+
+@receiver(post_save, sender=Lead)
+@receiver(post_save, sender=Contact)
+def update_duplicate_candidates(sender, instance, raw=False, **kwargs):
+    """
+    Compare a saved lead or contact with the records it shares a dedupe
+    key with, once the transaction commits.
+    """
+    if raw:
+        return
+    kind = dedupe.KINDS_BY_MODEL[sender]
+    transaction.on_commit(lambda: dedupe.refresh_records(kind, [instance.pk]))
+
+@receiver(post_delete, sender=Lead)
+@receiver(post_delete, sender=Contact)
+def remove_duplicate_candidates(sender, instance, **kwargs):
+    dedupe.remove_records(dedupe.KINDS_BY_MODEL[sender], [instance.pk])
+
+@receiver(post_save, sender=Communication)
+def rescore_client_leads(sender, instance, created=False, raw=False, **kwargs):
+    """
+    A new communication makes the client's leads more recent and engaged.
+    """
+    if raw or not created:
+        return
+    client_id = str(instance.client_id)
+    transaction.on_commit(lambda: tasks.rescore_client_leads.delay(client_id))
+
+@receiver(post_save, sender=Lead)
+@receiver(post_save, sender=Document)
+def rescore_lead(sender, instance, raw=False, **kwargs):
+    """
+    Score a lead when it is saved or gets a document. Scores are written
+    with queryset.update() (scoring.write_scores), which sends no
+    post_save, so this does not loop.
+    """
+    lead_id = instance.pk if sender is Lead else instance.lead_id
+    if raw or not lead_id:
+        return
+    transaction.on_commit(lambda: tasks.rescore_leads.delay([str(lead_id)]))
+
+@receiver(post_save, sender=Lead)
+def record_status_transition(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    """
+    Append a status change to the lead's history in the saving transaction,
+    so the history and funnel counters never disagree with the lead.
+    """
+    if raw:
+        return
+    if created:
+        from_status = ''
+    elif 'status' in instance.changed_fields and (update_fields is None or 'status' in update_fields):
+        from_status = instance.loaded_value('status')
+    else:
+        return
+    funnel.record_transitions(instance.tenant_id, [(instance.pk, from_status, instance.status, instance.created_at)])
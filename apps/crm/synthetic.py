@@ -0,0 +1,355 @@
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+from apps.accounts.models import Role, User, UserRole
+from apps.core.cache import invalidate_hosts
+from apps.core.models import Domain, Tenant, TenantSettings
+from apps.dashboard import metrics
+from common.signals import mute_signals
+from . import autocomplete, funnel, scoring, search
+from .models import Client, Contact, Lead, Communication, Document
+import random
+import uuid
+
+BATCH_SIZE = 5000
+PASSWORD = 'synthetic-password-1'
+ROLE_NAMES = ('Admin', 'Sales', 'Support', 'Viewer')
+
+FIRST_NAMES = (
+    'Ada', 'Alan', 'Barbara', 'Claude', 'Donald', 'Edsger', 'Frances', 'Grace', 'Hedy', 'Ivan',
+    'John', 'Katherine', 'Linus', 'Margaret', 'Niklaus', 'Radia', 'Ken', 'Sophie', 'Tim', 'Yukihiro',
+)
+LAST_NAMES = (
+    'Lovelace', 'Turing', 'Liskov', 'Shannon', 'Knuth', 'Dijkstra', 'Allen', 'Hopper', 'Lamarr',
+    'Sutherland', 'Backus', 'Johnson', 'Torvalds', 'Hamilton', 'Wirth', 'Perlman', 'Thompson',
+    'Wilson', 'Berners-Lee', 'Matsumoto',
+)
+COMPANY_WORDS = (
+    'Acme', 'Globex', 'Initech', 'Umbrella', 'Hooli', 'Vandelay', 'Stark', 'Wayne', 'Wonka', 'Tyrell',
+    'Cyberdyne', 'Soylent', 'Aperture', 'Massive', 'Dynamic', 'Oscorp', 'Nakatomi', 'Gringotts',
+)
+JOB_TITLES = ('CEO', 'CTO', 'Buyer', 'Office Manager', 'Engineer', 'Accountant', 'Marketing Lead')
+
+# Parents before children, the order batches are written in
+MODELS = (Client, Contact, Lead, Communication, Document)
+
+class Distribution:
+    """
+    How many children a record gets: "5" (always five), "1:5" (uniformly
+    one to five) or "~5" (five on average with a long tail, like real
+    accounts where a few clients have most of the leads).
+    """
+
+    def __init__(self, text):
+        self.text = str(text)
+        try:
+            if self.text.startswith('~'):
+                self.mean = float(self.text[1:])
+                self.low = self.high = None
+            else:
+                low, _colon, high = self.text.partition(':')
+                self.low, self.high, self.mean = int(low), int(high or low), None
+        except ValueError:
+            raise ValueError(f'Invalid distribution {text!r}; use N, LOW:HIGH or ~MEAN')
+        if (self.mean is not None and self.mean < 0) or (self.mean is None and not 0 <= self.low <= self.high):
+            raise ValueError(f'Invalid distribution {text!r}')
+
+    def sample(self, rng):
+        if self.mean is not None:
+            return int(rng.expovariate(1 / self.mean)) if self.mean else 0
+        return rng.randint(self.low, self.high)
+
+    def __str__(self):
+        return self.text
+
+class Mix:
+    """
+    Weighted choice among values: "new=40,contacted=25,lost=10".
+    """
+
+    def __init__(self, text, allowed=None):
+        self.text = text
+        self.weights = {}
+        for part in filter(None, (part.strip() for part in text.split(','))):
+            value, _equals, weight = part.partition('=')
+            try:
+                self.weights[value.strip()] = float(weight or 1)
+            except ValueError:
+                raise ValueError(f'Invalid weight in {text!r}')
+        unknown = set(self.weights) - set(allowed) if allowed else set()
+        if unknown:
+            raise ValueError(f'Unknown values in {text!r}: {", ".join(sorted(unknown))}')
+        if not self.weights or sum(self.weights.values()) <= 0:
+            raise ValueError(f'Invalid mix {text!r}')
+        self._values = list(self.weights)
+        self._cumulative = []
+        total = 0
+        for value in self._values:
+            total += self.weights[value]
+            self._cumulative.append(total)
+
+    def sample(self, rng):
+        return rng.choices(self._values, cum_weights=self._cumulative)[0]
+
+    def __str__(self):
+        return self.text
+
+DEFAULTS = {
+    'users': 5,
+    'clients': 100,
+    'contacts_per_client': Distribution('1:5'),
+    'leads_per_client': Distribution('~10'),
+    'communications_per_contact': Distribution('~3'),
+    'documents_per_client': Distribution('0:2'),
+    'status_mix': Mix('new=35,contacted=25,qualified=15,lost=15,converted=10'),
+    'source_mix': Mix('Website=30,Google=25,Meta=20,Referral=15,Event=5,API=5'),
+    'communication_mix': Mix('email=45,phone=25,meeting=15,chat=10,other=5'),
+    'days': 365,
+}
+
+@contextmanager
+def historical_timestamps(*models):
+    """
+    Let bulk_create keep the created_at/updated_at set on the instances
+    instead of stamping every row with the current time.
+    """
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    try:
+        for field in fields:
+            field.auto_now = field.auto_now_add = False
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+class _Writer:
+    """
+    Buffer new rows per model and write them with bulk_create. Whenever one
+    buffer is full every buffer is flushed, parents first, so no row is
+    written before the rows it points to.
+    """
+
+    def __init__(self, batch_size, log=None):
+        self.batch_size = batch_size
+        self.log = log
+        self.buffers = {model: [] for model in MODELS}
+        self.written = Counter()
+
+    def add(self, obj):
+        buffer = self.buffers[type(obj)]
+        buffer.append(obj)
+        if len(buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        with transaction.atomic():
+            for model, buffer in self.buffers.items():
+                if buffer:
+                    model.objects.bulk_create(buffer, batch_size=self.batch_size)
+                    self.written[model._meta.model_name] += len(buffer)
+                    buffer.clear()
+        if self.log:
+            self.log(', '.join(f'{count} {name}s' for name, count in self.written.items()))
+
+class Generator:
+    """
+    Deterministic synthetic CRM data: the same seed, options and anchor
+    date always give the same rows, ids included.
+    """
+
+    def __init__(self, seed=0, anchor=None, batch_size=BATCH_SIZE, log=None, **options):
+        unknown = set(options) - set(DEFAULTS)
+        if unknown:
+            raise TypeError(f'Unknown options: {", ".join(sorted(unknown))}')
+        self.options = {**DEFAULTS, **options}
+        self.rng = random.Random(seed)
+        anchor = anchor or timezone.localdate()
+        # Midnight of the anchor date, so rows do not depend on the time of day
+        self.anchor = timezone.make_aware(datetime.combine(anchor, time.min))
+        self.batch_size = batch_size
+        self.log = log
+        self.counts = Counter()
+
+    def uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def moment(self, after=None):
+        """
+        A time within the last ``days`` days, and after ``after`` if given.
+        """
+        start = self.anchor - timedelta(days=self.options['days'])
+        if after is not None and after > start:
+            start = after
+        span = max(int((self.anchor - start).total_seconds()), 1)
+        return start + timedelta(seconds=self.rng.randrange(span))
+
+    def person(self):
+        return self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+
+    def phone(self):
+        return f'+1555{self.rng.randrange(10 ** 7):07d}'
+
+    def generate(self, slugs, domain_suffix='localhost'):
+        """
+        Create one tenant per slug, reachable at <slug>.<domain_suffix>,
+        with its settings, roles, users and CRM records. Signal receivers
+        are muted throughout; what they maintain per row is filled in
+        afterwards by build_derived(). Returns the new tenants.
+        """
+        writer = _Writer(self.batch_size, self.log)
+        tenants = []
+        with mute_signals(), historical_timestamps(Tenant, Domain, TenantSettings, Role, User, UserRole, *MODELS):
+            for slug in slugs:
+                tenant, users = self._tenant(slug, domain_suffix)
+                self._crm(tenant, users, writer)
+                tenants.append(tenant)
+            writer.flush()
+        # A host may have been looked up, and cached as unknown, before now
+        invalidate_hosts([f'{slug}.{domain_suffix}' for slug in slugs])
+        self.counts.update(writer.written)
+        return tenants
+
+    def _tenant(self, slug, domain_suffix):
+        host = f'{slug}.{domain_suffix}'
+        created = self.anchor - timedelta(days=self.options['days'])
+        stamps = {'created_at': created, 'updated_at': created}
+        with transaction.atomic():
+            tenant = Tenant(id=self.uuid(), name=slug.replace('-', ' ').title(), slug=slug, email=f'owner@{host}', **stamps)
+            Tenant.objects.bulk_create([tenant])
+            # What create_tenant_settings and handle_primary_domain would do
+            TenantSettings.objects.bulk_create([TenantSettings(tenant=tenant, **stamps)])
+            Domain.objects.bulk_create([
+                Domain(id=self.uuid(), tenant=tenant, domain=host, is_primary=True, verified=True, **stamps)
+            ])
+            roles = [
+                Role(
+                    id=self.uuid(), tenant=tenant, name=name, can_manage_users=name == 'Admin',
+                    can_manage_roles=name == 'Admin', can_manage_clients=name != 'Viewer', **stamps
+                )
+                for name in ROLE_NAMES
+            ]
+            Role.objects.bulk_create(roles)
+            # Hashing is slow on purpose; one hash serves every user
+            password = make_password(PASSWORD)
+            users = []
+            for number in range(self.options['users']):
+                first_name, last_name = self.person()
+                users.append(User(
+                    id=self.uuid(), email=f'user{number}@{host}', password=password, tenant=tenant,
+                    first_name=first_name, last_name=last_name, api_key=self.uuid(), date_joined=created,
+                    is_tenant_admin=number == 0, is_staff=number == 0, **stamps
+                ))
+            User.objects.bulk_create(users)
+            UserRole.objects.bulk_create([
+                UserRole(
+                    id=self.uuid(), user=user, role=roles[0] if number == 0 else self.rng.choice(roles[1:]),
+                    assigned_at=created, **stamps
+                )
+                for number, user in enumerate(users)
+            ])
+        self.counts.update({'tenant': 1, 'role': len(roles), 'user': len(users)})
+        return tenant, users
+
+    def _crm(self, tenant, users, writer):
+        options = self.options
+        for number in range(options['clients']):
+            created = self.moment()
+            client = Client(
+                id=self.uuid(), tenant=tenant,
+                name=f'{self.rng.choice(COMPANY_WORDS)} {self.rng.choice(COMPANY_WORDS)} {number}',
+                email=f'info{number}@client{number}.example', phone=self.phone(),
+                website=f'https://client{number}.example', tags=[options['source_mix'].sample(self.rng)],
+                created_at=created, updated_at=created,
+            )
+            writer.add(client)
+            for contact_number in range(options['contacts_per_client'].sample(self.rng)):
+                first_name, last_name = self.person()
+                contact_created = self.moment(after=created)
+                contact = Contact(
+                    id=self.uuid(), tenant=tenant, client=client,
+                    first_name=first_name, last_name=last_name,
+                    email=f'{first_name}.{last_name}.{number}.{contact_number}@contact.example'.lower(),
+                    phone=self.phone(), job_title=self.rng.choice(JOB_TITLES), is_primary=contact_number == 0,
+                    created_at=contact_created, updated_at=contact_created,
+                )
+                writer.add(contact)
+                for _ in range(options['communications_per_contact'].sample(self.rng)):
+                    date = self.moment(after=contact_created)
+                    writer.add(Communication(
+                        id=self.uuid(), tenant=tenant, client=client, contact=contact,
+                        communication_type=options['communication_mix'].sample(self.rng),
+                        subject=f'Follow-up with {first_name}', body='Synthetic communication.', date=date,
+                        created_by=self.rng.choice(users) if users else None,
+                        created_at=date, updated_at=date,
+                    ))
+            leads = []
+            for lead_number in range(options['leads_per_client'].sample(self.rng)):
+                first_name, last_name = self.person()
+                lead_created = self.moment(after=created)
+                lead = Lead(
+                    id=self.uuid(), tenant=tenant, client=client,
+                    first_name=first_name, last_name=last_name,
+                    email=f'{first_name}.{last_name}.{number}.{lead_number}@lead.example'.lower(),
+                    phone=self.phone(), source=options['source_mix'].sample(self.rng),
+                    status=options['status_mix'].sample(self.rng),
+                    created_at=lead_created, updated_at=lead_created,
+                )
+                writer.add(lead)
+                leads.append(lead)
+            for document_number in range(options['documents_per_client'].sample(self.rng)):
+                uploaded = self.moment(after=created)
+                writer.add(Document(
+                    id=self.uuid(), tenant=tenant, client=client,
+                    lead=self.rng.choice(leads) if leads and self.rng.random() < 0.5 else None,
+                    uploaded_by=self.rng.choice(users) if users else None,
+                    file=f'crm/documents/synthetic/{client.id}-{document_number}.pdf',
+                    description='Synthetic document.', created_at=uploaded, updated_at=uploaded,
+                ))
+
+def build_derived(tenant, search_index=False, log=None):
+    """
+    Fill what the muted receivers maintain row by row: lead scores,
+    dashboard metrics, funnel counters, the typeahead index and, optionally,
+    the search index. Duplicate candidates are left to find_duplicates.
+    """
+    log = log or (lambda message: None)
+    scoring.score_tenant(tenant.pk)
+    log(f'{tenant.slug}: lead scores')
+    metrics.reconcile_tenant(tenant.pk)
+    log(f'{tenant.slug}: dashboard metrics')
+    lead_ids = Lead.objects.filter(tenant=tenant).order_by().values_list('pk', flat=True)
+    batch = []
+    for lead_id in lead_ids.iterator(chunk_size=BATCH_SIZE):
+        batch.append(lead_id)
+        if len(batch) >= BATCH_SIZE:
+            with transaction.atomic():
+                funnel.record_created(Lead.objects.filter(pk__in=batch))
+            batch = []
+    if batch:
+        with transaction.atomic():
+            funnel.record_created(Lead.objects.filter(pk__in=batch))
+    log(f'{tenant.slug}: funnel counters')
+    for kind in autocomplete.AUTOCOMPLETE_MODELS:
+        autocomplete.build_index(tenant.pk, kind)
+    log(f'{tenant.slug}: typeahead index')
+    if search_index:
+        for model in (Client, Contact, Lead, Communication):
+            search.index_queryset(model.objects.filter(tenant=tenant))
+        log(f'{tenant.slug}: search index')
+
+def delete_tenants(tenants):
+    """
+    Delete tenants with their rows. With receivers muted the cascade only
+    fetches primary keys, and deletes in one statement what nothing else
+    depends on, instead of loading and signalling every row.
+    """
+    with mute_signals():
+        for tenant in tenants:
+            tenant.delete()
@@ -0,0 +1,102 @@
+from celery import shared_task
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from . import autocomplete, imports, ingestion, scoring, webhook_queue
+from .models import ImportJob, Lead
+import logging
+
+logger = logging.getLogger(__name__)
+
+@shared_task(ignore_result=True)
+def drain_lead_webhooks(max_batches=20):
+    """
+    Ingest queued lead webhook payloads in micro-batches. Reschedules itself
+    while a backlog remains so a single run never holds a worker for long.
+    """
+    processed = webhook_queue.drain(max_batches=max_batches)
+    if processed >= max_batches * webhook_queue.batch_size():
+        drain_lead_webhooks.delay(max_batches=max_batches)
+    return processed
+
+@shared_task(ignore_result=True, acks_late=True)
+def run_import(job_id):
+    """
+    Import a CSV upload for up to IMPORT_TASK_TIME_LIMIT seconds, then
+    requeue the job so a long import does not hold a worker throughout.
+    Once it stops, whatever it wrote is indexed by index_import.
+    """
+    try:
+        finished = imports.run_import(job_id, time_limit=getattr(settings, 'IMPORT_TASK_TIME_LIMIT', 120))
+    except Exception as e:
+        logger.exception('Import %s failed', job_id)
+        imports.fail_import(job_id, str(e))
+        finished = True
+    if not finished:
+        run_import.delay(job_id)
+    elif ImportJob.objects.filter(
+        pk=job_id, status__in=['completed', 'failed', 'cancelled'], rows_processed__gt=0
+    ).exists():
+        index_import.delay(job_id)
+
+@shared_task(ignore_result=True, acks_late=True)
+def index_import(job_id):
+    """
+    Index the records an import wrote for search and autocomplete and
+    look for duplicates among them.
+    """
+    imports.index_imported_records(ImportJob.objects.get(pk=job_id))
+
+@shared_task(ignore_result=True, acks_late=True)
+def index_ingested_leads(tenant_id, emails, created, day):
+    """
+    Index, dedupe and score a batch of leads written by the ingest endpoint
+    or the webhook queue, and count the new ones.
+    """
+    ingestion.index_ingested_leads(tenant_id, emails, created, day)
+
+@shared_task(ignore_result=True)
+def resume_stalled_imports():
+    """
+    Requeue imports that have made no progress for IMPORT_STALL_TIMEOUT
+    seconds, e.g. because the worker running them was restarted. They
+    continue after the last chunk they committed.
+    """
+    stale = timezone.now() - timedelta(seconds=getattr(settings, 'IMPORT_STALL_TIMEOUT', 10 * 60))
+    job_ids = ImportJob.objects.filter(
+        status__in=['pending', 'running'], updated_at__lt=stale
+    ).values_list('pk', flat=True)
+    for job_id in job_ids:
+        run_import.delay(str(job_id))
+
+@shared_task(ignore_result=True)
+def score_all_leads():
+    """
+    Nightly full recompute: queue one scoring run per tenant with leads.
+    """
+    tenant_ids = Lead.objects.order_by().values_list('tenant_id', flat=True).distinct()
+    for tenant_id in tenant_ids:
+        score_tenant_leads.delay(str(tenant_id))
+
+@shared_task(ignore_result=True)
+def score_tenant_leads(tenant_id):
+    scoring.score_tenant(tenant_id)
+
+@shared_task(ignore_result=True)
+def rescore_client_leads(client_id):
+    """
+    Rescore a client's leads after a communication with the client.
+    """
+    scoring.rescore_client_leads(client_id)
+
+@shared_task(ignore_result=True)
+def rescore_leads(lead_ids):
+    scoring.rescore_leads(lead_ids)
+
+@shared_task(ignore_result=True)
+def build_autocomplete_index(tenant_id, kind):
+    """
+    Build a tenant's typeahead index that suggest() found missing.
+    """
+    count = autocomplete.build_scheduled_index(tenant_id, kind)
+    logger.info('Built the %s autocomplete index of tenant %s: %d records', kind, tenant_id, count)
@@ -4,6 +4,15 @@ from . import views
 app_name = 'crm'
 
 urlpatterns = [
+    path('search/', views.SearchView.as_view(), name='search'),
+    path('autocomplete/<str:kind>/', views.AutocompleteView.as_view(), name='autocomplete'),
+    path('exports/<str:kind>/', views.ExportView.as_view(), name='export'),
+    path('imports/add/', views.ImportJobCreateView.as_view(), name='import_add'),
+    path('imports/<uuid:pk>/', views.ImportJobDetailView.as_view(), name='import_detail'),
+    path('imports/<uuid:pk>/progress/', views.ImportJobProgressView.as_view(), name='import_progress'),
+    path('duplicates/<str:kind>/', views.DuplicateListView.as_view(), name='duplicate_list'),
+    path('duplicates/<int:pk>/resolve/', views.DuplicateResolveView.as_view(), name='duplicate_resolve'),
+
     # Client URLs
     path('clients/', views.ClientListView.as_view(), name='client_list'),
     path('clients/add/', views.ClientCreateView.as_view(), name='client_add'),
@@ -25,6 +34,8 @@ urlpatterns = [
     path('leads/<uuid:pk>/edit/', views.LeadUpdateView.as_view(), name='lead_edit'),
     path('leads/<uuid:pk>/delete/', views.LeadDeleteView.as_view(), name='lead_delete'),
     path('leads/<uuid:pk>/update-status/', views.LeadStatusUpdateView.as_view(), name='lead_update_status'),
+    path('leads/funnel/', views.LeadFunnelReportView.as_view(), name='lead_funnel_report'),
+    path('leads/ingest/', views.LeadIngestView.as_view(), name='lead_ingest'),
     path('leads/google-webhook/', views.GoogleLeadWebhookView.as_view(), name='google_lead_webhook'),
     path('leads/meta-webhook/', views.MetaLeadWebhookView.as_view(), name='meta_lead_webhook'),
 
@@ -1,24 +1,63 @@
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.views.generic import (
-    ListView, DetailView, CreateView, UpdateView, DeleteView
+    View, ListView, DetailView, CreateView, UpdateView, DeleteView
 )
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.http import Http404, JsonResponse, HttpResponseBadRequest, HttpResponseRedirect
+from django.shortcuts import get_object_or_404
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+from django.db import transaction
+from collections import Counter
 import json
 
-from .models import Client, Contact, Lead, Communication, Document
-
-class ClientListView(LoginRequiredMixin, ListView):
+from common.pagination import KeysetPaginationMixin
+from common.query_cache import CachedKeysetPaginationMixin, CachedObjectMixin
+from common.query_inspector import query_budget
+from .autocomplete import AUTOCOMPLETE_MODELS, suggest
+from .dedupe import DEDUPE_MODELS, merge_records
+from .exports import EXPORT_FORMATS, stream_export
+from .funnel import funnel_report, set_status
+from .ingestion import extract_lead_items, ingest_leads
+from .models import Client, Contact, Lead, Communication, Document, ImportJob, DuplicateCandidate
+from .search import INDEXED_MODELS, search
+from .tasks import run_import
+from .webhook_queue import enqueue_payload
+from .widgets import AutocompleteSelect
+
+# Session, user and one page of rows; more means an N+1 crept in
+LIST_QUERY_BUDGET = 6
+
+class TenantRelatedFieldsMixin:
+    """
+    Limit the client/contact pickers of a model form to the tenant and
+    render them as typeahead selects, so the page does not list every
+    client or contact the tenant has.
+    """
+    # field name -> (autocomplete kind, field that narrows the choices)
+    autocomplete_fields = {}
+
+    def get_form(self, form_class=None):
+        form = super().get_form(form_class)
+        for name, (kind, forward) in self.autocomplete_fields.items():
+            field = form.fields[name]
+            field.queryset = AUTOCOMPLETE_MODELS[kind][0].objects.filter(tenant=self.request.tenant)
+            field.widget = AutocompleteSelect(reverse('crm:autocomplete', args=[kind]), forward=forward)
+            field.widget.choices = field.choices
+        return form
+
+@method_decorator(query_budget(LIST_QUERY_BUDGET), name='dispatch')
+class ClientListView(LoginRequiredMixin, CachedKeysetPaginationMixin, ListView):
     model = Client
+    keyset_ordering = ('name', 'id')
     template_name = 'crm/client_list.html'
     context_object_name = 'clients'
 
     def get_queryset(self):
         return Client.objects.filter(tenant=self.request.tenant, is_active=True)
 
-class ClientDetailView(LoginRequiredMixin, DetailView):
+class ClientDetailView(LoginRequiredMixin, CachedObjectMixin, DetailView):
     model = Client
     template_name = 'crm/client_detail.html'
     context_object_name = 'client'
@@ -55,15 +94,17 @@ class ClientDeleteView(LoginRequiredMixin, DeleteView):
 
 # Similar views for Contact
 
-class ContactListView(LoginRequiredMixin, ListView):
+@method_decorator(query_budget(LIST_QUERY_BUDGET), name='dispatch')
+class ContactListView(LoginRequiredMixin, CachedKeysetPaginationMixin, ListView):
     model = Contact
+    keyset_ordering = ('last_name', 'first_name', 'id')
     template_name = 'crm/contact_list.html'
     context_object_name = 'contacts'
 
     def get_queryset(self):
         return Contact.objects.filter(tenant=self.request.tenant, is_active=True)
 
-class ContactDetailView(LoginRequiredMixin, DetailView):
+class ContactDetailView(LoginRequiredMixin, CachedObjectMixin, DetailView):
     model = Contact
     template_name = 'crm/contact_detail.html'
     context_object_name = 'contact'
@@ -71,8 +112,9 @@ class ContactDetailView(LoginRequiredMixin, DetailView):
     def get_queryset(self):
         return Contact.objects.filter(tenant=self.request.tenant)
 
-class ContactCreateView(LoginRequiredMixin, CreateView):
+class ContactCreateView(LoginRequiredMixin, TenantRelatedFieldsMixin, CreateView):
     model = Contact
+    autocomplete_fields = {'client': ('client', None)}
     fields = ['client', 'first_name', 'last_name', 'email', 'phone', 'job_title', 'tags', 'is_primary', 'is_active']
     template_name = 'crm/contact_form.html'
     success_url = reverse_lazy('crm:contact_list')
@@ -81,8 +123,9 @@ class ContactCreateView(LoginRequiredMixin, CreateView):
         form.instance.tenant = self.request.tenant
         return super().form_valid(form)
 
-class ContactUpdateView(LoginRequiredMixin, UpdateView):
+class ContactUpdateView(LoginRequiredMixin, TenantRelatedFieldsMixin, UpdateView):
     model = Contact
+    autocomplete_fields = {'client': ('client', None)}
     fields = ['client', 'first_name', 'last_name', 'email', 'phone', 'job_title', 'tags', 'is_primary', 'is_active']
     template_name = 'crm/contact_form.html'
     success_url = reverse_lazy('crm:contact_list')
@@ -100,15 +143,17 @@ class ContactDeleteView(LoginRequiredMixin, DeleteView):
 
 # Similar views for Lead
 
-class LeadListView(LoginRequiredMixin, ListView):
+@method_decorator(query_budget(LIST_QUERY_BUDGET), name='dispatch')
+class LeadListView(LoginRequiredMixin, CachedKeysetPaginationMixin, ListView):
     model = Lead
+    keyset_ordering = ('-created_at', 'id')
     template_name = 'crm/lead_list.html'
     context_object_name = 'leads'
 
     def get_queryset(self):
         return Lead.objects.filter(tenant=self.request.tenant, is_active=True)
 
-class LeadDetailView(LoginRequiredMixin, DetailView):
+class LeadDetailView(LoginRequiredMixin, CachedObjectMixin, DetailView):
     model = Lead
     template_name = 'crm/lead_detail.html'
     context_object_name = 'lead'
@@ -116,9 +161,10 @@ class LeadDetailView(LoginRequiredMixin, DetailView):
     def get_queryset(self):
         return Lead.objects.filter(tenant=self.request.tenant)
 
-class LeadCreateView(LoginRequiredMixin, CreateView):
+class LeadCreateView(LoginRequiredMixin, TenantRelatedFieldsMixin, CreateView):
     model = Lead
-    fields = ['client', 'first_name', 'last_name', 'email', 'phone', 'source', 'status', 'score', 'notes', 'is_active']
+    autocomplete_fields = {'client': ('client', None)}
+    fields = ['client', 'first_name', 'last_name', 'email', 'phone', 'source', 'status', 'notes', 'is_active']
     template_name = 'crm/lead_form.html'
     success_url = reverse_lazy('crm:lead_list')
 
@@ -126,9 +172,10 @@ class LeadCreateView(LoginRequiredMixin, CreateView):
         form.instance.tenant = self.request.tenant
         return super().form_valid(form)
 
-class LeadUpdateView(LoginRequiredMixin, UpdateView):
+class LeadUpdateView(LoginRequiredMixin, TenantRelatedFieldsMixin, UpdateView):
     model = Lead
-    fields = ['client', 'first_name', 'last_name', 'email', 'phone', 'source', 'status', 'score', 'notes', 'is_active']
+    autocomplete_fields = {'client': ('client', None)}
+    fields = ['client', 'first_name', 'last_name', 'email', 'phone', 'source', 'status', 'notes', 'is_active']
     template_name = 'crm/lead_form.html'
     success_url = reverse_lazy('crm:lead_list')
 
@@ -145,13 +192,16 @@ class LeadDeleteView(LoginRequiredMixin, DeleteView):
 
 # Similar views for Communication
 
-class CommunicationListView(LoginRequiredMixin, ListView):
+@method_decorator(query_budget(LIST_QUERY_BUDGET), name='dispatch')
+class CommunicationListView(LoginRequiredMixin, CachedKeysetPaginationMixin, ListView):
     model = Communication
+    cache_depends_on = (Communication, Client, Contact)
+    keyset_ordering = ('-date', 'id')
     template_name = 'crm/communication_list.html'
     context_object_name = 'communications'
 
     def get_queryset(self):
-        return Communication.objects.filter(tenant=self.request.tenant)
+        return Communication.objects.filter(tenant=self.request.tenant).select_related('client', 'contact')
 
 class CommunicationDetailView(LoginRequiredMixin, DetailView):
     model = Communication
@@ -159,10 +209,11 @@ class CommunicationDetailView(LoginRequiredMixin, DetailView):
     context_object_name = 'communication'
 
     def get_queryset(self):
-        return Communication.objects.filter(tenant=self.request.tenant)
+        return Communication.objects.filter(tenant=self.request.tenant).select_related('client', 'contact')
 
-class CommunicationCreateView(LoginRequiredMixin, CreateView):
+class CommunicationCreateView(LoginRequiredMixin, TenantRelatedFieldsMixin, CreateView):
     model = Communication
+    autocomplete_fields = {'client': ('client', None), 'contact': ('contact', 'client')}
     fields = ['client', 'contact', 'communication_type', 'subject', 'body', 'date']
     template_name = 'crm/communication_form.html'
     success_url = reverse_lazy('crm:communication_list')
@@ -172,8 +223,9 @@ class CommunicationCreateView(LoginRequiredMixin, CreateView):
         form.instance.created_by = self.request.user
         return super().form_valid(form)
 
-class CommunicationUpdateView(LoginRequiredMixin, UpdateView):
+class CommunicationUpdateView(LoginRequiredMixin, TenantRelatedFieldsMixin, UpdateView):
     model = Communication
+    autocomplete_fields = {'client': ('client', None), 'contact': ('contact', 'client')}
     fields = ['client', 'contact', 'communication_type', 'subject', 'body', 'date']
     template_name = 'crm/communication_form.html'
     success_url = reverse_lazy('crm:communication_list')
@@ -191,13 +243,16 @@ class CommunicationDeleteView(LoginRequiredMixin, DeleteView):
 
 # Similar views for Document
 
-class DocumentListView(LoginRequiredMixin, ListView):
+@method_decorator(query_budget(LIST_QUERY_BUDGET), name='dispatch')
+class DocumentListView(LoginRequiredMixin, CachedKeysetPaginationMixin, ListView):
     model = Document
+    cache_depends_on = (Document, Client, Lead)
+    keyset_ordering = ('-created_at', 'id')
     template_name = 'crm/document_list.html'
     context_object_name = 'documents'
 
     def get_queryset(self):
-        return Document.objects.filter(tenant=self.request.tenant)
+        return Document.objects.filter(tenant=self.request.tenant).select_related('client', 'lead')
 
 class DocumentDetailView(LoginRequiredMixin, DetailView):
     model = Document
@@ -205,7 +260,7 @@ class DocumentDetailView(LoginRequiredMixin, DetailView):
     context_object_name = 'document'
 
     def get_queryset(self):
-        return Document.objects.filter(tenant=self.request.tenant)
+        return Document.objects.filter(tenant=self.request.tenant).select_related('client', 'lead')
 
 class DocumentCreateView(LoginRequiredMixin, CreateView):
     model = Document
@@ -249,66 +304,261 @@ class LeadStatusUpdateView(LoginRequiredMixin, UpdateView):
             if status not in dict(Lead.LEAD_STATUS_CHOICES):
                 return HttpResponseBadRequest('Invalid status value')
             lead = self.get_object()
-            lead.status = status
-            lead.save()
+            set_status(lead, status)
             return JsonResponse({'message': 'Lead status updated successfully'})
         except Exception as e:
             return HttpResponseBadRequest(str(e))
 
-# Webhook endpoint to receive Google leads
+    def get_queryset(self):
+        return Lead.objects.filter(tenant=self.request.tenant)
+
+class LeadFunnelReportView(LoginRequiredMixin, View):
+    """
+    Conversion rates and time in each status for the tenant's leads, from
+    the precomputed funnel counters.
+    """
+    http_method_names = ['get']
+
+    def get(self, request, *args, **kwargs):
+        if request.tenant is None:
+            return HttpResponseBadRequest('Unknown tenant')
+        return JsonResponse(funnel_report(request.tenant.pk))
+
+# Batched lead ingestion used by the ad platform webhooks
 @method_decorator(csrf_exempt, name='dispatch')
-class GoogleLeadWebhookView(LoginRequiredMixin, CreateView):
-    model = Lead
+class LeadIngestView(LoginRequiredMixin, View):
+    """
+    Accept a single lead, an array of leads or {"source": ..., "leads": [...]}
+    and upsert them in bulk. Answers 202 with a result per item.
+    """
     http_method_names = ['post']
+    source = None
+    # Webhooks hand the raw body to the Redis queue when LEAD_WEBHOOK_ASYNC
+    # is on; the per-item results then come from the drain task instead.
+    queued = False
+
+    def get_source(self, data):
+        if self.source:
+            return self.source
+        if isinstance(data, dict) and data.get('source'):
+            return str(data['source'])[:Lead._meta.get_field('source').max_length]
+        return 'API'
 
     def post(self, request, *args, **kwargs):
+        if request.tenant is None:
+            return HttpResponseBadRequest('Unknown tenant')
+        if self.queued and settings.LEAD_WEBHOOK_ASYNC:
+            body = request.body.decode('utf-8', errors='replace')
+            enqueue_payload(request.tenant, self.source, body)
+            return JsonResponse({'message': f'{self.source} leads queued'}, status=202)
         try:
             data = json.loads(request.body)
-            # Extract lead info from Google webhook payload
-            first_name = data.get('first_name', '')
-            last_name = data.get('last_name', '')
-            email = data.get('email', '')
-            phone = data.get('phone', '')
-            source = 'Google'
-            lead = Lead.objects.create(
-                tenant=request.tenant,
-                first_name=first_name,
-                last_name=last_name,
-                email=email,
-                phone=phone,
-                source=source,
-                status='new',
-                is_active=True
-            )
-            return JsonResponse({'message': 'Google lead imported successfully'})
-        except Exception as e:
-            return HttpResponseBadRequest(str(e))
+        except ValueError:
+            return HttpResponseBadRequest('Invalid JSON payload')
+
+        source = self.get_source(data)
+        results = ingest_leads(request.tenant, extract_lead_items(data), source)
+        summary = Counter(result['status'] for result in results)
+        return JsonResponse({
+            'message': f'{source} leads accepted',
+            'summary': summary,
+            'results': results,
+        }, status=202)
+
+# Webhook endpoint to receive Google leads
+class GoogleLeadWebhookView(LeadIngestView):
+    source = 'Google'
+    queued = True
 
 # Webhook endpoint to receive Meta leads
-@method_decorator(csrf_exempt, name='dispatch')
-class MetaLeadWebhookView(LoginRequiredMixin, CreateView):
-    model = Lead
+class MetaLeadWebhookView(LeadIngestView):
+    source = 'Meta'
+    queued = True
+
+class SearchView(LoginRequiredMixin, View):
+    """
+    Ranked search across the tenant's clients, contacts, leads and
+    communications: ?q=...&type=lead,contact&page=2
+    """
+    http_method_names = ['get']
+    paginate_by = 20
+
+    def get(self, request, *args, **kwargs):
+        if request.tenant is None:
+            return HttpResponseBadRequest('Unknown tenant')
+        query = request.GET.get('q', '').strip()
+        kinds = [kind for kind in request.GET.get('type', '').split(',') if kind in INDEXED_MODELS]
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            return HttpResponseBadRequest('Invalid page')
+
+        results, has_more = search(
+            request.tenant, query, kinds=kinds,
+            limit=self.paginate_by, offset=(page - 1) * self.paginate_by,
+        )
+        return JsonResponse({
+            'query': query,
+            'page': page,
+            'next_page': page + 1 if has_more else None,
+            'results': [
+                {
+                    'type': document.kind,
+                    'id': str(document.object_id),
+                    'title': document.title,
+                    'subtitle': document.subtitle,
+                    'score': score,
+                    'url': reverse(f'crm:{document.kind}_detail', args=[document.object_id]),
+                }
+                for document, score in results
+            ],
+        })
+
+class AutocompleteView(LoginRequiredMixin, View):
+    """
+    Typeahead suggestions for the client and contact pickers:
+    /crm/autocomplete/contact/?q=jo&client=<uuid>
+    """
+    http_method_names = ['get']
+
+    def get(self, request, kind, *args, **kwargs):
+        if request.tenant is None:
+            return HttpResponseBadRequest('Unknown tenant')
+        if kind not in AUTOCOMPLETE_MODELS:
+            return HttpResponseBadRequest('Unknown type')
+        results = suggest(
+            request.tenant.pk, kind, request.GET.get('q', ''),
+            client_id=request.GET.get('client') or None,
+        )
+        return JsonResponse({'results': results})
+
+class ExportView(LoginRequiredMixin, View):
+    """
+    Stream the tenant's clients, contacts, leads or communications as CSV
+    (gzip-encoded when accepted) or XLSX: ?format=csv|xlsx
+    """
+    http_method_names = ['get']
+    # kind -> the list view's queryset and ordering
+    querysets = {
+        'client': (lambda tenant: Client.objects.filter(tenant=tenant, is_active=True), ('name', 'id')),
+        'contact': (lambda tenant: Contact.objects.filter(tenant=tenant, is_active=True), ('last_name', 'first_name', 'id')),
+        'lead': (lambda tenant: Lead.objects.filter(tenant=tenant, is_active=True), ('-created_at', 'id')),
+        'communication': (lambda tenant: Communication.objects.filter(tenant=tenant), ('-date', 'id')),
+    }
+
+    def get(self, request, kind, *args, **kwargs):
+        if request.tenant is None:
+            return HttpResponseBadRequest('Unknown tenant')
+        if kind not in self.querysets:
+            return HttpResponseBadRequest('Unknown type')
+        fmt = request.GET.get('format', 'csv')
+        if fmt not in EXPORT_FORMATS:
+            return HttpResponseBadRequest('Unknown format')
+        get_queryset, ordering = self.querysets[kind]
+        return stream_export(request, get_queryset(request.tenant).order_by(*ordering), fmt)
+
+class ImportJobCreateView(LoginRequiredMixin, CreateView):
+    """
+    Upload a CSV of clients, contacts or leads. The file is imported in the
+    background; the job page shows its progress.
+    """
+    model = ImportJob
+    fields = ['kind', 'file']
+    template_name = 'crm/import_form.html'
+
+    def form_valid(self, form):
+        upload = form.cleaned_data['file']
+        form.instance.tenant = self.request.tenant
+        form.instance.created_by = self.request.user
+        form.instance.original_name = upload.name[:255]
+        form.instance.file_size = upload.size
+        response = super().form_valid(form)
+        job_id = str(self.object.pk)
+        transaction.on_commit(lambda: run_import.delay(job_id))
+        return response
+
+    def get_success_url(self):
+        return reverse('crm:import_detail', args=[self.object.pk])
+
+class ImportJobDetailView(LoginRequiredMixin, DetailView):
+    model = ImportJob
+    template_name = 'crm/import_detail.html'
+    context_object_name = 'job'
+
+    def get_queryset(self):
+        return ImportJob.objects.filter(tenant=self.request.tenant)
+
+class ImportJobProgressView(ImportJobDetailView):
+    """
+    Progress of an import as JSON, polled by the job page.
+    """
+    http_method_names = ['get']
+
+    def render_to_response(self, context, **response_kwargs):
+        job = self.object
+        return JsonResponse({
+            'id': str(job.pk),
+            'status': job.status,
+            'progress': job.progress,
+            'rows_processed': job.rows_processed,
+            'created': job.created_count,
+            'updated': job.updated_count,
+            'invalid': job.error_count,
+            'errors': job.errors[:100],
+            'last_error': job.last_error,
+        })
+
+class DuplicateListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
+    """
+    Open duplicate candidates of one kind, most similar first:
+    /crm/duplicates/lead/
+    """
+    model = DuplicateCandidate
+    keyset_ordering = ('-score', 'id')
+    template_name = 'crm/duplicate_list.html'
+    context_object_name = 'candidates'
+
+    def get_queryset(self):
+        if self.kwargs['kind'] not in DEDUPE_MODELS:
+            raise Http404('Unknown type')
+        return DuplicateCandidate.objects.filter(
+            tenant=self.request.tenant, kind=self.kwargs['kind'], status='open'
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        candidates = context['candidates']
+        records = DEDUPE_MODELS[self.kwargs['kind']].objects.in_bulk(
+            [pk for candidate in candidates for pk in (candidate.object_a, candidate.object_b)]
+        )
+        for candidate in candidates:
+            candidate.record_a = records.get(candidate.object_a)
+            candidate.record_b = records.get(candidate.object_b)
+        context['kind'] = self.kwargs['kind']
+        return context
+
+class DuplicateResolveView(LoginRequiredMixin, View):
+    """
+    Merge a candidate pair into the record given as ``keep``, or dismiss it
+    with action=dismiss.
+    """
     http_method_names = ['post']
 
-    def post(self, request, *args, **kwargs):
-        try:
-            data = json.loads(request.body)
-            # Extract lead info from Meta webhook payload
-            first_name = data.get('first_name', '')
-            last_name = data.get('last_name', '')
-            email = data.get('email', '')
-            phone = data.get('phone', '')
-            source = 'Meta'
-            lead = Lead.objects.create(
-                tenant=request.tenant,
-                first_name=first_name,
-                last_name=last_name,
-                email=email,
-                phone=phone,
-                source=source,
-                status='new',
-                is_active=True
+    def post(self, request, pk, *args, **kwargs):
+        candidate = get_object_or_404(DuplicateCandidate, pk=pk, tenant=request.tenant, status='open')
+        action = request.POST.get('action')
+        if action == 'dismiss':
+            candidate.status = 'dismissed'
+            candidate.save(update_fields=['status', 'updated_at'])
+        elif action == 'merge':
+            records = DEDUPE_MODELS[candidate.kind].objects.filter(tenant=request.tenant).in_bulk(
+                [candidate.object_a, candidate.object_b]
             )
-            return JsonResponse({'message': 'Meta lead imported successfully'})
-        except Exception as e:
-            return HttpResponseBadRequest(str(e))
+            keep = request.POST.get('keep')
+            if len(records) != 2 or keep not in (str(candidate.object_a), str(candidate.object_b)):
+                return HttpResponseBadRequest('Invalid merge')
+            survivor = records.pop(candidate.object_a if keep == str(candidate.object_a) else candidate.object_b)
+            merge_records(survivor, list(records.values()))
+        else:
+            return HttpResponseBadRequest('Unknown action')
+        return HttpResponseRedirect(reverse('crm:duplicate_list', args=[candidate.kind]))
@@ -0,0 +1,266 @@
+from collections import defaultdict
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import LockError
+from apps.core.models import Tenant
+from .ingestion import extract_lead_items, ingest_leads
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = 'crm:lead_webhooks:queue'
+PROCESSING_KEY = 'crm:lead_webhooks:processing'
+DEAD_LETTER_KEY = 'crm:lead_webhooks:dead'
+METRICS_KEY = 'crm:lead_webhooks:metrics'
+LOCK_KEY = 'crm:lead_webhooks:lock'
+
+# Move up to ARGV[1] entries from the head of KEYS[1] to KEYS[2] in one step
+TAKE_BATCH_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], #items, -1)
+    redis.call('RPUSH', KEYS[2], unpack(items))
+end
+return items
+"""
+
+def _redis():
+    return get_redis_connection('default')
+
+def batch_size():
+    return getattr(settings, 'LEAD_WEBHOOK_BATCH_SIZE', 500)
+
+def enqueue_payload(tenant, source, body):
+    """
+    Append a raw webhook body to the queue and schedule a drain when the
+    queue reaches a full batch, or after LEAD_WEBHOOK_MAX_WAIT seconds for
+    the first entry of a new batch.
+    """
+    from .tasks import drain_lead_webhooks
+
+    entry = json.dumps({
+        'tenant_id': str(tenant.pk),
+        'source': source,
+        'body': body,
+        'received_at': time.time(),
+    })
+    length = _redis().rpush(QUEUE_KEY, entry)
+    if length % batch_size() == 0:
+        drain_lead_webhooks.delay()
+    elif length == 1:
+        drain_lead_webhooks.apply_async(
+            countdown=getattr(settings, 'LEAD_WEBHOOK_MAX_WAIT', 5)
+        )
+    return length
+
+def dead_letter(conn, raw_entry, error):
+    conn.lpush(DEAD_LETTER_KEY, json.dumps({
+        'entry': raw_entry,
+        'error': error,
+        'failed_at': time.time(),
+    }))
+    conn.ltrim(DEAD_LETTER_KEY, 0, getattr(settings, 'LEAD_WEBHOOK_DEAD_LETTER_MAX', 10000) - 1)
+
+def process_batch(conn, raw_entries):
+    """
+    Ingest a batch of queued entries, grouped by tenant and source so each
+    group becomes a single bulk upsert. Returns (ingested leads, entries
+    dead-lettered).
+
+    When some leads of an entry are invalid, the entry is dead-lettered
+    once, holding only those leads, so requeueing it does not ingest the
+    valid ones again.
+    """
+    groups = defaultdict(list)
+    dead = 0
+    for raw in raw_entries:
+        try:
+            entry = json.loads(raw)
+            items = extract_lead_items(json.loads(entry['body']))
+            groups[(entry['tenant_id'], entry['source'])].append((raw, entry, items))
+        except (ValueError, KeyError, TypeError) as e:
+            dead_letter(conn, raw, f'Unreadable payload: {e}')
+            dead += 1
+
+    tenants = {
+        str(pk): tenant
+        for pk, tenant in Tenant.objects.in_bulk([tenant_id for tenant_id, _source in groups]).items()
+    }
+    ingested = 0
+    for (tenant_id, source), payloads in groups.items():
+        tenant = tenants.get(tenant_id)
+        if tenant is None:
+            for raw, _entry, _items in payloads:
+                dead_letter(conn, raw, f'Unknown tenant {tenant_id}')
+            dead += len(payloads)
+            continue
+
+        # (payload, index within the payload) of every lead in ``items``
+        items, owners = [], []
+        for number, (_raw, _entry, payload_items) in enumerate(payloads):
+            items.extend(payload_items)
+            owners.extend((number, index) for index in range(len(payload_items)))
+        try:
+            results = ingest_leads(tenant, items, source)
+        except Exception as e:
+            logger.exception('Lead webhook batch for tenant %s failed', tenant_id)
+            for raw, _entry, _items in payloads:
+                dead_letter(conn, raw, str(e))
+            dead += len(payloads)
+            continue
+
+        invalid = defaultdict(list)
+        for result in results:
+            if result['status'] == 'invalid':
+                number, index = owners[result['index']]
+                invalid[number].append((index, result['errors']))
+            else:
+                ingested += 1
+        for number, failures in invalid.items():
+            _raw, entry, payload_items = payloads[number]
+            failed_entry = json.dumps({**entry, 'body': json.dumps([payload_items[index] for index, _errors in failures])})
+            dead_letter(conn, failed_entry, json.dumps([
+                {'index': index, 'errors': errors} for index, errors in failures
+            ]))
+        dead += len(invalid)
+    return ingested, dead
+
+def record_metrics(conn, raw_entries, ingested, dead):
+    received = []
+    for raw in raw_entries:
+        try:
+            received.append(float(json.loads(raw)['received_at']))
+        except (ValueError, KeyError, TypeError):
+            pass
+    now = time.time()
+    lag = max((now - ts for ts in received if ts), default=0)
+    with conn.pipeline() as pipe:
+        pipe.hincrby(METRICS_KEY, 'batches', 1)
+        pipe.hincrby(METRICS_KEY, 'entries', len(raw_entries))
+        pipe.hincrby(METRICS_KEY, 'leads_ingested', ingested)
+        pipe.hincrby(METRICS_KEY, 'dead_lettered', dead)
+        pipe.hset(METRICS_KEY, mapping={
+            'last_batch_size': len(raw_entries),
+            'last_batch_at': now,
+            'last_batch_lag_seconds': round(lag, 3),
+        })
+        pipe.execute()
+    logger.info(
+        'Drained %d lead webhook entries (%d leads, %d dead-lettered, lag %.1fs)',
+        len(raw_entries), ingested, dead, lag,
+    )
+
+class LockKeeper(threading.Thread):
+    """
+    Extend ``lock`` every third of its timeout until stopped, so a batch
+    that runs longer than LEAD_WEBHOOK_LOCK_TIMEOUT keeps the lock and no
+    second drain picks up the batch being processed.
+    """
+
+    def __init__(self, lock):
+        super().__init__(name='lead-webhook-lock', daemon=True)
+        self.lock = lock
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.lock.timeout / 3):
+            try:
+                self.lock.extend(self.lock.timeout, replace_ttl=True)
+            except LockError:
+                logger.warning('Could not extend the lead webhook drain lock')
+                return
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+def drain(max_batches=None):
+    """
+    Process queued entries in batches of LEAD_WEBHOOK_BATCH_SIZE until the
+    queue is empty or ``max_batches`` is reached. Returns the number of
+    entries processed.
+
+    Only one drain runs at a time. Each batch is moved to a processing list
+    before it is handled, so a batch lost with a crashed worker is picked up
+    again by the next drain.
+    """
+    conn = _redis()
+    # Not thread-local: the LockKeeper thread extends it
+    lock = conn.lock(
+        LOCK_KEY, timeout=getattr(settings, 'LEAD_WEBHOOK_LOCK_TIMEOUT', 300), thread_local=False
+    )
+    if not lock.acquire(blocking=False):
+        return 0
+
+    processed = 0
+    take_batch = conn.register_script(TAKE_BATCH_SCRIPT)
+    keeper = LockKeeper(lock)
+    keeper.start()
+    try:
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            # Leftovers from a worker that died mid-batch are handled first
+            raw_entries = conn.lrange(PROCESSING_KEY, 0, -1)
+            if not raw_entries:
+                raw_entries = take_batch(keys=[QUEUE_KEY, PROCESSING_KEY], args=[batch_size()])
+            if not raw_entries:
+                break
+            raw_entries = [raw.decode() for raw in raw_entries]
+            ingested, dead = process_batch(conn, raw_entries)
+            if not lock.owned():
+                # Another drain may own the processing list now; leave it
+                logger.error('Lost the lead webhook drain lock while processing a batch')
+                break
+            conn.delete(PROCESSING_KEY)
+            record_metrics(conn, raw_entries, ingested, dead)
+            processed += len(raw_entries)
+            batches += 1
+    finally:
+        keeper.stop()
+        try:
+            lock.release()
+        except LockError:
+            logger.warning('The lead webhook drain lock expired before it was released')
+    return processed
+
+def queue_stats():
+    """
+    Current queue depth, age of the oldest queued entry and running totals.
+    """
+    conn = _redis()
+    with conn.pipeline() as pipe:
+        pipe.llen(QUEUE_KEY)
+        pipe.llen(PROCESSING_KEY)
+        pipe.llen(DEAD_LETTER_KEY)
+        pipe.lindex(QUEUE_KEY, 0)
+        pipe.hgetall(METRICS_KEY)
+        queued, processing, dead, head, metrics = pipe.execute()
+
+    lag = 0
+    if head:
+        lag = max(time.time() - json.loads(head).get('received_at', time.time()), 0)
+    stats = {key.decode(): value.decode() for key, value in metrics.items()}
+    stats.update({
+        'queued': queued,
+        'processing': processing,
+        'dead_letters': dead,
+        'lag_seconds': round(lag, 3),
+    })
+    return stats
+
+def requeue_dead_letters(limit=None):
+    """
+    Move dead-lettered entries back onto the queue. Returns how many moved.
+    """
+    conn = _redis()
+    moved = 0
+    while limit is None or moved < limit:
+        raw = conn.rpop(DEAD_LETTER_KEY)
+        if raw is None:
+            break
+        conn.rpush(QUEUE_KEY, json.loads(raw)['entry'])
+        moved += 1
+    return moved
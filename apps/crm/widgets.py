@@ -0,0 +1,33 @@
+from django import forms
+from django.core.exceptions import ValidationError
+
+class AutocompleteSelect(forms.Select):
+    """
+    A select for a ModelChoiceField that renders only the empty choice and
+    the selected object, instead of iterating the field's whole queryset.
+    Other options are fetched from ``url`` as the user types.
+    """
+
+    def __init__(self, url, forward=None, attrs=None):
+        attrs = {**(attrs or {}), 'data-autocomplete-url': url}
+        if forward:
+            # Name of another field whose value narrows the suggestions
+            attrs['data-autocomplete-forward'] = forward
+        super().__init__(attrs)
+
+    def optgroups(self, name, value, attrs=None):
+        selected = [item for item in value if item not in (None, '')]
+        field = self.choices.field
+        options = []
+        if field.empty_label is not None:
+            options.append(self.create_option(name, '', field.empty_label, not selected, 0, attrs=attrs))
+        if selected:
+            try:
+                objects = list(self.choices.queryset.filter(pk__in=selected))
+            except (ValueError, ValidationError):
+                objects = []
+            for index, obj in enumerate(objects, start=len(options)):
+                options.append(self.create_option(
+                    name, str(obj.pk), field.label_from_instance(obj), True, index, attrs=attrs
+                ))
+        return [(None, options, 0)]
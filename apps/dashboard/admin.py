@@ -0,0 +1,9 @@
+from django.contrib import admin
+from .models import DailyMetric
+
+@admin.register(DailyMetric)
+class DailyMetricAdmin(admin.ModelAdmin):
+    list_display = ('date', 'metric', 'dimension', 'value', 'tenant')
+    list_filter = ('metric', 'date')
+    ordering = ('-date',)
+    readonly_fields = ('tenant', 'date', 'metric', 'dimension', 'value')
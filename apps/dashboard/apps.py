@@ -6,4 +6,4 @@ class DashboardConfig(AppConfig):
     verbose_name = 'Dashboard'
 
     def ready(self):
-        pass
+        import apps.dashboard.signals  # noqa
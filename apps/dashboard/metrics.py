@@ -0,0 +1,196 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from apps.crm.models import Client, Lead, Communication
+from .models import DailyMetric
+
+# Stages a lead passes through in order; a lead in a later stage is
+# counted as having reached the earlier ones
+FUNNEL_STAGES = ('new', 'contacted', 'qualified', 'converted')
+
+def dashboard_days():
+    return getattr(settings, 'DASHBOARD_DAYS', 30)
+
+def _day(value):
+    return timezone.localdate(value)
+
+def lead_changes(lead, created=False, deleted=False):
+    """
+    Metric deltas for a saved or deleted lead, as a Counter keyed by
+    (tenant id, date, metric, dimension).
+    """
+    changes = Counter()
+    if lead.created_at is None:
+        return changes
+    key = (lead.tenant_id, _day(lead.created_at), 'leads')
+    if created:
+        changes[key + (lead.status,)] += 1
+    elif deleted:
+        changes[key + (lead.loaded_value('status', lead.status),)] -= 1
+    elif 'status' in lead.changed_fields:
+        changes[key + (lead.loaded_value('status'),)] -= 1
+        changes[key + (lead.status,)] += 1
+    return changes
+
+def client_changes(client, created=False, deleted=False):
+    changes = Counter()
+    if created or deleted:
+        changes[(client.tenant_id, _day(client.created_at), 'new_clients', '')] += 1 if created else -1
+    return changes
+
+def communication_changes(communication, created=False, deleted=False):
+    changes = Counter()
+    if communication.date is None:
+        return changes
+    current = (communication.tenant_id, _day(communication.date), 'communications', communication.communication_type)
+    if created:
+        changes[current] += 1
+        return changes
+    loaded_date = communication.loaded_value('date', communication.date)
+    loaded = (
+        communication.tenant_id, _day(loaded_date), 'communications',
+        communication.loaded_value('communication_type', communication.communication_type),
+    )
+    if deleted:
+        changes[loaded] -= 1
+    elif loaded != current:
+        changes[loaded] -= 1
+        changes[current] += 1
+    return changes
+
+def apply(changes):
+    """
+    Add each delta to its row with UPDATE ... SET value = value + n,
+    creating rows that do not exist yet.
+    """
+    for (tenant_id, day, metric, dimension), delta in changes.items():
+        if not delta:
+            continue
+        rows = DailyMetric.objects.filter(tenant_id=tenant_id, date=day, metric=metric, dimension=dimension)
+        if rows.update(value=F('value') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                DailyMetric.objects.create(
+                    tenant_id=tenant_id, date=day, metric=metric, dimension=dimension, value=delta
+                )
+        except IntegrityError:
+            # Created concurrently since the UPDATE
+            rows.update(value=F('value') + delta)
+
+def _expected(tenant_id, metrics):
+    expected = {}
+    if 'leads' in metrics:
+        rows = (
+            Lead.objects.filter(tenant_id=tenant_id).order_by()
+            .annotate(day=TruncDate('created_at')).values('day', 'status')
+            .annotate(count=Count('id')).values_list('day', 'status', 'count')
+        )
+        for day, status, count in rows:
+            expected[(day, 'leads', status)] = count
+    if 'new_clients' in metrics:
+        rows = (
+            Client.objects.filter(tenant_id=tenant_id).order_by()
+            .annotate(day=TruncDate('created_at')).values('day')
+            .annotate(count=Count('id')).values_list('day', 'count')
+        )
+        for day, count in rows:
+            expected[(day, 'new_clients', '')] = count
+    if 'communications' in metrics:
+        rows = (
+            Communication.objects.filter(tenant_id=tenant_id).order_by()
+            .annotate(day=TruncDate('date')).values('day', 'communication_type')
+            .annotate(count=Count('id')).values_list('day', 'communication_type', 'count')
+        )
+        for day, communication_type, count in rows:
+            expected[(day, 'communications', communication_type)] = count
+    return expected
+
+def reconcile_tenant(tenant_id, metrics=None):
+    """
+    Recompute a tenant's metric rows from the CRM tables with one GROUP BY
+    per metric and correct the rows that drifted, e.g. after bulk writes
+    that send no signals. Returns the number of rows changed.
+    """
+    metrics = metrics or [metric for metric, _label in DailyMetric.METRIC_CHOICES]
+    expected = _expected(tenant_id, metrics)
+    with transaction.atomic():
+        existing = {
+            (row.date, row.metric, row.dimension): row
+            for row in DailyMetric.objects.select_for_update().filter(tenant_id=tenant_id, metric__in=metrics)
+        }
+        stale = [row.pk for key, row in existing.items() if key not in expected]
+        changed = []
+        for key, value in expected.items():
+            row = existing.get(key)
+            if row is not None and row.value != value:
+                row.value = value
+                changed.append(row)
+        missing = [
+            DailyMetric(tenant_id=tenant_id, date=day, metric=metric, dimension=dimension, value=value)
+            for (day, metric, dimension), value in expected.items() if (day, metric, dimension) not in existing
+        ]
+        DailyMetric.objects.filter(pk__in=stale).delete()
+        DailyMetric.objects.bulk_update(changed, ['value'])
+        DailyMetric.objects.bulk_create(missing)
+    return len(stale) + len(changed) + len(missing)
+
+def funnel(status_counts):
+    """
+    [(stage, leads that reached it, share of the first stage)] from lead
+    counts by current status. Lost leads only count towards the total.
+    """
+    total = sum(status_counts.values())
+    stages = []
+    reached = sum(status_counts.get(stage, 0) for stage in FUNNEL_STAGES)
+    for stage in FUNNEL_STAGES:
+        count = total if stage == FUNNEL_STAGES[0] else reached
+        stages.append((stage, count, round(count * 100 / total, 1) if total else 0))
+        reached -= status_counts.get(stage, 0)
+    return stages
+
+def dashboard_metrics(tenant_id, days=None):
+    """
+    The dashboard's figures for the last ``days`` days, read from the
+    precomputed rows only.
+    """
+    days = days or dashboard_days()
+    end = timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    daily = {start + timedelta(days=offset): defaultdict(int) for offset in range(days)}
+    leads_by_status = Counter()
+    communications_by_type = Counter()
+    rows = DailyMetric.objects.filter(tenant_id=tenant_id, date__gte=start, date__lte=end).values_list(
+        'date', 'metric', 'dimension', 'value'
+    )
+    for day, metric, dimension, value in rows:
+        daily[day][metric] += value
+        if metric == 'leads':
+            leads_by_status[dimension] += value
+        elif metric == 'communications':
+            communications_by_type[dimension] += value
+    lead_totals = dict(
+        DailyMetric.objects.filter(tenant_id=tenant_id, metric='leads').order_by()
+        .values('dimension').annotate(total=Sum('value')).values_list('dimension', 'total')
+    )
+    return {
+        'start': start,
+        'end': end,
+        'daily': [
+            {
+                'date': day,
+                'new_leads': counts['leads'],
+                'new_clients': counts['new_clients'],
+                'communications': counts['communications'],
+            }
+            for day, counts in daily.items()
+        ],
+        'leads_by_status': dict(leads_by_status),
+        'communications_by_type': dict(communications_by_type),
+        'lead_totals': lead_totals,
+        'funnel': funnel(leads_by_status),
+    }
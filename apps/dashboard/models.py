@@ -0,0 +1,35 @@
+from django.db import models
+from apps.core.models import Tenant
+
+class DailyMetric(models.Model):
+    """
+    One precomputed dashboard count per tenant, day, metric and dimension
+    (a lead status or communication type, blank when the metric has
+    none). Kept up to date from CRM signals and rebuilt nightly.
+
+    Leads are counted on the day they were created under their current
+    status, so a status change moves the lead between rows of the same
+    day and the rows can always be recomputed from the leads themselves.
+    """
+    METRIC_CHOICES = [
+        ('leads', 'Leads by status'),
+        ('new_clients', 'New clients'),
+        ('communications', 'Communications by type'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='daily_metrics')
+    date = models.DateField()
+    metric = models.CharField(max_length=20, choices=METRIC_CHOICES)
+    dimension = models.CharField(max_length=20, blank=True, default='')
+    value = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['date']
+        unique_together = ('tenant', 'date', 'metric', 'dimension')
+        indexes = [
+            models.Index(fields=['tenant', 'metric', 'date'], name='dashboard_metric_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.metric} {self.dimension}: {self.value}"
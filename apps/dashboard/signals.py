@@ -0,0 +1,33 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from apps.crm.models import Client, Lead, Communication
+from . import metrics
+
+CHANGE_BUILDERS = {
+    Client: metrics.client_changes,
+    Lead: metrics.lead_changes,
+    Communication: metrics.communication_changes,
+}
+
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=Lead)
+@receiver(post_save, sender=Communication)
+def update_daily_metrics(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Apply the record's metric deltas once the transaction that saved it
+    commits, so a rolled-back save never counts.
+    """
+    if raw:
+        return
+    changes = CHANGE_BUILDERS[sender](instance, created=created)
+    if changes:
+        transaction.on_commit(lambda: metrics.apply(changes))
+
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=Lead)
+@receiver(post_delete, sender=Communication)
+def remove_from_daily_metrics(sender, instance, **kwargs):
+    changes = CHANGE_BUILDERS[sender](instance, deleted=True)
+    if changes:
+        transaction.on_commit(lambda: metrics.apply(changes))
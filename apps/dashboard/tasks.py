@@ -0,0 +1,16 @@
+from celery import shared_task
+from apps.core.models import Tenant
+from . import metrics
+
+@shared_task(ignore_result=True)
+def reconcile_daily_metrics():
+    """
+    Nightly: queue a rebuild of every tenant's dashboard metrics to undo
+    any drift from bulk writes and missed signals.
+    """
+    for tenant_id in Tenant.objects.values_list('pk', flat=True):
+        reconcile_tenant_metrics.delay(str(tenant_id))
+
+@shared_task(ignore_result=True)
+def reconcile_tenant_metrics(tenant_id, metric_names=None):
+    return metrics.reconcile_tenant(tenant_id, metric_names)
@@ -1,11 +1,15 @@
 from django.views.generic import TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
+from .metrics import dashboard_metrics
 
 class DashboardView(LoginRequiredMixin, TemplateView):
     template_name = 'dashboard/index.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Add dashboard data to context
         context['page_title'] = 'Dashboard'
+        # Read from the daily rollups, so the cost is O(days) however many
+        # leads and communications the tenant has
+        if self.request.tenant is not None:
+            context['metrics'] = dashboard_metrics(self.request.tenant.pk)
         return context
@@ -0,0 +1,4 @@
+"""
+Load tests and micro-benchmarks for the CRM hot paths. Run with
+DJANGO_SETTINGS_MODULE=benchmarks.settings; see benchmarks/README.md.
+"""
@@ -0,0 +1,63 @@
+from django.conf import settings
+import json
+import os
+
+# Latency percentiles held to the tolerance
+LATENCY_METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+
+def baseline_path():
+    return getattr(settings, 'BENCH_BASELINE', os.path.join(settings.BASE_DIR, 'benchmarks', 'baseline.json'))
+
+def load(path=None):
+    """
+    The stored baseline: {size: {'meta': ..., 'modes': {mode: {scenario:
+    figures}}}}, or {} when none was saved yet.
+    """
+    path = path or baseline_path()
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save(results, path=None):
+    """
+    Store ``results`` as the baseline for their size, keeping the other
+    sizes' baselines and the other modes of this one.
+    """
+    path = path or baseline_path()
+    baseline = load(path)
+    entry = baseline.setdefault(results['meta']['size'], {'meta': {}, 'modes': {}})
+    entry['meta'] = results['meta']
+    entry['modes'].update(results['modes'])
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def compare(results, baseline, tolerance=None, min_delta_ms=None):
+    """
+    [(mode, scenario, metric, baseline value, current value)] for every
+    figure that got worse than the baseline allows: a latency percentile or
+    the peak RSS more than ``tolerance`` (a share) higher, latency by at
+    least ``min_delta_ms`` too, or any more queries or errors at all.
+    """
+    tolerance = getattr(settings, 'BENCH_TOLERANCE', 0.2) if tolerance is None else tolerance
+    min_delta_ms = getattr(settings, 'BENCH_MIN_DELTA_MS', 1.0) if min_delta_ms is None else min_delta_ms
+    stored = baseline.get(results['meta']['size'], {}).get('modes', {})
+    regressions = []
+    for mode, scenarios in results['modes'].items():
+        for name, current in scenarios.items():
+            previous = stored.get(mode, {}).get(name)
+            if previous is None:
+                continue
+            for metric in LATENCY_METRICS:
+                if (
+                    current[metric] > previous[metric] * (1 + tolerance)
+                    and current[metric] - previous[metric] >= min_delta_ms
+                ):
+                    regressions.append((mode, name, metric, previous[metric], current[metric]))
+            for metric in ('queries_max', 'errors'):
+                if current[metric] > previous[metric]:
+                    regressions.append((mode, name, metric, previous[metric], current[metric]))
+            if current['peak_rss_kb'] > previous['peak_rss_kb'] * (1 + tolerance):
+                regressions.append((mode, name, 'peak_rss_kb', previous['peak_rss_kb'], current['peak_rss_kb']))
+    return regressions
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from benchmarks import baseline, runner, scenarios, seed
+import json
+
+class Command(BaseCommand):
+    help = ('Time the CRM hot paths against a seeded benchmark tenant through the test '
+            'client and a local HTTP load generator, and compare the p50/p95/p99 latency, '
+            'queries per request and peak RSS with the stored baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', choices=list(seed.SIZES), default='1k')
+        parser.add_argument('--mode', action='append', choices=runner.MODES, help='Repeatable; defaults to both.')
+        parser.add_argument('--scenario', action='append', help='Run only scenarios whose name starts with this.')
+        parser.add_argument('--iterations', type=int, default=100, help='Timed requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests sent first.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Threads sending requests in http mode.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed picking the records requested.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--baseline', help='Baseline JSON file; defaults to BENCH_BASELINE.')
+        parser.add_argument('--tolerance', type=float, help='Share a latency or RSS figure may grow.')
+        parser.add_argument('--update-baseline', action='store_true', help='Store these results as the baseline.')
+
+    def handle(self, *args, **options):
+        tenant = seed.get_tenant(options['size'])
+        if tenant is None:
+            raise CommandError(f"Run seed_benchmark --size {options['size']} first.")
+        selected = scenarios.select(options['scenario'])
+        if not selected:
+            raise CommandError('No scenario matches.')
+        fixture = scenarios.Fixture(options['size'], tenant, options['seed'])
+        results = runner.run(
+            selected, fixture, options['mode'] or runner.MODES, options['iterations'],
+            options['concurrency'], options['warmup'], log=self.stdout.write,
+        )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['update_baseline']:
+            baseline.save(results, options['baseline'])
+            self.stdout.write(self.style.SUCCESS('Baseline updated.'))
+            return
+        stored = baseline.load(options['baseline'])
+        if options['size'] not in stored:
+            self.stdout.write(f"No baseline for {options['size']} yet; store one with --update-baseline.")
+            return
+        regressions = baseline.compare(results, stored, options['tolerance'])
+        for mode, name, metric, previous, current in regressions:
+            self.stdout.write(self.style.ERROR(f'  {mode} {name}: {metric} {previous} -> {current}'))
+        if regressions:
+            raise CommandError(f'{len(regressions)} regressions against the baseline.')
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.crm import synthetic
+from benchmarks import seed
+
+class Command(BaseCommand):
+    help = ('Create the synthetic benchmark tenants: 1k, 100k or 1m leads, contacts '
+            'and communications each, with their users, roles and clients, through '
+            'the generate_synthetic_data generator.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', action='append', choices=list(seed.SIZES), help='Repeatable; defaults to 1k.')
+        parser.add_argument('--batch-size', type=int, default=synthetic.BATCH_SIZE, help='Rows per INSERT.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same rows.')
+        parser.add_argument('--search-index', action='store_true', help='Also build the search index.')
+        parser.add_argument('--reset', action='store_true', help='Delete and recreate tenants that already exist.')
+
+    def handle(self, *args, **options):
+        for size in options['size'] or ['1k']:
+            if seed.get_tenant(size) is not None:
+                if not options['reset']:
+                    raise CommandError(f'{seed.tenant_slug(size)} exists; pass --reset to recreate it.')
+                seed.delete(size)
+                self.stdout.write(f'Deleted {seed.tenant_slug(size)}')
+            tenant = seed.seed(size, options['batch_size'], options['seed'], options['search_index'], self.stdout.write)
+            self.stdout.write(self.style.SUCCESS(f'Seeded {tenant.slug} at {seed.tenant_host(size)}'))
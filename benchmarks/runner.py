@@ -0,0 +1,273 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.signals import got_request_exception
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.middleware.csrf import CSRF_ALLOWED_CHARS, CSRF_SECRET_LENGTH
+from django.test import Client as TestClient
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from apps.accounts.models import User
+from common.query_inspector import QueryInspector
+import django
+import http.client
+import math
+import platform
+import resource
+import sys
+import threading
+import time
+
+MODES = ('client', 'http')
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of ``values``; 0 when there are none.
+    """
+    values = sorted(values)
+    if not values:
+        return 0
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
+
+def reset_peak_rss():
+    """
+    Reset the kernel's resident set high-water mark (Linux only), so the
+    next peak_rss_kb() covers one scenario rather than the whole run.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+def peak_rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def summarize(latencies, queries, statuses, errors, peak_rss, elapsed=None):
+    """
+    The figures kept for one scenario: latency percentiles in milliseconds,
+    queries per request, peak RSS in kB, and the requests whose status was
+    not one the scenario expects.
+    """
+    latencies_ms = [seconds * 1000 for seconds in latencies]
+    summary = {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'statuses': {str(status): statuses.count(status) for status in sorted(set(statuses))},
+        'p50_ms': round(percentile(latencies_ms, 0.50), 2),
+        'p95_ms': round(percentile(latencies_ms, 0.95), 2),
+        'p99_ms': round(percentile(latencies_ms, 0.99), 2),
+        'max_ms': round(max(latencies_ms, default=0), 2),
+        'mean_ms': round(sum(latencies_ms) / len(latencies_ms), 2) if latencies_ms else 0,
+        'queries_p50': percentile(queries, 0.50),
+        'queries_max': max(queries, default=0),
+        'peak_rss_kb': peak_rss,
+    }
+    if elapsed:
+        summary['throughput_rps'] = round(len(latencies) / elapsed, 1)
+    if errors:
+        summary['first_error'] = errors[0]
+    return summary
+
+def _error(scenario, status, detail=''):
+    if status in scenario.expected:
+        return None
+    return f'HTTP {status}{": " + detail if detail else ""}'[:500]
+
+def run_client(scenarios, fixture, iterations, warmup=5, log=print):
+    """
+    Send each scenario's requests one after another through the Django test
+    client, in this process, counting the queries of every request.
+    """
+    user = User.objects.get(email=fixture.email)
+    signed_in = TestClient(HTTP_HOST=fixture.host, raise_request_exception=False)
+    signed_in.force_login(user)
+    anonymous = TestClient(HTTP_HOST=fixture.host, raise_request_exception=False)
+    results = {}
+    for scenario in scenarios:
+        client = anonymous if scenario.anonymous else signed_in
+        latencies, queries, statuses, errors = [], [], [], []
+        reset_peak_rss()
+        for number in range(warmup + iterations):
+            method, path, body, content_type = scenario.build(fixture)
+            extra = {'data': body, 'content_type': content_type} if body is not None else {}
+            if scenario.anonymous:
+                # A login leaves the client signed in
+                client.cookies.clear()
+            with QueryInspector() as inspector:
+                start = time.perf_counter()
+                response = client.generic(method, path, **extra)
+                seconds = time.perf_counter() - start
+            if number < warmup:
+                continue
+            latencies.append(seconds)
+            queries.append(inspector.count)
+            statuses.append(response.status_code)
+            detail = ''
+            if response.exc_info:
+                detail = f'{response.exc_info[0].__name__}: {response.exc_info[1]}'
+            error = _error(scenario, response.status_code, detail)
+            if error:
+                errors.append(error)
+        results[scenario.name] = summarize(latencies, queries, statuses, errors, peak_rss_kb())
+        log(_line(scenario.name, results[scenario.name]))
+    return results
+
+class QueryCountingApp:
+    """
+    WSGI wrapper recording the queries of each request served, whichever
+    server thread serves it.
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.counts = []
+        self.exceptions = []
+
+    def exception(self, sender, request=None, **kwargs):
+        exc_type, exc_value, _traceback = sys.exc_info()
+        if exc_type is not None:
+            self.exceptions.append(f'{exc_type.__name__}: {exc_value}')
+
+    def __call__(self, environ, start_response):
+        with QueryInspector() as inspector:
+            response = self.application(environ, start_response)
+            try:
+                chunks = list(response)
+            finally:
+                if hasattr(response, 'close'):
+                    response.close()
+        self.counts.append(inspector.count)
+        return chunks
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+def start_server():
+    """
+    Serve the project on an ephemeral local port from a thread per request.
+    Returns (server, port, app).
+    """
+    app = QueryCountingApp(get_wsgi_application())
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler, allow_reuse_address=True)
+    server.set_app(app)
+    threading.Thread(target=server.serve_forever, name='benchmark-server', daemon=True).start()
+    return server, server.server_address[1], app
+
+def _session_cookie(fixture):
+    client = TestClient(HTTP_HOST=fixture.host)
+    client.force_login(User.objects.get(email=fixture.email))
+    return client.cookies[settings.SESSION_COOKIE_NAME].value
+
+def _send(port, host, cookie, csrf_secret, method, path, body, content_type):
+    headers = {
+        'Host': host,
+        'Cookie': f'{settings.CSRF_COOKIE_NAME}={csrf_secret}{"; " + cookie if cookie else ""}',
+        'X-CSRFToken': csrf_secret,
+    }
+    if content_type:
+        headers['Content-Type'] = content_type
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    start = time.perf_counter()
+    try:
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status, time.perf_counter() - start, ''
+    except (OSError, http.client.HTTPException) as e:
+        return 0, time.perf_counter() - start, f'{type(e).__name__}: {e}'
+    finally:
+        conn.close()
+
+def run_http(scenarios, fixture, iterations, concurrency=8, warmup=5, log=print):
+    """
+    Serve the project over local HTTP and send each scenario's requests from
+    ``concurrency`` threads at once: latency under contention, throughput,
+    and the queries each request ran on the server.
+    """
+    server, port, app = start_server()
+    got_request_exception.connect(app.exception)
+    host = fixture.host
+    session = f'{settings.SESSION_COOKIE_NAME}={_session_cookie(fixture)}'
+    # An unmasked secret is a valid token for itself
+    csrf_secret = get_random_string(CSRF_SECRET_LENGTH, allowed_chars=CSRF_ALLOWED_CHARS)
+    # The server threads open connections of their own
+    connection.close()
+    results = {}
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for scenario in scenarios:
+                cookie = '' if scenario.anonymous else session
+                requests = [scenario.build(fixture) for _ in range(warmup + iterations)]
+                list(pool.map(lambda request: _send(port, host, cookie, csrf_secret, *request), requests[:warmup]))
+                app.counts = []
+                app.exceptions = []
+                reset_peak_rss()
+                start = time.perf_counter()
+                responses = list(pool.map(lambda request: _send(port, host, cookie, csrf_secret, *request), requests[warmup:]))
+                elapsed = time.perf_counter() - start
+                statuses = [status for status, _seconds, _detail in responses]
+                # The client only sees a 500; the server saw what raised it
+                server_error = app.exceptions[0] if app.exceptions else ''
+                errors = [
+                    error for error in (
+                        _error(scenario, status, detail or (server_error if status >= 500 else ''))
+                        for status, _seconds, detail in responses
+                    )
+                    if error
+                ]
+                results[scenario.name] = summarize(
+                    [seconds for _status, seconds, _detail in responses], app.counts,
+                    statuses, errors, peak_rss_kb(), elapsed,
+                )
+                log(_line(scenario.name, results[scenario.name]))
+    finally:
+        got_request_exception.disconnect(app.exception)
+        server.shutdown()
+        server.server_close()
+    return results
+
+def _line(name, summary):
+    return (
+        f"  {name:34s} p50 {summary['p50_ms']:8.2f}ms  p95 {summary['p95_ms']:8.2f}ms  "
+        f"p99 {summary['p99_ms']:8.2f}ms  {summary['queries_max']:4d} queries  "
+        f"{summary['peak_rss_kb'] / 1024:7.1f}MB  {summary['errors']} errors"
+    )
+
+def run(scenarios, fixture, modes=MODES, iterations=100, concurrency=8, warmup=5, log=print):
+    """
+    Run the scenarios in each mode. Returns the results document stored as
+    a baseline or compared against one.
+    """
+    document = {
+        'meta': {
+            'size': fixture.size,
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'iterations': iterations,
+            'concurrency': concurrency,
+            'peak_rss_per_scenario': reset_peak_rss(),
+            'created': timezone.now().isoformat(),
+        },
+        'modes': {},
+    }
+    for mode in modes:
+        log(f'{mode} ({fixture.size}):')
+        if mode == 'client':
+            document['modes'][mode] = run_client(scenarios, fixture, iterations, warmup, log)
+        else:
+            document['modes'][mode] = run_http(scenarios, fixture, iterations, concurrency, warmup, log)
+    return document
@@ -0,0 +1,142 @@
+from django.urls import reverse
+from apps.crm.models import Client, Communication, Contact, Lead
+from apps.crm.synthetic import PASSWORD
+from .seed import SOURCES, tenant_host, user_email
+import itertools
+import json
+import random
+from urllib.parse import urlencode
+
+# Records per model whose ids detail scenarios pick from
+SAMPLE_SIZE = 500
+FORM = 'application/x-www-form-urlencoded'
+JSON = 'application/json'
+
+class Fixture:
+    """
+    What the scenarios of one run share: the seeded tenant, its host and
+    user, a sample of record ids and a seeded random generator, so two runs
+    send the same requests.
+    """
+
+    def __init__(self, size, tenant, random_seed=0):
+        self.size = size
+        self.tenant = tenant
+        self.host = tenant_host(size)
+        self.email = user_email(size)
+        self.password = PASSWORD
+        self.rng = random.Random(f'{size}:{random_seed}:requests')
+        self.ids = {
+            model: list(model.objects.filter(tenant=tenant).order_by().values_list('pk', flat=True)[:SAMPLE_SIZE])
+            for model in (Client, Contact, Lead, Communication)
+        }
+        self._serial = itertools.count()
+
+    def pick(self, model):
+        return self.rng.choice(self.ids[model])
+
+    def serial(self):
+        return next(self._serial)
+
+    def new_lead(self):
+        number = self.serial()
+        return {
+            'first_name': 'Bench',
+            'last_name': f'Lead {number}',
+            'email': f'bench.{self.rng.getrandbits(48):x}.{number}@new-lead.example',
+            'phone': f'+1666{self.rng.randrange(10 ** 7):07d}',
+        }
+
+class Scenario:
+    """
+    One kind of request. ``path`` and ``data`` are callables taking the
+    Fixture; ``data`` returns a dict, encoded as ``content_type``.
+    """
+
+    def __init__(self, name, path, method='GET', data=None, content_type=FORM, expected=(200,), anonymous=False):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.data = data
+        self.content_type = content_type
+        self.expected = expected
+        self.anonymous = anonymous
+
+    def build(self, fixture):
+        """
+        (method, path, body bytes or None, content type) for one request.
+        """
+        path = self.path(fixture)
+        if self.data is None:
+            return self.method, path, None, None
+        data = self.data(fixture)
+        if self.content_type == JSON:
+            body = json.dumps(data)
+        else:
+            body = urlencode(data)
+        return self.method, path, body.encode(), self.content_type
+
+def _url(name, *args):
+    return lambda fixture: reverse(name, args=args)
+
+def _detail(name, model):
+    return lambda fixture: reverse(name, args=[fixture.pick(model)])
+
+def _client_form(fixture):
+    number = fixture.serial()
+    return {
+        'name': f'Bench Client {fixture.rng.getrandbits(48):x} {number}',
+        'email': f'client{number}@new-client.example',
+        'tags': '[]',
+        'is_active': 'on',
+    }
+
+def _lead_form(fixture):
+    return {**fixture.new_lead(), 'source': fixture.rng.choice(SOURCES), 'status': 'new', 'is_active': 'on'}
+
+def _ingest_batch(fixture):
+    return {'source': 'Benchmark', 'leads': [fixture.new_lead() for _ in range(10)]}
+
+def _webhook_lead(fixture):
+    return fixture.new_lead()
+
+def _login(fixture):
+    return {'username': fixture.email, 'password': fixture.password}
+
+def _search(fixture):
+    query = fixture.rng.choice(('ada', 'turing', 'acme globex', 'hopper', 'wonka'))
+    return f"{reverse('crm:search')}?{urlencode({'q': query})}"
+
+def _autocomplete(fixture):
+    query = fixture.rng.choice(('ac', 'glo', 'ini', 'st'))
+    return f"{reverse('crm:autocomplete', args=['client'])}?{urlencode({'q': query})}"
+
+SCENARIOS = [
+    Scenario('crm:client_list', _url('crm:client_list')),
+    Scenario('crm:client_detail', _detail('crm:client_detail', Client)),
+    Scenario('crm:client_add', _url('crm:client_add'), 'POST', _client_form, expected=(302,)),
+    Scenario('crm:contact_list', _url('crm:contact_list')),
+    Scenario('crm:contact_detail', _detail('crm:contact_detail', Contact)),
+    Scenario('crm:lead_list', _url('crm:lead_list')),
+    Scenario('crm:lead_detail', _detail('crm:lead_detail', Lead)),
+    Scenario('crm:lead_add', _url('crm:lead_add'), 'POST', _lead_form, expected=(302,)),
+    Scenario('crm:lead_funnel_report', _url('crm:lead_funnel_report')),
+    Scenario('crm:communication_list', _url('crm:communication_list')),
+    Scenario('crm:communication_detail', _detail('crm:communication_detail', Communication)),
+    Scenario('crm:search', _search),
+    Scenario('crm:autocomplete', _autocomplete),
+    Scenario('crm:lead_ingest', _url('crm:lead_ingest'), 'POST', _ingest_batch, JSON, expected=(202,)),
+    Scenario('crm:google_lead_webhook', _url('crm:google_lead_webhook'), 'POST', _webhook_lead, JSON, expected=(202,)),
+    Scenario('crm:meta_lead_webhook', _url('crm:meta_lead_webhook'), 'POST', _webhook_lead, JSON, expected=(202,)),
+    Scenario('accounts:login', _url('accounts:login'), 'POST', _login, expected=(302,), anonymous=True),
+    Scenario('accounts_api:api_user_list', _url('accounts_api:api_user_list')),
+    Scenario('accounts_api:api_role_list', _url('accounts_api:api_role_list')),
+]
+
+def select(names=None):
+    """
+    The scenarios whose name starts with one of ``names``, or all of them.
+    """
+    if not names:
+        return list(SCENARIOS)
+    return [scenario for scenario in SCENARIOS if scenario.name.startswith(tuple(names))]
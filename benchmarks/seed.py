@@ -0,0 +1,43 @@
+from apps.core.models import Tenant
+from apps.crm import synthetic
+
+# Leads, contacts and communications per benchmark tenant
+SIZES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+# Contacts and leads per client
+PER_CLIENT = 10
+USERS = 20
+SOURCES = tuple(synthetic.DEFAULTS['source_mix'].weights)
+
+def tenant_slug(size):
+    return f'bench-{size}'
+
+def tenant_host(size):
+    return f'{tenant_slug(size)}.localhost'
+
+def user_email(size, number=0):
+    return f'user{number}@{tenant_host(size)}'
+
+def get_tenant(size):
+    return Tenant.objects.filter(slug=tenant_slug(size)).first()
+
+def seed(size, batch_size=synthetic.BATCH_SIZE, random_seed=0, search_index=False, log=print):
+    """
+    Create the benchmark tenant for ``size`` (a key of SIZES) with exactly
+    that many leads, contacts and communications, and build what signals
+    would have maintained. Returns the tenant.
+    """
+    count = SIZES[size]
+    generator = synthetic.Generator(
+        seed=f'{size}:{random_seed}', batch_size=batch_size, log=log,
+        users=USERS, clients=max(count // PER_CLIENT, 1),
+        contacts_per_client=synthetic.Distribution(PER_CLIENT),
+        leads_per_client=synthetic.Distribution(PER_CLIENT),
+        communications_per_contact=synthetic.Distribution(1),
+        documents_per_client=synthetic.Distribution(0),
+    )
+    tenant, = generator.generate([tenant_slug(size)])
+    synthetic.build_derived(tenant, search_index, log=log)
+    return tenant
+
+def delete(size):
+    synthetic.delete_tenants([tenant for tenant in [get_tenant(size)] if tenant is not None])
@@ -0,0 +1,88 @@
+"""
+The project's settings pointed at a dedicated benchmark database, with
+Celery publishing to memory so requests pay for enqueueing their tasks but
+never wait on a worker.
+"""
+from crm_project.settings import *  # noqa: F401,F403
+import os
+
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+INSTALLED_APPS = INSTALLED_APPS + ['benchmarks']
+ROOT_URLCONF = 'benchmarks.urls'
+
+if os.getenv('BENCH_DB_ENGINE', 'sqlite') == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('BENCH_DB_NAME', 'crm_bench'),
+            'USER': os.getenv('BENCH_DB_USER', 'postgres'),
+            'PASSWORD': os.getenv('BENCH_DB_PASSWORD', ''),
+            'HOST': os.getenv('BENCH_DB_HOST', 'localhost'),
+            'PORT': os.getenv('BENCH_DB_PORT', '5432'),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('BENCH_DB_NAME', str(BASE_DIR / 'benchmarks' / 'bench.sqlite3')),
+            # The HTTP load generator writes from several threads at once
+            'OPTIONS': {'timeout': 30},
+        }
+    }
+
+# A Redis database of its own, so sessions and queues stay apart from development
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.getenv('BENCH_REDIS_URL', f'redis://{REDIS_HOST}:{REDIS_PORT}/15'),
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        }
+    }
+}
+CELERY_BROKER_URL = 'memory://'
+CELERY_RESULT_BACKEND = 'cache+memory://'
+
+# Measure the views, not the diagnostics
+QUERY_INSPECTOR_ENABLED = False
+QUERY_BUDGET_ENFORCE = False
+PROFILING_ENABLED = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'django': {
+            'handlers': ['console'],
+            'level': 'ERROR',
+            'propagate': False,
+        },
+        # Failed requests are counted in the results instead
+        'django.request': {
+            'handlers': ['console'],
+            'level': 'CRITICAL',
+            'propagate': False,
+        },
+        # One line per request from the HTTP load generator's server
+        'django.server': {
+            'handlers': ['console'],
+            'level': 'ERROR',
+            'propagate': False,
+        },
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': 'WARNING',
+    },
+}
+
+BENCH_BASELINE = BASE_DIR / 'benchmarks' / 'baseline.json'  # stored results new runs are compared against
+BENCH_TOLERANCE = 0.2  # share a latency or memory figure may grow before it counts as a regression
+BENCH_MIN_DELTA_MS = 1.0  # latency growth below this is noise whatever the share
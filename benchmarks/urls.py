@@ -0,0 +1,9 @@
+from django.urls import include, path
+from apps.accounts.urls import api_urlpatterns
+from crm_project.urls import urlpatterns as project_urlpatterns
+
+# The project's URLs plus the accounts API, which crm_project.urls does not
+# route yet
+urlpatterns = project_urlpatterns + [
+    path('api/v1/accounts/', include((api_urlpatterns, 'accounts_api'))),
+]
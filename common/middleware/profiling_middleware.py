@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from common import profiling
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class ProfilingMiddleware:
+    """
+    Profile a sample of requests: PROFILING_SAMPLE_RATE of them, plus any
+    request carrying a signed PROFILING_HEADER (see the profile_report
+    command). A profiled request gets its wall time split into database,
+    template, cache and Python time, a Server-Timing header, and a
+    collapsed-stack profile saved under its URL name. Enabled with
+    PROFILING_ENABLED.
+
+    Template time covers TemplateResponses, which are rendered here or,
+    under query_budget, by the decorator through request._profiling_timer;
+    render() called inside a view counts as Python time. A streaming
+    response's body is produced after this returns and is not profiled.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.01)
+        self.interval = getattr(settings, 'PROFILING_INTERVAL', 0.005)
+        self.header = 'HTTP_' + getattr(settings, 'PROFILING_HEADER', 'X-Profile').upper().replace('-', '_')
+
+    def _should_profile(self, request):
+        token = request.META.get(self.header)
+        if token:
+            return profiling.check_token(token)
+        return random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if not self._should_profile(request):
+            return self.get_response(request)
+
+        timer = profiling.RequestTimer()
+        request._profiling_timer = timer
+        sampler = profiling.StackSampler(threading.get_ident(), self.interval, root=self.__call__.__code__)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            with timer:
+                response = self.get_response(request)
+        finally:
+            sampler.stop()
+        wall = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else 'unresolved'
+        python = max(wall - timer.db - timer.template - timer.cache, 0)
+        timings = {
+            'view': view_name,
+            'path': request.path,
+            'method': request.method,
+            'status': response.status_code,
+            'tenant': str(request.tenant.pk) if getattr(request, 'tenant', None) else None,
+            'wall_ms': round(wall * 1000, 2),
+            'db_ms': round(timer.db * 1000, 2),
+            'template_ms': round(timer.template * 1000, 2),
+            'cache_ms': round(timer.cache * 1000, 2),
+            'python_ms': round(python * 1000, 2),
+            'queries': timer.queries,
+        }
+        response['Server-Timing'] = ', '.join(
+            f'{part};dur={timings[f"{part}_ms"]}' for part in ('db', 'template', 'cache', 'python')
+        ) + f', total;dur={timings["wall_ms"]}'
+        try:
+            profiling.save_profile(view_name, timings, sampler.stacks)
+        except OSError:
+            logger.exception('Could not save the profile of %s', request.path)
+        logger.info(
+            'Profiled %s %s (%s): %.1fms, db %.1fms in %d queries, template %.1fms, cache %.1fms, python %.1fms',
+            request.method, request.path, view_name, timings['wall_ms'], timings['db_ms'], timings['queries'],
+            timings['template_ms'], timings['cache_ms'], timings['python_ms'],
+        )
+        return response
+
+    def process_template_response(self, request, response):
+        timer = getattr(request, '_profiling_timer', None)
+        if timer is not None:
+            timer.render(response)
+        return response
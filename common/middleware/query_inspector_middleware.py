@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from common import query_inspector
+import logging
+
+logger = logging.getLogger(__name__)
+
+class QueryInspectorMiddleware:
+    """
+    Record the queries of each request, grouped by fingerprint. Repeated
+    fingerprints are logged as possible N+1s and everything is added to the
+    per-view totals read by the query_report command. Enabled with
+    QUERY_INSPECTOR_ENABLED; queries a streaming response runs while it is
+    being sent are not counted.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_INSPECTOR_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with query_inspector.QueryInspector() as inspector:
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else 'unresolved'
+        repeated = inspector.repeated()
+        if repeated:
+            logger.warning(
+                'Possible N+1 in %s (%s): %s', view_name, request.path,
+                '; '.join(f'{count}x {sql[:200]}' for sql, count in repeated),
+            )
+        response['X-Query-Count'] = str(inspector.count)
+        query_inspector.record(view_name, inspector)
+        return response
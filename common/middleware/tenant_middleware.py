@@ -1,12 +1,14 @@
 from django.utils.deprecation import MiddlewareMixin
+from apps.core.cache import get_tenant_for_host, get_tenant_settings
 
 class TenantMiddleware(MiddlewareMixin):
     """
     Middleware to determine the tenant from the request.
-    This is a basic placeholder implementation.
+    The Host header is resolved through Domain to its Tenant, and
+    request.tenant_settings is the tenant's TenantSettingsSnapshot; both
+    are cached per process and in Redis (see apps.core.cache).
     """
 
     def process_request(self, request):
-        # Example: Set a tenant attribute on the request
-        # In a real implementation, determine tenant from request headers, domain, etc.
-        request.tenant = None
+        request.tenant = get_tenant_for_host(request.get_host())
+        request.tenant_settings = get_tenant_settings(request.tenant)
@@ -0,0 +1,223 @@
+from datetime import date, datetime, time
+from decimal import Decimal
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+import base64
+import binascii
+import json
+import uuid
+
+class InvalidCursor(ValueError):
+    pass
+
+def keyset_ordering(queryset, ordering=None):
+    """
+    Return the ordering used for keyset pagination: the given ordering, or
+    the queryset's/model's ordering, always ending with the primary key so
+    every row has a unique position.
+    """
+    model = queryset.model
+    ordering = list(ordering or queryset.query.order_by or model._meta.ordering)
+    pk_name = model._meta.pk.name
+    if not any(field.lstrip('-') in (pk_name, 'pk') for field in ordering):
+        ordering.append(pk_name)
+    return tuple(ordering)
+
+def _invert(ordering):
+    return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+def _to_json(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (uuid.UUID, Decimal)):
+        return str(value)
+    return value
+
+def encode_cursor(position, reverse=False):
+    payload = {'p': [_to_json(value) for value in position]}
+    if reverse:
+        payload['r'] = 1
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        return list(payload['p']), bool(payload.get('r'))
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise InvalidCursor(cursor)
+
+class KeysetPage:
+    """
+    One page of a KeysetPaginator, with opaque cursors to its neighbours.
+    """
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<KeysetPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by seeking past the last row seen instead of using
+    OFFSET, so every page costs one index range scan and no COUNT(*).
+
+    ``ordering`` defaults to the queryset's ordering plus the primary key,
+    e.g. ``('-created_at', 'id')`` for leads.
+    """
+
+    def __init__(self, queryset, per_page, ordering=None):
+        self.ordering = keyset_ordering(queryset, ordering)
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        opts = queryset.model._meta
+        self._attnames = [
+            opts.pk.attname if name in ('pk', opts.pk.name) else opts.get_field(name).attname
+            for name in (field.lstrip('-') for field in self.ordering)
+        ]
+
+    def position(self, obj):
+        return [getattr(obj, attname) for attname in self._attnames]
+
+    def _seek(self, position, ordering):
+        if len(position) != len(ordering):
+            raise InvalidCursor(position)
+        # (a, b, c) > (x, y, z) expanded for mixed sort directions
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        # The leading bound lets the database use a plain index range scan
+        first = ordering[0]
+        lead = Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": position[0]})
+        return lead & condition
+
+    def page_queryset(self, position=None, reverse=False):
+        """
+        Return the sliced queryset that fetches the page after ``position``
+        (or before it when ``reverse``), plus one row to detect more pages.
+        """
+        ordering = _invert(self.ordering) if reverse else self.ordering
+        queryset = self.queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._seek(position, ordering))
+        return queryset[:self.per_page + 1]
+
+    def page(self, cursor=None):
+        position, reverse = decode_cursor(cursor) if cursor else (None, False)
+        try:
+            rows = list(self.page_queryset(position, reverse))
+        except ValidationError:
+            raise InvalidCursor(cursor)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = position is not None, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = encode_cursor(self.position(rows[-1]))
+        if rows and has_previous:
+            previous_cursor = encode_cursor(self.position(rows[0]), reverse=True)
+        return KeysetPage(rows, self, next_cursor, previous_cursor)
+
+class KeysetPaginationMixin:
+    """
+    ListView mixin that pages with an opaque ``?cursor=`` parameter
+    instead of page numbers. Set ``keyset_ordering`` to match an index.
+    """
+    paginate_by = 25
+    keyset_ordering = None
+    cursor_kwarg = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size, ordering=self.keyset_ordering)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404(_('Invalid cursor.'))
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+class KeysetCursorPagination(BasePagination):
+    """
+    DRF pagination backed by KeysetPaginator. The ordering comes from
+    ``ordering`` here, ``keyset_ordering`` on the view, or the model.
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    ordering = None
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        ordering = self.ordering or getattr(view, 'keyset_ordering', None)
+        paginator = KeysetPaginator(queryset, self.page_size, ordering=ordering)
+        try:
+            self.page = paginator.page(request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound(self.invalid_cursor_message)
+        return list(self.page)
+
+    def get_next_link(self):
+        if not self.page.has_next():
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.page.next_cursor)
+
+    def get_previous_link(self):
+        if not self.page.has_previous():
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.page.previous_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,201 @@
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.db import connections
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+
+TOKEN_SALT = 'common.profiling'
+# Cache backend methods timed as cache time
+CACHE_METHODS = (
+    'get', 'set', 'add', 'delete', 'get_many', 'set_many', 'delete_many',
+    'get_or_set', 'has_key', 'incr', 'decr', 'touch',
+)
+TIMINGS_FILE = 'timings.jsonl'
+STACKS_SUFFIX = '.collapsed'
+
+def profile_dir():
+    return getattr(settings, 'PROFILING_DIR', os.path.join(settings.BASE_DIR, 'logs', 'profiles'))
+
+def make_token(label=''):
+    """
+    A value for the PROFILING_HEADER that gets one's requests profiled
+    whatever the sample rate; ``label`` says whose token it is.
+    """
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(label or 'profile')
+
+def check_token(value):
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            value, max_age=getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 24 * 60 * 60)
+        )
+    except signing.BadSignature:
+        return False
+    return True
+
+def _label(code):
+    name = getattr(code, 'co_qualname', code.co_name)
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f'{module}:{name}'.replace(';', ',').replace(' ', '_')
+
+class StackSampler(threading.Thread):
+    """
+    Sample one thread's Python stack every ``interval`` seconds, counting
+    collapsed stacks ("outer;...;inner") for a flamegraph. Frames above
+    ``root`` (a code object, usually the middleware's) are dropped.
+    """
+
+    def __init__(self, thread_id, interval, root=None):
+        super().__init__(name='profiling-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.root = root
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                if frame.f_code is _STOP_CODE:
+                    # The request is over and waiting for this thread
+                    stack = []
+                    break
+                stack.append(_label(frame.f_code))
+                if frame.f_code is self.root:
+                    break
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+_STOP_CODE = StackSampler.stop.__code__
+
+class RequestTimer:
+    """
+    Accumulate the time a request spends in the database, in the cache and
+    rendering templates. Database time inside a render is counted as
+    database time only, so the parts add up to no more than the wall time.
+    """
+
+    def __init__(self):
+        self.db = 0.0
+        self.cache = 0.0
+        self.template = 0.0
+        self.queries = 0
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries += 1
+
+    def _timed(self, method):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.cache += time.perf_counter() - start
+        return timed
+
+    def render(self, response):
+        db, cache = self.db, self.cache
+        start = time.perf_counter()
+        response.render()
+        self.template += time.perf_counter() - start - (self.db - db) - (self.cache - cache)
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        # Cache backends are per thread, so patching this thread's instances
+        # leaves other requests alone
+        for alias in settings.CACHES:
+            backend = caches[alias]
+            for name in CACHE_METHODS:
+                method = getattr(backend, name, None)
+                if method is not None:
+                    setattr(backend, name, self._timed(method))
+                    self._stack.callback(backend.__dict__.pop, name, None)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+def safe_name(view_name):
+    return view_name.replace(':', '.').replace(os.sep, '_') or 'unresolved'
+
+def save_profile(view_name, timings, stacks):
+    """
+    Write one request's collapsed stacks to PROFILING_DIR/<view name>/ and
+    append its timings to that directory's timings file.
+    """
+    directory = os.path.join(profile_dir(), safe_name(view_name))
+    os.makedirs(directory, exist_ok=True)
+    name = f'{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}{STACKS_SUFFIX}'
+    with open(os.path.join(directory, name), 'w') as f:
+        for stack, count in stacks.most_common():
+            f.write(f'{stack} {count}\n')
+    with open(os.path.join(directory, TIMINGS_FILE), 'a') as f:
+        f.write(json.dumps(timings) + '\n')
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0
+
+def aggregate(view_name=None):
+    """
+    Merge the saved profiles per view name. Returns {view name: {'stacks':
+    Counter, 'requests', and wall/db/template/cache/python times}}, with
+    p50/p95 wall times and mean parts in milliseconds.
+    """
+    root = profile_dir()
+    if not os.path.isdir(root):
+        return {}
+    results = {}
+    for name in sorted(os.listdir(root)):
+        directory = os.path.join(root, name)
+        if not os.path.isdir(directory) or (view_name and name != safe_name(view_name)):
+            continue
+        stacks = Counter()
+        for filename in os.listdir(directory):
+            if filename.endswith(STACKS_SUFFIX):
+                with open(os.path.join(directory, filename)) as f:
+                    for line in f:
+                        stack, _space, count = line.rstrip('\n').rpartition(' ')
+                        if stack and count.isdigit():
+                            stacks[stack] += int(count)
+        parts = defaultdict(list)
+        timings_path = os.path.join(directory, TIMINGS_FILE)
+        if os.path.exists(timings_path):
+            with open(timings_path) as f:
+                for line in f:
+                    timing = json.loads(line)
+                    for part in ('wall_ms', 'db_ms', 'template_ms', 'cache_ms', 'python_ms', 'queries'):
+                        parts[part].append(timing.get(part, 0))
+        requests = len(parts['wall_ms'])
+        results[name] = {
+            'stacks': stacks,
+            'requests': requests,
+            'wall_p50_ms': _percentile(parts['wall_ms'], 0.5),
+            'wall_p95_ms': _percentile(parts['wall_ms'], 0.95),
+            **{
+                f'avg_{part}': round(sum(parts[part]) / requests, 1) if requests else 0
+                for part in ('db_ms', 'template_ms', 'cache_ms', 'python_ms', 'queries')
+            },
+        }
+    return results
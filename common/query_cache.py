@@ -0,0 +1,230 @@
+from collections import Counter
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django_redis import get_redis_connection
+from common.pagination import KeysetPage, KeysetPaginationMixin, KeysetPaginator
+import hashlib
+import json
+import logging
+import pickle
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Redis hashes with the hit/miss/byte counters by cache name, and the
+# invalidations by model
+HITS_KEY = 'querycache:hits'
+MISSES_KEY = 'querycache:misses'
+BYTES_READ_KEY = 'querycache:bytes_read'
+BYTES_WRITTEN_KEY = 'querycache:bytes_written'
+INVALIDATIONS_KEY = 'querycache:invalidations'
+STATS_KEYS = (HITS_KEY, MISSES_KEY, BYTES_READ_KEY, BYTES_WRITTEN_KEY, INVALIDATIONS_KEY)
+
+# Counters of this process not yet added to the Redis hashes
+_pending = {key: Counter() for key in STATS_KEYS}
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+def enabled():
+    return getattr(settings, 'QUERY_CACHE_ENABLED', True)
+
+def _label(model):
+    return model._meta.label_lower
+
+def generation_key(tenant_id, model):
+    return f'qcgen:{tenant_id}:{_label(model)}'
+
+def generations(tenant_id, models):
+    """
+    The current generation of each of ``models`` for the tenant. A counter
+    that is missing (never bumped, or evicted) starts from the clock, so it
+    can never come back to a value an older entry was stored under.
+    """
+    keys = [generation_key(tenant_id, model) for model in models]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time_ns() // 1000, timeout=None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+def bump(tenant_id, *models):
+    """
+    Invalidate every cached page and object of the tenant that depends on
+    one of ``models``: one INCR per model, the stale entries just expire.
+    """
+    if tenant_id is None:
+        return
+    for model in models:
+        try:
+            cache.incr(generation_key(tenant_id, model))
+        except ValueError:
+            # Not created yet; the first read starts it from the clock
+            pass
+        _count(INVALIDATIONS_KEY, _label(model))
+
+def bump_on_commit(tenant_id, *models):
+    """
+    bump() once the current transaction commits, so a request reading in
+    between cannot cache the old rows under the new generation.
+    """
+    transaction.on_commit(lambda: bump(tenant_id, *models))
+
+def bump_queryset(queryset):
+    """
+    bump() the queryset's model for every tenant with rows in it, for
+    bulk writes that send no post_save.
+    """
+    for tenant_id in queryset.order_by().values_list('tenant_id', flat=True).distinct():
+        bump(tenant_id, queryset.model)
+
+def make_key(tenant_id, name, params, models):
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    versions = '.'.join(str(generation) for generation in generations(tenant_id, models))
+    return f'qc:{tenant_id}:{name}:{versions}:{digest}'
+
+def get_or_load(tenant_id, name, params, loader, models, timeout=None):
+    """
+    Return ``loader()``, cached per tenant under ``name`` and ``params``
+    (JSON-serializable) until ``timeout`` or until any of ``models`` is
+    bumped for the tenant. ``loader`` must return something picklable.
+    """
+    if tenant_id is None or not enabled():
+        return loader()
+    key = make_key(tenant_id, name, params, models)
+    cached = cache.get(key)
+    if cached is not None:
+        size, value = cached
+        _count(HITS_KEY, name)
+        _count(BYTES_READ_KEY, name, size)
+        return value
+    value = loader()
+    size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    if timeout is None:
+        timeout = getattr(settings, 'QUERY_CACHE_TIMEOUT', 300)
+    cache.set(key, (size, value), timeout)
+    _count(MISSES_KEY, name)
+    _count(BYTES_WRITTEN_KEY, name, size)
+    return value
+
+def _count(key, field, amount=1):
+    global _last_flush
+    with _pending_lock:
+        _pending[key][field] += amount
+        now = time.monotonic()
+        if now - _last_flush < getattr(settings, 'QUERY_CACHE_STATS_INTERVAL', 10):
+            return
+        _last_flush = now
+        pending = {key: counter.copy() for key, counter in _pending.items()}
+        for counter in _pending.values():
+            counter.clear()
+    _write(pending)
+
+def _write(pending):
+    try:
+        with get_redis_connection('default').pipeline() as pipe:
+            for key, counter in pending.items():
+                for field, amount in counter.items():
+                    pipe.hincrby(key, field, amount)
+            pipe.execute()
+    except Exception:
+        logger.exception('Could not record query cache stats')
+
+def flush_stats():
+    """
+    Add this process's pending counters to the Redis hashes now.
+    """
+    global _last_flush
+    with _pending_lock:
+        _last_flush = time.monotonic()
+        pending = {key: counter.copy() for key, counter in _pending.items()}
+        for counter in _pending.values():
+            counter.clear()
+    _write(pending)
+
+def report():
+    """
+    Hits, misses, hit ratio and bytes by cache name, and invalidations by
+    model, from every process that flushed its counters.
+    """
+    conn = get_redis_connection('default')
+    stats = {key: {name.decode(): int(value) for name, value in conn.hgetall(key).items()} for key in STATS_KEYS}
+    names = sorted(set(stats[HITS_KEY]) | set(stats[MISSES_KEY]))
+    caches = []
+    for name in names:
+        hits = stats[HITS_KEY].get(name, 0)
+        misses = stats[MISSES_KEY].get(name, 0)
+        caches.append({
+            'name': name,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else 0,
+            'bytes_read': stats[BYTES_READ_KEY].get(name, 0),
+            'bytes_written': stats[BYTES_WRITTEN_KEY].get(name, 0),
+        })
+    caches.sort(key=lambda row: row['hits'] + row['misses'], reverse=True)
+    return {'caches': caches, 'invalidations': stats[INVALIDATIONS_KEY]}
+
+def reset():
+    with _pending_lock:
+        for counter in _pending.values():
+            counter.clear()
+    get_redis_connection('default').delete(*STATS_KEYS)
+
+class CachedQueryMixin:
+    """
+    Shared by the view mixins below. ``cache_depends_on`` lists the models
+    whose writes make a cached page stale, e.g. (Communication, Client,
+    Contact) for a list that shows the client and contact names; it
+    defaults to the view's model.
+    """
+    cache_depends_on = ()
+
+    def cache_tenant_id(self):
+        return getattr(self.request.tenant, 'pk', None)
+
+    def cache_models(self):
+        return self.cache_depends_on or (self.model,)
+
+class CachedKeysetPaginationMixin(CachedQueryMixin, KeysetPaginationMixin):
+    """
+    KeysetPaginationMixin that caches each page's rows and cursors per
+    tenant, so a repeated page view runs no row query.
+    """
+
+    def paginate_queryset(self, queryset, page_size):
+        cursor = self.request.GET.get(self.cursor_kwarg)
+
+        def load():
+            _paginator, page, rows, _is_paginated = super(CachedKeysetPaginationMixin, self).paginate_queryset(
+                queryset, page_size
+            )
+            return list(rows), page.next_cursor, page.previous_cursor
+
+        rows, next_cursor, previous_cursor = get_or_load(
+            self.cache_tenant_id(), f'{_label(self.model)}:list',
+            {'cursor': cursor, 'per_page': page_size}, load, self.cache_models(),
+        )
+        paginator = KeysetPaginator(queryset, page_size, ordering=self.keyset_ordering)
+        page = KeysetPage(rows, paginator, next_cursor, previous_cursor)
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+class CachedObjectMixin(CachedQueryMixin):
+    """
+    SingleObjectMixin that caches the object looked up from the URL per
+    tenant. A 404 is not cached.
+    """
+
+    def get_object(self, queryset=None):
+        if queryset is not None:
+            return super().get_object(queryset)
+        params = {
+            'pk': self.kwargs.get(self.pk_url_kwarg),
+            'slug': self.kwargs.get(self.slug_url_kwarg),
+        }
+        return get_or_load(
+            self.cache_tenant_id(), f'{_label(self.model)}:detail', params,
+            lambda: super(CachedObjectMixin, self).get_object(), self.cache_models(),
+        )
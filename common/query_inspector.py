@@ -0,0 +1,225 @@
+from collections import Counter
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from django_redis import get_redis_connection
+from functools import wraps
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# Redis hashes aggregating what QueryInspectorMiddleware saw, by view name
+# (and "view\0fingerprint" for the per-fingerprint hashes)
+REQUESTS_KEY = 'queries:requests'
+QUERIES_KEY = 'queries:count'
+SECONDS_KEY = 'queries:seconds'
+MAX_KEY = 'queries:max'
+FINGERPRINTS_KEY = 'queries:fingerprints'
+REPEATED_KEY = 'queries:repeated'
+STATS_KEYS = (REQUESTS_KEY, QUERIES_KEY, SECONDS_KEY, MAX_KEY, FINGERPRINTS_KEY, REPEATED_KEY)
+SEPARATOR = '\0'
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+def n_plus_one_threshold():
+    return getattr(settings, 'QUERY_N_PLUS_ONE_THRESHOLD', 5)
+
+def fingerprint(sql):
+    """
+    Normalize SQL so queries that differ only in their parameters compare
+    equal: literals become ? and IN lists of any length become (...).
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql.replace('%s', '?'))
+    return _WHITESPACE.sub(' ', sql).strip()
+
+class QueryInspector:
+    """
+    Context manager recording every query run on any database connection
+    of this thread while it is active, with its fingerprint and duration.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((fingerprint(sql), time.perf_counter() - start))
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def seconds(self):
+        return sum(duration for _fingerprint, duration in self.queries)
+
+    def by_fingerprint(self):
+        return Counter(fingerprint for fingerprint, _duration in self.queries)
+
+    def repeated(self, threshold=None):
+        """
+        [(fingerprint, count)] for queries run at least ``threshold`` times,
+        most repeated first: the signature of an N+1.
+        """
+        threshold = threshold or n_plus_one_threshold()
+        return [(sql, count) for sql, count in self.by_fingerprint().most_common() if count >= threshold]
+
+    def summary(self, limit=10):
+        lines = [f'{self.count} queries in {self.seconds * 1000:.1f}ms']
+        for sql, count in self.by_fingerprint().most_common(limit):
+            lines.append(f'{count:5d}x {sql[:300]}')
+        return '\n'.join(lines)
+
+class query_budget:
+    """
+    Fail (or warn) when the wrapped code runs more than ``max_queries``
+    queries, or repeats one query fingerprint N+1 style unless
+    ``allow_repeated``. Works as a context manager in tests and as a
+    decorator, e.g. method_decorator(query_budget(10), name='dispatch').
+
+    ``enforce`` defaults to QUERY_BUDGET_ENFORCE (DEBUG when unset); when
+    off, a blown budget is logged instead of raised.
+    """
+
+    def __init__(self, max_queries, allow_repeated=False, enforce=None):
+        self.max_queries = max_queries
+        self.allow_repeated = allow_repeated
+        self.enforce = enforce
+        self.inspector = None
+
+    def __call__(self, func):
+        @wraps(func)
+        def inner(*args, **kwargs):
+            # A fresh instance per call, so concurrent requests share no state
+            with type(self)(self.max_queries, self.allow_repeated, self.enforce):
+                response = func(*args, **kwargs)
+                # Template responses render after the view returns; render
+                # here so the queries of the template count too, through the
+                # profiling timer when the request is profiled
+                if not getattr(response, 'is_rendered', True):
+                    timer = getattr(args[0] if args else None, '_profiling_timer', None)
+                    if timer is not None:
+                        timer.render(response)
+                    else:
+                        response.render()
+                return response
+        return inner
+
+    def __enter__(self):
+        self.inspector = QueryInspector().__enter__()
+        return self.inspector
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.inspector.__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return False
+        problems = []
+        if self.inspector.count > self.max_queries:
+            problems.append(f'{self.inspector.count} queries, budget is {self.max_queries}')
+        repeated = [] if self.allow_repeated else self.inspector.repeated()
+        if repeated:
+            problems.append(f'{len(repeated)} repeated quer{"y" if len(repeated) == 1 else "ies"} (possible N+1)')
+        if not problems:
+            return False
+        message = f'Query budget exceeded: {"; ".join(problems)}\n{self.inspector.summary()}'
+        enforce = self.enforce
+        if enforce is None:
+            enforce = getattr(settings, 'QUERY_BUDGET_ENFORCE', settings.DEBUG)
+        if enforce:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+        return False
+
+def assert_max_queries(max_queries, allow_repeated=False):
+    """
+    Test helper: query_budget that always raises.
+    """
+    return query_budget(max_queries, allow_repeated=allow_repeated, enforce=True)
+
+def record(view_name, inspector):
+    """
+    Add one request's queries to the per-view totals in Redis.
+    """
+    try:
+        with get_redis_connection('default').pipeline() as pipe:
+            pipe.hincrby(REQUESTS_KEY, view_name, 1)
+            pipe.hincrby(QUERIES_KEY, view_name, inspector.count)
+            pipe.hincrbyfloat(SECONDS_KEY, view_name, inspector.seconds)
+            pipe.zadd(MAX_KEY, {view_name: inspector.count}, gt=True)
+            for sql, count in inspector.by_fingerprint().items():
+                pipe.hincrby(FINGERPRINTS_KEY, f'{view_name}{SEPARATOR}{sql}', count)
+            for sql, _count in inspector.repeated():
+                pipe.hincrby(REPEATED_KEY, f'{view_name}{SEPARATOR}{sql}', 1)
+            pipe.execute()
+    except Exception:
+        logger.exception('Could not record query stats for %s', view_name)
+
+def _split(key):
+    view_name, _separator, sql = key.decode().partition(SEPARATOR)
+    return view_name, sql
+
+def report(limit=20):
+    """
+    The recorded stats: views by average queries per request, and the
+    fingerprints most often repeated within one request.
+    """
+    conn = get_redis_connection('default')
+    requests = {name.decode(): int(value) for name, value in conn.hgetall(REQUESTS_KEY).items()}
+    queries = {name.decode(): int(value) for name, value in conn.hgetall(QUERIES_KEY).items()}
+    seconds = {name.decode(): float(value) for name, value in conn.hgetall(SECONDS_KEY).items()}
+    maximum = {name.decode(): int(value) for name, value in conn.zrange(MAX_KEY, 0, -1, withscores=True)}
+    fingerprints = {_split(key): int(value) for key, value in conn.hgetall(FINGERPRINTS_KEY).items()}
+    views = sorted(
+        (
+            {
+                'view': name,
+                'requests': count,
+                'avg_queries': round(queries.get(name, 0) / count, 1),
+                'max_queries': maximum.get(name, 0),
+                'avg_ms': round(seconds.get(name, 0) * 1000 / count, 1),
+            }
+            for name, count in requests.items() if count
+        ),
+        key=lambda row: row['avg_queries'], reverse=True,
+    )
+    repeated = sorted(
+        (
+            {
+                'view': name,
+                'sql': sql,
+                'requests': count,
+                'avg_per_request': round(fingerprints.get((name, sql), 0) / requests[name], 1) if requests.get(name) else None,
+            }
+            for (name, sql), count in (
+                (_split(key), int(value)) for key, value in conn.hgetall(REPEATED_KEY).items()
+            )
+        ),
+        key=lambda row: (row['requests'], row['avg_per_request'] or 0), reverse=True,
+    )
+    return {'views': views[:limit], 'repeated': repeated[:limit]}
+
+def reset():
+    get_redis_connection('default').delete(*STATS_KEYS)
@@ -52,6 +52,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'common.middleware.tenant_middleware.TenantMiddleware',
+    'common.middleware.profiling_middleware.ProfilingMiddleware',
+    'common.middleware.query_inspector_middleware.QueryInspectorMiddleware',
 ]
 
 ROOT_URLCONF = 'crm_project.urls'
@@ -104,6 +106,11 @@ AUTH_PASSWORD_VALIDATORS = [
 
 # Custom User Model
 AUTH_USER_MODEL = 'accounts.User'
+AUTHENTICATION_BACKENDS = [
+    'django.contrib.auth.backends.ModelBackend',
+    # user.has_perm() for role flags such as 'can_manage_clients'
+    'apps.accounts.permissions.RolePermissionBackend',
+]
 
 # Internationalization
 LANGUAGE_CODE = 'en-us'
@@ -151,6 +158,44 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULE = {
+    # Safety net for the size/time triggers fired when webhooks are queued
+    'drain-lead-webhooks': {
+        'task': 'apps.crm.tasks.drain_lead_webhooks',
+        'schedule': 60.0,
+    },
+    'flush-stripe-outbox': {
+        'task': 'apps.core.tasks.flush_stripe_outbox',
+        'schedule': 5 * 60.0,
+    },
+    # Picks up login audit events left behind when LOGIN_AUDIT_BACKEND is redis
+    'flush-login-audit': {
+        'task': 'apps.accounts.tasks.flush_login_audit',
+        'schedule': 60.0,
+    },
+    'expire-user-roles': {
+        'task': 'apps.accounts.tasks.expire_user_roles',
+        'schedule': 5 * 60.0,
+    },
+    'prune-login-attempts': {
+        'task': 'apps.accounts.tasks.prune_login_attempts',
+        'schedule': 24 * 60 * 60.0,
+    },
+    'resume-stalled-imports': {
+        'task': 'apps.crm.tasks.resume_stalled_imports',
+        'schedule': 5 * 60.0,
+    },
+    # Full recompute so recency decays for leads nobody has touched
+    'score-leads': {
+        'task': 'apps.crm.tasks.score_all_leads',
+        'schedule': 24 * 60 * 60.0,
+    },
+    'reconcile-daily-metrics': {
+        'task': 'apps.dashboard.tasks.reconcile_daily_metrics',
+        'schedule': 24 * 60 * 60.0,
+    },
+}
 
 # AWS S3 Configuration (Optional - for production file storage)
 AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID', '')
@@ -182,13 +227,16 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'common.pagination.KeysetCursorPagination',
     'PAGE_SIZE': 10,
 }
 
 # Tenant Settings
 TENANT_MODEL = 'core.Tenant'
 TENANT_DOMAIN_MODEL = 'core.Domain'
+TENANT_CACHE_TIMEOUT = 60 * 60  # seconds a host lookup stays in Redis
+TENANT_LOCAL_CACHE_TTL = 30  # seconds a host lookup stays in the per-process LRU
+TENANT_LOCAL_CACHE_SIZE = 1024
 
 # File Upload Settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
@@ -236,6 +284,12 @@ LOGGING = {
             'level': os.getenv('DJANGO_LOG_LEVEL', 'INFO'),
             'propagate': True,
         },
+        # Profiled request timings and N+1 warnings
+        'common.middleware': {
+            'handlers': ['console', 'file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
@@ -243,4 +297,41 @@ LOGGING = {
 MAX_UPLOAD_SIZE = 5242880  # 5MB in bytes
 TENANT_LIMIT_STORAGE = 5368709120  # 5GB in bytes
 DEFAULT_CURRENCY = 'USD'
+LEAD_INGEST_BATCH_SIZE = 1000  # leads per INSERT ... ON CONFLICT statement
+LEAD_WEBHOOK_ASYNC = os.getenv('LEAD_WEBHOOK_ASYNC', 'True') == 'True'
+LEAD_WEBHOOK_BATCH_SIZE = 500  # queued payloads drained per micro-batch
+LEAD_WEBHOOK_MAX_WAIT = 5  # seconds before a partial batch is drained
+LEAD_WEBHOOK_DEAD_LETTER_MAX = 10000
+SEARCH_PREFIX_EXPANSIONS = 50  # indexed terms the last, partly typed query word may match
+AUTOCOMPLETE_LIMIT = 10  # suggestions returned by the client/contact typeahead
+AUTOCOMPLETE_BUILD_TIMEOUT = 600  # seconds a typeahead index build may hold its lock
+SEARCH_CANDIDATE_LIMIT = 5000  # documents of the rarest query term ranked directly
+EXPORT_CHUNK_SIZE = 2000  # rows fetched per round trip while streaming an export
+IMPORT_CHUNK_SIZE = 2000  # CSV rows validated and upserted per transaction
+IMPORT_MAX_ERRORS = 1000  # invalid rows kept on an import job for display
+IMPORT_TASK_TIME_LIMIT = 120  # seconds an import task runs before requeueing itself
+IMPORT_STALL_TIMEOUT = 600  # seconds without progress before an import is resumed
+DEDUPE_THRESHOLD = 0.7  # similarity from 0 to 1 at which two leads/contacts become a duplicate candidate
+DEDUPE_MAX_BLOCK_SIZE = 200  # records sharing one key beyond which the key is too common to compare
+LEAD_SCORE_CHUNK_SIZE = 2000  # leads whose score is written per UPDATE
+DASHBOARD_DAYS = 30  # days of daily metrics shown on the dashboard
+QUERY_INSPECTOR_ENABLED = os.getenv('QUERY_INSPECTOR_ENABLED', str(DEBUG)) == 'True'
+QUERY_BUDGET_ENFORCE = DEBUG  # raise instead of log when a view blows its query budget
+QUERY_N_PLUS_ONE_THRESHOLD = 5  # runs of one query fingerprint in a request flagged as N+1
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False') == 'True'
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0.01'))  # share of requests profiled
+PROFILING_HEADER = 'X-Profile'  # carries a signed token (manage.py profile_report --token) forcing a profile
+PROFILING_INTERVAL = 0.005  # seconds between stack samples
+PROFILING_DIR = BASE_DIR / 'logs' / 'profiles'
+LOGIN_AUDIT_BACKEND = os.getenv('LOGIN_AUDIT_BACKEND', 'redis')  # sync, memory or redis
+LOGIN_AUDIT_FLUSH_SIZE = 200  # buffered login attempts written per bulk INSERT
+LOGIN_AUDIT_FLUSH_INTERVAL = 5  # seconds before a partial buffer is written
+LOGIN_AUDIT_DEAD_LETTER_SIZE = 1000  # rejected login audit events kept for inspection
+LOGIN_ATTEMPT_RETENTION_DAYS = 90  # older attempts survive only as daily rollups
+LOGIN_ATTEMPT_DELETE_CHUNK = 5000
+PERMISSION_CACHE_TIMEOUT = 60 * 60  # seconds a compiled role permission set stays cached
+LOGIN_HISTORY_DAYS = 30  # window shown on the profile and login history pages
+QUERY_CACHE_ENABLED = os.getenv('QUERY_CACHE_ENABLED', 'True') == 'True'  # cache CRM list pages and detail objects
+QUERY_CACHE_TIMEOUT = 5 * 60  # seconds a cached page or object lives if nothing invalidates it
+QUERY_CACHE_STATS_INTERVAL = 10  # seconds between flushes of a process's hit/miss counters to Redis
 LANGUAGES_SUPPORTED = ['en', 'es', 'fr', 'de']